@@ -0,0 +1,668 @@
+"""
+Bake of the sine setups onto their slaves
+
+The motion is not read back from the scene frame by frame, every setup listed in
+Sine_Main_Bake_Sets is rebuilt from its master controller and evaluated offline by
+sine_tool.engine in a single vectorized pass over the frame range. The scene is never
+stepped, the keys of each channel are written in one whole-curve addKeys() call.
+
+    FRAME_BAKE : one key per frame
+    ANALYTIC_BAKE : sparse keys at the analytically known extrema and zero crossings
+        of each sine with exact tangents, only refined where the fitted curve leaves
+        the tolerance
+    CYCLE_BAKE : when the motion is exactly periodic, an ANALYTIC_BAKE of a single
+        period from the start frame, repeated by cyclic pre / post infinity
+
+The rotations of the expression joints can also be written to a memory-mapped
+cache file (see sine_tool.engine.cache) and played back by a sineCacheReader node.
+
+Any bake can be followed by a key reduction pass with an error budget per channel,
+see reduce_baked() for curves already in the scene.
+
+Long ranges are evaluated and written in chunks of frames, the peak memory is
+bounded by the chunk size and not by the length of the shot. The chunks of every
+setup are computed by a pool of mayapy processes (see sine_tool.engine.parallel)
+while the keys are written in the session, in a fixed order.
+
+Each bake records a hash of everything its keys depend on (parameters, chains,
+slaves, frame range and bake options) on the master controller, with the slaves
+it drove. A later bake skips the setups whose hash did not change, a setup whose
+constraints were already released is baked again from the recorded slaves.
+
+The curves are written through the API by the sineApiEdit command (see
+sine_tool.scene.undo), which records them in an MDGModifier and an MAnimCurveChange:
+a bake or a reduction is a single undo chunk, the released constraints, the new
+curves and the recorded state are restored together.
+
+The setups whose noise terms can be non-zero need a noise table calibrated against
+Maya noise(), see sine_tool.engine.noise.require_calibration().
+
+The FK / IK controllers of a setup are assumed not to be animated, the master and
+multiplier attributes can be.
+
+A bake or a cache can be retimed by an animCurveTT (time_curve) mapping the scene
+frames to the frames the motion is evaluated at, it is sampled once per frame.
+"""
+import json
+import os
+
+import maya.api.OpenMaya as om
+import maya.api.OpenMayaAnim as oma
+import numpy as np
+from maya import cmds
+
+from .engine.cache import create_cache, flatten_rotations, read_header, state_hash
+from .engine.channels import rest_matrices
+from .engine.evaluator import CHUNK_SIZE, evaluate, evaluate_chunks, remap_frames
+from .engine.fitting import reduce_keys
+from .engine.noise import gradients, require_calibration
+from .engine.parallel import run_jobs
+from .engine.params import AXES, noise_params, param_names
+from .engine.plan import CACHE_READER_NAME, SOLVER_PLUGIN, FRAME_BAKE, ANALYTIC_BAKE, CYCLE_BAKE
+from .engine.period import common_period
+from .engine.runtime import runtime_data, write_runtime
+from .scene.undo import run_edit
+from .utils.helper import getFrameRate, one_undo
+
+BAKE_SETS = "Sine_Main_Bake_Sets"
+# max absolute error of the baked channels, in degrees / scene units
+DEFAULT_TOLERANCE = 0.05
+BAKED_ATTRS = ("translateX", "translateY", "translateZ", "rotateX", "rotateY", "rotateZ")
+CACHE_EXT = ".sinecache"
+# string attribute of the master controller holding the state of the last bake
+BAKE_STATE_ATTR = "sine_bake_state"
+
+
+def _short_name(node):
+    return node.split("|")[-1]
+
+
+def _sorted_names(nodes):
+    """sort by the zero padded / alphabet indices of the generated names"""
+    return sorted(nodes, key=lambda i: (len(_short_name(i)), _short_name(i)))
+
+
+def _is_animated(plug):
+    return bool(cmds.listConnections(plug, s=True, d=False))
+
+
+def _read(plug, animated, frames):
+    if plug in animated:
+        return np.array([cmds.getAttr(plug, time=frame) for frame in frames], dtype=np.float64)
+    return cmds.getAttr(plug)
+
+
+def _curve_state(plug):
+    """
+    keys, tangents and infinities of the animCurve driving a plug, None when it is driven by anything else
+    """
+    sources = cmds.listConnections(plug, s=True, d=False) or []
+    if len(sources) != 1 or not cmds.objectType(sources[0], isAType="animCurve") or \
+            cmds.listConnections(sources[0] + ".input", s=True, d=False):
+        return None
+    curve = sources[0]
+    state = dict(type=cmds.nodeType(curve),
+                 keys=cmds.keyframe(curve, q=True, timeChange=True, valueChange=True),
+                 weighted=cmds.keyTangent(curve, q=True, weightedTangents=True),
+                 infinity=[cmds.getAttr(curve + ".preInfinity"), cmds.getAttr(curve + ".postInfinity")])
+    for flag in ("inTangentType", "outTangentType", "inAngle", "outAngle", "inWeight", "outWeight"):
+        state[flag] = cmds.keyTangent(curve, q=True, **{flag: True})
+    return state
+
+
+def _budget(reduction, attr):
+    """error budget of a channel, reduction is a tolerance or a dict attr -> tolerance"""
+    if isinstance(reduction, dict):
+        return reduction.get(attr)
+    return reduction
+
+
+def _chunk_ranges(start, end, chunk_size):
+    """(first, last) frames of consecutive chunks, sharing their boundary frame"""
+    bounds = [float(i) for i in np.arange(start, end, chunk_size)] + [float(end)]
+    return list(zip(bounds[:-1], bounds[1:])) or [(float(start), float(end))]
+
+
+def _time_samples(time_curve, start, end):
+    """(scene frames, source frames) samples of an animCurveTT over [start, end], None without curve"""
+    if not time_curve:
+        return None
+    frames = np.arange(np.floor(start) - 1, np.ceil(end) + 2, dtype=np.float64)
+    return frames, np.array([cmds.getAttr(time_curve + ".output", time=i) for i in frames], dtype=np.float64)
+
+
+def _mayapy():
+    """the mayapy interpreter of the running Maya, None outside of Maya"""
+    name = "mayapy.exe" if os.name == "nt" else "mayapy"
+    path = os.path.join(os.environ.get("MAYA_LOCATION", ""), "bin", name)
+    return path if os.path.isfile(path) else None
+
+
+def list_setups():
+    """
+    get the setups of Sine_Main_Bake_Sets as their element name "Sine_<name>"
+    """
+    if not cmds.objExists(BAKE_SETS):
+        return []
+    setups = []
+    for sets in cmds.sets(BAKE_SETS, q=True) or []:
+        element = sets[:-len("_Bake_Sets")]
+        if sets.endswith("_Bake_Sets") and cmds.objExists(element + "_MCtl"):
+            setups.append(element)
+    return setups
+
+
+class BakeSetup(object):
+    """
+    Scene data of a sine setup needed to evaluate its slaves offline
+    """
+
+    def __init__(self, element):
+        self.element = element
+        self.master = element + "_MCtl"
+        self.chains = []
+        self.slaves = []
+
+        recorded = dict(((i["chain"], i["joint"]), i) for i in self.recorded_state().get("slaves", [])
+                        if cmds.objExists(i["node"]))
+        for chain_index, chain_sets in enumerate(_sorted_names(cmds.sets(element + "_EXP_Sets", q=True) or [])):
+            fk_chain_name = chain_sets[:-len("_Exp_Sets")]
+            joints = _sorted_names(cmds.sets(chain_sets, q=True) or [])
+            self.chains.append(dict(joints=joints, ik_ctl=fk_chain_name[:-len("_FK")] + "_SIK_0_Ctl"))
+            for joint_index, exp in enumerate(joints):
+                slave = self._capture_slave(exp) or recorded.get((chain_index, joint_index))
+                if slave:
+                    slave.update(chain=chain_index, joint=joint_index)
+                    self.slaves.append(slave)
+
+        self.animated = set(i for i in self.plugs() if _is_animated(i))
+
+    @staticmethod
+    def _capture_slave(exp):
+        """
+        find the slave driven by an expression joint and the constant parts of its local matrix
+        """
+        fk = exp.replace("_exp_jnt", "_jnt")
+        if not cmds.objExists(fk):
+            return None
+        for constraint in set(cmds.listConnections(fk, s=False, d=True, type="parentConstraint") or []):
+            if not constraint.endswith("_tempCns"):
+                continue
+            slave = cmds.listRelatives(constraint, parent=True, fullPath=True)[0]
+            left, right = rest_matrices(cmds.getAttr(slave + ".matrix"),
+                                        cmds.getAttr(exp + ".rotate")[0],
+                                        cmds.getAttr(fk + ".worldMatrix[0]"),
+                                        cmds.getAttr(exp + ".worldMatrix[0]"))
+            is_joint = cmds.nodeType(slave) == "joint"
+            return dict(node=slave,
+                        constraint=constraint,
+                        left=left,
+                        right=right,
+                        rotate_order=cmds.getAttr(slave + ".rotateOrder"),
+                        rotate_axis=cmds.getAttr(slave + ".rotateAxis")[0],
+                        joint_orient=cmds.getAttr(slave + ".jointOrient")[0] if is_joint else (0, 0, 0))
+        return None
+
+    def plugs(self):
+        """
+        every plug the motion depends on
+        """
+        plugs = ["{}.{}".format(self.master, i) for i in param_names()]
+        for chain in self.chains:
+            plugs.append(chain["ik_ctl"] + ".sine_multiplier_All")
+            plugs.extend("{}.FK_multiplier_{}".format(chain["ik_ctl"], i) for i in range(len(chain["joints"])))
+        return plugs
+
+    def uses_noise(self):
+        """
+        True if the noise terms can be non-zero, an attribute scaling them is animated or not zero
+        """
+        plugs = ["{}.{}".format(self.master, i) for i in noise_params()]
+        return any(i in self.animated or cmds.getAttr(i) for i in plugs)
+
+    def params(self, frames=()):
+        return dict((i, _read("{}.{}".format(self.master, i), self.animated, frames)) for i in param_names())
+
+    def joint_counts(self):
+        return [len(i["joints"]) for i in self.chains]
+
+    def joints(self):
+        """
+        expression joints of every chain, chain after chain
+        """
+        return [joint for chain in self.chains for joint in chain["joints"]]
+
+    def multipliers(self, frames):
+        """
+        sine_multiplier_All * FK_multiplier_i of every joint, shape (chains, joints, frames)
+        """
+        frames = np.asarray(frames, dtype=np.float64)
+        joint_counts = self.joint_counts()
+        multipliers = np.zeros((len(joint_counts), max(joint_counts), frames.size), dtype=np.float64)
+        for chain_index, chain in enumerate(self.chains):
+            ik_ctl = chain["ik_ctl"]
+            sine_mult = _read(ik_ctl + ".sine_multiplier_All", self.animated, frames)
+            for joint_index in range(len(chain["joints"])):
+                fk_mult = _read("{}.FK_multiplier_{}".format(ik_ctl, joint_index), self.animated, frames)
+                multipliers[chain_index, joint_index] = sine_mult * fk_mult
+        return multipliers
+
+    def rotations(self, frames, frame_rate):
+        """
+        expression joint rotations in degrees, shape (chains, joints, 3, frames)
+        """
+        frames = np.asarray(frames, dtype=np.float64)
+        rotations = evaluate(self.params(frames), frames, self.joint_counts(), frame_rate=frame_rate)
+        return rotations * self.multipliers(frames)[:, :, np.newaxis]
+
+    def state_hash(self, frames, frame_rate):
+        """
+        hash of every value the rotations over frames depend on
+        """
+        return state_hash(self.params(frames), self.multipliers(frames), self.joint_counts(), frame_rate)
+
+    def channels(self):
+        """
+        (node, attr) of every baked channel
+        """
+        return [(slave["node"], attr) for slave in self.slaves for attr in BAKED_ATTRS]
+
+    def data(self, start, end, frame_rate, time_samples=None):
+        """
+        picklable description of the setup over [start, end], see sine_tool.engine.parallel
+        """
+        samples = np.arange(np.floor(start) - 1, np.ceil(end) + 2, dtype=np.float64)
+        params = {}
+        for name in param_names():
+            plug = "{}.{}".format(self.master, name)
+            params[name] = (samples, _read(plug, self.animated, samples)) if plug in self.animated \
+                else cmds.getAttr(plug)
+        multipliers = self.multipliers(samples)
+        if any(not i.startswith(self.master + ".") for i in self.animated):
+            multipliers = (samples, multipliers)
+        else:
+            multipliers = multipliers[:, :, 0]
+        slaves = [dict((k, v) for k, v in i.items() if k not in ("node", "constraint")) for i in self.slaves]
+        return dict(params=params,
+                    multipliers=multipliers,
+                    joint_counts=self.joint_counts(),
+                    frame_rate=frame_rate,
+                    animated=bool(self.animated),
+                    slaves=slaves,
+                    channel_count=len(BAKED_ATTRS),
+                    time_curve=time_samples,
+                    gradients=[float(i) for i in gradients()])
+
+    def bake_hash(self, start, end, frame_rate, options):
+        """
+        hash of every value the baked keys over [start, end] depend on, options are the bake arguments,
+        the animated plugs are hashed by the keys of their animCurve and only sampled when driven otherwise
+        """
+        frames = np.arange(np.floor(start), np.ceil(end) + 1, dtype=np.float64)
+        values = []
+        for plug in self.plugs():
+            state = _curve_state(plug) if plug in self.animated else cmds.getAttr(plug)
+            values.append(_read(plug, self.animated, frames) if state is None else state)
+        slaves = [dict((k, v) for k, v in i.items() if k != "constraint") for i in self.slaves]
+        return state_hash(values, self.joint_counts(), frame_rate, self.joints(), slaves, start, end, options)
+
+    def recorded_state(self):
+        """
+        state of the last bake, hash and slaves, empty if the setup was never baked
+        """
+        plug = "{}.{}".format(self.master, BAKE_STATE_ATTR)
+        if not cmds.objExists(plug):
+            return {}
+        return json.loads(cmds.getAttr(plug) or "{}")
+
+    def record(self, bake_hash):
+        """
+        store the hash of a bake and the slaves it drove on the master controller
+        """
+        if not cmds.attributeQuery(BAKE_STATE_ATTR, node=self.master, exists=True):
+            cmds.addAttr(self.master, ln=BAKE_STATE_ATTR, dt="string")
+        slaves = [dict((k, np.asarray(v).tolist() if k in ("left", "right") else v)
+                       for k, v in i.items() if k != "constraint") for i in self.slaves]
+        cmds.setAttr("{}.{}".format(self.master, BAKE_STATE_ATTR),
+                     json.dumps(dict(hash=bake_hash, slaves=slaves)), type="string")
+
+    def is_baked(self):
+        """
+        True if every slave still has keys
+        """
+        return all(cmds.keyframe(i["node"], at=BAKED_ATTRS, q=True, keyframeCount=True) for i in self.slaves)
+
+    def period(self, frame_rate):
+        """
+        period of the motion in frames (Fraction), None when it is not periodic
+        """
+        if self.animated:
+            return None
+        return common_period(self.params(), frame_rate)
+
+    def release(self):
+        """
+        delete the constraints driving the slaves so their keys can play back
+        """
+        constraints = [i["constraint"] for i in self.slaves if i.get("constraint") and cmds.objExists(i["constraint"])]
+        if constraints:
+            cmds.delete(constraints)
+
+
+def _tangent_scale(curve, frame_rate):
+    """
+    factor from a slope in value per frame to the tangent of a key angle, tangent angles
+    are measured in stored value per second and angular curves store radians
+    """
+    angular = curve.animCurveType == oma.MFnAnimCurve.kAnimCurveTA
+    return frame_rate * (np.pi / 180.0 if angular else 1.0)
+
+
+def _read_keys(node, attr, frame_rate=24.0):
+    """
+    frames, values, in slopes and out slopes per frame of the curve of a channel, read through
+    the API like _write_keys() writes them, None if the channel has no animCurve
+    """
+    plug = om.MSelectionList().add("{}.{}".format(node, attr)).getPlug(0)
+    if not oma.MAnimUtil.isAnimated(plug):
+        return None
+    curve = oma.MFnAnimCurve(oma.MAnimUtil.findAnimation(plug)[0])
+    unit = om.MTime.uiUnit()
+    indices = range(curve.numKeys)
+    frames = np.array([curve.input(i).asUnits(unit) for i in indices], dtype=np.float64)
+    values = np.array([curve.value(i) for i in indices], dtype=np.float64)
+    if curve.animCurveType == oma.MFnAnimCurve.kAnimCurveTA:
+        values = np.degrees(values)
+    scale = _tangent_scale(curve, frame_rate)
+    in_slopes = np.tan([curve.getTangentAngleWeight(i, True)[0].asRadians() for i in indices]) / scale
+    out_slopes = np.tan([curve.getTangentAngleWeight(i, False)[0].asRadians() for i in indices]) / scale
+    return frames, values, in_slopes, out_slopes
+
+
+def _write_keys(node, attr, frames, values, in_slopes=None, out_slopes=None, frame_rate=24.0, cycle=False,
+                append=False, modifier=None, change=None):
+    """
+    replace the keys of a channel by a single addKeys() call, or add them to its curve if append,
+    with broken fixed tangents set through the API when the slopes per frame are given,
+    the curves are replaced by the modifier and the keys recorded in the change, see run_edit()
+    """
+    plug_name = "{}.{}".format(node, attr)
+    if cmds.getAttr(plug_name, lock=True):
+        return False
+    modifier = modifier or om.MDGModifier()
+    plug = om.MSelectionList().add(plug_name).getPlug(0)
+    animated = oma.MAnimUtil.isAnimated(plug)
+    curve = oma.MFnAnimCurve()
+    if append and animated:
+        curve.setObject(oma.MAnimUtil.findAnimation(plug)[0])
+    else:
+        for previous in oma.MAnimUtil.findAnimation(plug) if animated else []:
+            modifier.deleteNode(previous)
+        modifier.doIt()
+        curve.create(plug, modifier=modifier)
+        modifier.doIt()
+    values = np.asarray(values, dtype=np.float64)
+    angular = curve.animCurveType == oma.MFnAnimCurve.kAnimCurveTA
+    if angular:
+        # angular curves store radians
+        values = np.radians(values)
+    unit = om.MTime.uiUnit()
+    times = om.MTimeArray([om.MTime(float(i), unit) for i in frames])
+    tangent = oma.MFnAnimCurve.kTangentAuto if in_slopes is None else oma.MFnAnimCurve.kTangentFixed
+    curve.addKeys(times, om.MDoubleArray(values.tolist()), tangent, tangent, append, change)
+    if cycle:
+        curve.setPreInfinityType(oma.MFnAnimCurve.kCycle, change)
+        curve.setPostInfinityType(oma.MFnAnimCurve.kCycle, change)
+    if in_slopes is None:
+        return True
+
+    scale = _tangent_scale(curve, frame_rate)
+    in_angles = np.arctan(np.asarray(in_slopes, dtype=np.float64) * scale).tolist()
+    out_angles = np.arctan(np.asarray(out_slopes, dtype=np.float64) * scale).tolist()
+    # the new keys are the last ones of the curve
+    first = curve.numKeys - len(in_angles)
+    for index, in_angle, out_angle in zip(range(first, curve.numKeys), in_angles, out_angles):
+        curve.setTangentsLocked(index, False, change)
+        curve.setAngle(index, om.MAngle(in_angle), True, change)
+        curve.setAngle(index, om.MAngle(out_angle), False, change)
+    return True
+
+
+@one_undo
+def bake(setups=None, start=None, end=None, mode=FRAME_BAKE, tolerance=DEFAULT_TOLERANCE, reduction=None,
+         chunk_size=CHUNK_SIZE, processes=None, force=False, cache_dir=None, time_curve=None):
+    """Bake sine setups onto their slaves.
+
+    Arguments:
+        setups (list of str): setup element names "Sine_<name>", defaults to every setup of Sine_Main_Bake_Sets.
+        start (float): first frame, defaults to the playback start.
+        end (float): last frame, defaults to the playback end.
+        mode (str): one of BAKE_MODES.
+        tolerance (float): max error of the ANALYTIC_BAKE channels against the sine motion.
+        reduction (float or dict): error budget of the key reduction pass run on the baked keys,
+            a tolerance or a dict attr -> tolerance, no reduction if None.
+        chunk_size (int): frames evaluated and written at once.
+        processes (int): worker processes, defaults to the cpu count, 1 bakes in the session only.
+        force (bool): bake the setups even if they did not change since their last bake.
+        cache_dir (str): DiskCache folder shared between scenes, see sine_tool.engine.cache.DISK_CACHE_DIR,
+            no cache if None.
+        time_curve (str): animCurveTT retiming the motion, scene frame -> evaluated frame.
+
+    Returns:
+        list of str: the baked slaves, the slaves of unchanged setups are not part of it
+    """
+    setups = list_setups() if setups is None else setups
+    start = cmds.playbackOptions(q=True, min=True) if start is None else start
+    end = cmds.playbackOptions(q=True, max=True) if end is None else end
+    frame_rate = float(getFrameRate())
+    time_samples = _time_samples(time_curve, start, end)
+    if time_samples is not None and mode == CYCLE_BAKE:
+        cmds.warning("a retimed motion is not periodic, baked without cycle")
+        mode = ANALYTIC_BAKE
+    options = dict(mode=mode, tolerance=tolerance, reduction=reduction, chunk_size=chunk_size,
+                   time_curve=time_samples)
+
+    plans = []
+    for element in setups:
+        setup = BakeSetup(element)
+        if not setup.slaves:
+            continue
+        if setup.uses_noise():
+            require_calibration("the bake of " + element)
+        bake_hash = setup.bake_hash(start, end, frame_rate, options)
+        if not force and setup.recorded_state().get("hash") == bake_hash and setup.is_baked():
+            continue
+        last, cycle = end, False
+        if mode == CYCLE_BAKE:
+            period = setup.period(frame_rate)
+            if period and period < end - start:
+                last, cycle = start + float(period), True
+            elif period is None:
+                cmds.warning("{} is not periodic, baked without cycle".format(element))
+        plans.append((setup, _chunk_ranges(start, last, chunk_size), cycle, bake_hash))
+
+    def jobs():
+        for _setup, ranges, _, _ in plans:
+            budgets = [_budget(reduction, attr) for _, attr in _setup.channels()]
+            for first, chunk_last in ranges:
+                yield dict(data=_setup.data(first, chunk_last, frame_rate, time_samples),
+                           start=first,
+                           end=chunk_last,
+                           fit=mode in (ANALYTIC_BAKE, CYCLE_BAKE),
+                           tolerance=tolerance,
+                           budgets=budgets,
+                           cache_dir=cache_dir)
+
+    # a single job is not worth starting a pool
+    if sum(len(i[1]) for i in plans) < 2:
+        processes = 1
+    results = run_jobs(jobs(), processes, _mayapy())
+
+    baked = []
+    for setup, ranges, cycle, bake_hash in plans:
+        setup.release()
+        channels = setup.channels()
+        previous = [None] * len(channels)
+        for first, _ in ranges:
+            fitted = next(results)
+            writes = []
+            for index, ((node, attr), keys) in enumerate(zip(channels, fitted)):
+                frames, values, in_slopes, out_slopes = keys
+                if previous[index] is not None:
+                    # rotations are unwrapped per chunk, keep them continuous with the previous one
+                    if attr.startswith("rotate"):
+                        values = values + 360.0 * np.round((previous[index] - values[0]) / 360.0)
+                    # the boundary frame is already keyed by the previous chunk
+                    keys = [i[1:] if i is not None else None for i in (frames, values, in_slopes, out_slopes)]
+                else:
+                    keys = frames, values, in_slopes, out_slopes
+                previous[index] = values[-1]
+                if len(keys[0]):
+                    writes.append((node, attr, keys))
+
+            def write(modifier, change):
+                for _node, _attr, _keys in writes:
+                    _write_keys(_node, _attr, *_keys, frame_rate=frame_rate, cycle=cycle, append=first != start,
+                                modifier=modifier, change=change)
+
+            run_edit(write)
+            del fitted, writes
+        setup.record(bake_hash)
+        baked.extend(i["node"] for i in setup.slaves)
+    return baked
+
+
+@one_undo
+def reduce_baked(nodes=None, reduction=DEFAULT_TOLERANCE):
+    """Run the key reduction pass on channels already baked in the scene.
+
+    Arguments:
+        nodes (list of str): baked nodes, defaults to every member of Sine_Main_Bake_Sets.
+        reduction (float or dict): error budget, a tolerance or a dict attr -> tolerance.
+
+    Returns:
+        int: number of removed keys
+    """
+    if nodes is None:
+        nodes = []
+        for element in list_setups():
+            nodes.extend(cmds.sets(element + "_Bake_Sets", q=True) or [])
+    frame_rate = float(getFrameRate())
+    removed = 0
+    for node in nodes:
+        for attr in BAKED_ATTRS:
+            budget = _budget(reduction, attr)
+            keys = _read_keys(node, attr, frame_rate) if budget is not None else None
+            if keys is None or len(keys[0]) < 3:
+                continue
+            frames = keys[0]
+            cycle = cmds.setInfinity(node, at=attr, q=True, poi=True)[0] == "cycle"
+            keys = reduce_keys(*keys, tolerance=budget)
+            removed += len(frames) - len(keys[0])
+            run_edit(lambda modifier, change: _write_keys(node, attr, *keys, frame_rate=frame_rate, cycle=cycle,
+                                                          modifier=modifier, change=change))
+    return removed
+
+
+def write_rotation_cache(element, path, start=None, end=None, chunk_size=CHUNK_SIZE, time_curve=None):
+    """Write the expression joint rotations of a setup to a cache file, one sample per frame.
+
+    Arguments:
+        element (str): setup element name "Sine_<name>".
+        path (str): cache file, CACHE_EXT by convention.
+        start (float): first frame, defaults to the playback start.
+        end (float): last frame, defaults to the playback end.
+        chunk_size (int): frames evaluated and written at once.
+        time_curve (str): animCurveTT retiming the motion, scene frame -> evaluated frame.
+
+    Returns:
+        str: the cache file
+    """
+    start = cmds.playbackOptions(q=True, min=True) if start is None else start
+    end = cmds.playbackOptions(q=True, max=True) if end is None else end
+    frame_rate = float(getFrameRate())
+    setup = BakeSetup(element)
+    if setup.uses_noise():
+        require_calibration("the rotation cache of " + element)
+    joint_counts = setup.joint_counts()
+    frames = np.arange(start, end + 1, dtype=np.float64)
+    source = remap_frames(frames, _time_samples(time_curve, start, end))
+    data = create_cache(path, [_short_name(i) for i in setup.joints()], start, frames.size,
+                        state_hash(setup.state_hash(frames, frame_rate), source))
+    # parameter arrays stay on the scene frames, only the time is remapped
+    for offset, rotations in evaluate_chunks(setup.params(frames), source, joint_counts,
+                                             frame_rate=frame_rate, chunk_size=chunk_size):
+        count = rotations.shape[-1]
+        rotations *= setup.multipliers(frames[offset:offset + count])[:, :, np.newaxis]
+        data[offset:offset + count] = flatten_rotations(rotations, joint_counts)
+        data.flush()
+        del rotations
+    del data
+    return path
+
+
+def play_rotation_cache(element, path, namespace=""):
+    """Drive the expression joints of a setup by a sineCacheReader playing a cache file.
+
+    Arguments:
+        element (str): setup element name "Sine_<name>".
+        path (str): cache file written by write_rotation_cache().
+        namespace (str): namespace of the setup in the current scene.
+
+    Returns:
+        str: the sineCacheReader node
+    """
+    if not cmds.pluginInfo(SOLVER_PLUGIN, q=True, loaded=True):
+        cmds.loadPlugin(SOLVER_PLUGIN, quiet=True)
+    header = read_header(path)
+    name = namespace + CACHE_READER_NAME.format(_name=element[len("Sine_"):])
+    if cmds.objExists(name):
+        cmds.delete(name)
+    reader = cmds.createNode("sineCacheReader", n=name)
+    cmds.setAttr(reader + ".cacheFile", path, type="string")
+    cmds.connectAttr("time1.outTime", reader + ".time")
+    for index, joint in enumerate(header["joints"]):
+        joint = namespace + joint
+        cmds.delete(joint, expressions=True)
+        for axis in AXES:
+            cmds.connectAttr("{}.outRotate[{}].outRotate{}".format(reader, index, axis),
+                             "{}.rotate{}".format(joint, axis), f=True)
+    return reader
+
+
+def export_runtime(path, setups=None):
+    """Export the parameters of sine setups for a runtime evaluation, see sine_tool.engine.runtime.
+
+    Animated attributes are exported with their value at the current time.
+
+    Arguments:
+        path (str): runtime json file.
+        setups (list of str): setup element names "Sine_<name>", defaults to every setup of Sine_Main_Bake_Sets.
+
+    Returns:
+        str: the runtime file
+    """
+    setups = list_setups() if setups is None else setups
+    exported = []
+    for element in setups:
+        setup = BakeSetup(element)
+        if setup.uses_noise():
+            require_calibration("the runtime export of " + element)
+        if setup.animated:
+            cmds.warning("{} has animated attributes, exported at the current time".format(element))
+        slaves = dict(((i["chain"], i["joint"]), _short_name(i["node"])) for i in setup.slaves)
+        chains = []
+        for chain_index, chain in enumerate(setup.chains):
+            count = len(chain["joints"])
+            chains.append(dict(index=chain_index,
+                               sine_multiplier=cmds.getAttr(chain["ik_ctl"] + ".sine_multiplier_All"),
+                               fk_multipliers=[cmds.getAttr("{}.FK_multiplier_{}".format(chain["ik_ctl"], i))
+                                               for i in range(count)],
+                               joints=[_short_name(i) for i in chain["joints"]],
+                               slaves=[slaves.get((chain_index, i)) for i in range(count)]))
+        exported.append(dict(name=element,
+                             params=dict((k, float(cmds.getAttr("{}.{}".format(setup.master, k))))
+                                         for k in param_names()),
+                             chain_count=len(setup.chains),
+                             chains=chains))
+    return write_runtime(path, runtime_data(exported, getFrameRate(), gradients()))
@@ -0,0 +1,172 @@
+"""
+Table driven approximations of sin and noise for previews and LOD evaluation
+
+sin and the bias noise are replaced by linear interpolation in tables sampled once.
+The error of a linear interpolation with a step h is at most h^2 / 8 * max|f''|,
+so the table sizes follow from the accepted error:
+
+    sin : max|sin''| = 1
+    noise : inside a lattice cell noise'' = w0'' * g0 + w1'' * g1 with |w0''|, |w1''| <= 6,
+            the samples are aligned on the lattice so no interval crosses a cell
+
+Approximation.for_tolerance() turns a max rotation error in degrees into the sin
+and noise errors with the gains of sine_tool.engine.evaluator.error_gains().
+
+With NumPy a table lookup is a gather, it is about twice as fast as the noise but
+not faster than np.sin on the phase range of a shot, so the sin table is only
+used when asked for and the whole error budget goes to the noise otherwise.
+"""
+from math import ceil, log, pi, sqrt
+
+import numpy as np
+
+from . import noise as _noise
+from .evaluator import error_gains
+
+tau = pi * 2
+# default max rotation error, in degrees
+TOLERANCE = 0.01
+MIN_SIN_SIZE = 64
+MAX_SIN_SIZE = 1 << 22
+MAX_NOISE_DENSITY = 1 << 14
+# bound of the second derivative of each noise corner weight
+_WEIGHT_CURVATURE = 6.0
+
+
+def _power_of_two(value, minimum, maximum):
+    return int(min(max(2 ** int(ceil(log(max(value, 1.0), 2))), minimum), maximum))
+
+
+def _weight_sum():
+    """max of |w0| + |w1| inside a cell, the noise is bounded by it times the largest gradient"""
+    w0, w1 = _noise._weights(np.linspace(0.0, 1.0, 10001))
+    return float((np.abs(w0) + np.abs(w1)).max()) * 1.001
+
+
+def _lookup(table, slope, positions, mask):
+    """linear interpolation of a periodic table, positions in table steps, in place to save temporaries"""
+    index = np.floor(positions)
+    positions -= index
+    index = index.astype(np.intp)
+    np.bitwise_and(index, mask, out=index)
+    result = np.take(slope, index)
+    result *= positions
+    result += np.take(table, index)
+    return result
+
+
+class Approximation(object):
+    """
+    Table based sin and noise, evaluator.evaluate(..., approx=Approximation.for_tolerance(...))
+
+    The noise table is sampled from the gradient table of sine_tool.engine.noise,
+    it is sampled again if the gradients are replaced (calibrate_from_maya()).
+    """
+
+    def __init__(self, sin_error=1e-5, noise_error=1e-5, sin_table=False):
+        self.sin_size = None
+        if sin_table:
+            self.sin_size = _power_of_two(tau / sqrt(8.0 * sin_error), MIN_SIN_SIZE, MAX_SIN_SIZE)
+            values = np.sin(np.arange(self.sin_size + 1) * (tau / self.sin_size))
+            self.sin_table = values[:-1]
+            self.sin_slope = np.diff(values)
+
+        self.noise_error = noise_error
+        self.noise_density = None
+        self.noise_table = None
+        self.noise_slope = None
+        self._gradients = None
+
+    @classmethod
+    def for_tolerance(cls, params, joint_counts, fk_multipliers=None, sine_multipliers=None,
+                      frame_rate=24.0, chain_indices=None, chain_count=None, tolerance=TOLERANCE,
+                      sin_table=False):
+        """Get the smallest tables keeping the rotation error of a setup under tolerance.
+
+        Arguments:
+            params, joint_counts ... : the evaluator arguments the approximation is used with.
+            tolerance (float): max rotation error in degrees.
+            sin_table (bool): approximate sin too, the budget is then split between both tables.
+
+        Returns:
+            Approximation
+        """
+        gains, bias_range = error_gains(params, joint_counts,
+                                        fk_multipliers=fk_multipliers,
+                                        sine_multipliers=sine_multipliers,
+                                        frame_rate=frame_rate,
+                                        chain_indices=chain_indices,
+                                        chain_count=chain_count)
+        noise_max = float(np.abs(_noise.gradients()).max()) * _weight_sum()
+        sin_error = noise_error = float(tolerance)
+        for gain, bias in zip(gains, bias_range):
+            if not gain:
+                continue
+            if not sin_table:
+                if bias:
+                    noise_error = min(noise_error, tolerance / (gain * bias))
+            elif not bias:
+                sin_error = min(sin_error, tolerance / gain)
+            else:
+                # half of the budget to each table
+                sin_error = min(sin_error, tolerance / (2.0 * gain * (1.0 + bias * noise_max)))
+                noise_error = min(noise_error, tolerance / (2.0 * gain * bias))
+        return cls(sin_error, noise_error, sin_table)
+
+    @property
+    def sin_error(self):
+        """max error of sin()"""
+        if self.sin_size is None:
+            return 0.0
+        return (tau / self.sin_size) ** 2 / 8.0
+
+    def _build_noise(self):
+        gradients = _noise.gradients()
+        if self._gradients is gradients:
+            return
+        curvature = 2.0 * _WEIGHT_CURVATURE * float(np.abs(gradients).max())
+        self.noise_density = _power_of_two(sqrt(curvature / (8.0 * self.noise_error)), 1, MAX_NOISE_DENSITY)
+        positions = np.arange(_noise.LATTICE_SIZE * self.noise_density + 1) / float(self.noise_density)
+        values = _noise.noise(positions)
+        self.noise_table = values[:-1]
+        self.noise_slope = np.diff(values)
+        self._gradients = gradients
+
+    def sin(self, values):
+        """Approximated np.sin, values in radians"""
+        if self.sin_size is None:
+            return np.sin(values)
+        values = np.asarray(values)
+        dtype = values.dtype if values.dtype.kind == "f" else np.float64
+        return _lookup(self.sin_table.astype(dtype, copy=False),
+                       self.sin_slope.astype(dtype, copy=False),
+                       values * (self.sin_size / tau),
+                       self.sin_size - 1)
+
+    def noise(self, values, dtype=np.float64):
+        """Approximated sine_tool.engine.noise.noise()"""
+        self._build_noise()
+        values = np.asarray(values, dtype=dtype)
+        return _lookup(self.noise_table.astype(dtype, copy=False),
+                       self.noise_slope.astype(dtype, copy=False),
+                       values * self.noise_density,
+                       self.noise_table.size - 1)
+
+    def rotation_error(self, params, joint_counts, fk_multipliers=None, sine_multipliers=None,
+                       frame_rate=24.0, chain_indices=None, chain_count=None):
+        """Get the guaranteed max rotation error of each axis for a setup
+
+        Returns:
+            ndarray: (3,) errors in degrees
+        """
+        self._build_noise()
+        gains, bias_range = error_gains(params, joint_counts,
+                                        fk_multipliers=fk_multipliers,
+                                        sine_multipliers=sine_multipliers,
+                                        frame_rate=frame_rate,
+                                        chain_indices=chain_indices,
+                                        chain_count=chain_count)
+        curvature = 2.0 * _WEIGHT_CURVATURE * float(np.abs(self._gradients).max())
+        noise_error = curvature / (8.0 * self.noise_density ** 2)
+        noise_max = float(np.abs(self._gradients).max()) * _weight_sum()
+        return gains * ((1.0 + bias_range * noise_max) * self.sin_error + bias_range * noise_error)
@@ -0,0 +1,393 @@
+"""
+Memory-mapped rotation cache files
+
+A cache file holds the evaluated rotations of every expression joint of a setup:
+
+    MAGIC | header size (uint32, little endian) | header (json) | padding | data
+
+data is a C ordered (frames, joints, 3) array of rotations in degrees, it starts
+on a PAGE_SIZE boundary so a np.memmap of the file only loads the pages of the
+frames actually read. The header holds the joint names and the hash of the
+parameter state the rotations were evaluated with.
+
+FrameCache is the in memory counterpart used by the sineSolver node while
+scrubbing: the last evaluated frames of one parameter state, bounded in bytes.
+
+DiskCache is a content addressed directory of results keyed by the hash of their
+inputs, any scene evaluating or baking the same setup over the same frames reads
+them back. Point SINE_CACHE_DIR to a shared folder to share it between users.
+Every hash also covers ENGINE_VERSION and the noise gradient table, results of
+an older engine or of another calibration are never read back.
+"""
+import hashlib
+import json
+import os
+import struct
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+from . import noise
+from .evaluator import evaluate
+
+MAGIC = b"RXSINE\x00C"
+VERSION = 1
+# version of the engine results, bump it when the evaluator, noise, fitting or reduction
+# give other values: every hash of state_hash() changes and the older entries are missed
+ENGINE_VERSION = 1
+PAGE_SIZE = 4096
+DTYPE = "float32"
+# default memory cap of a FrameCache, in MB
+FRAME_CACHE_MB = 64.0
+DISK_CACHE_DIR = os.environ.get("SINE_CACHE_DIR",
+                                os.path.join(os.path.expanduser("~"), ".rxSine", "cache")).replace("\\", "/")
+# default size cap of a DiskCache, in MB
+DISK_CACHE_MB = 2048.0
+# puts of a DiskCache between two scans of its directory, the entries written by
+# other processes are only counted by a scan
+EVICT_INTERVAL = 64
+
+_SIZE = struct.Struct("<I")
+
+try:
+    _replace = os.replace
+except AttributeError:
+    # python 2, rename only replaces an existing file atomically on posix
+    def _replace(source, destination):
+        if os.name == "nt" and os.path.exists(destination):
+            os.remove(destination)
+        os.rename(source, destination)
+
+
+def _jsonable(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError("{!r} can not be hashed".format(value))
+
+
+def state_hash(*values):
+    """Get a stable hash of parameter values (dicts, lists, scalars and arrays),
+    salted by ENGINE_VERSION and the noise gradient table
+
+    Returns:
+        str: hex digest
+    """
+    digest = hashlib.sha1()
+    digest.update("{}:{}".format(ENGINE_VERSION, noise.table_hash()).encode("utf-8"))
+    for value in values:
+        digest.update(json.dumps(value, sort_keys=True, default=_jsonable).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def flatten_rotations(rotations, joint_counts):
+    """Convert evaluator rotations (chains, joints, 3, frames) to the cache layout (frames, joints, 3)
+
+    Joints are stored chain after chain, the zero padding of the shorter chains is dropped.
+    """
+    return np.concatenate([np.transpose(rotations[c, :count], (2, 0, 1)) for c, count in enumerate(joint_counts)],
+                          axis=1)
+
+
+def read_header(path):
+    """Read the header of a cache file
+
+    Returns:
+        dict: version, joints, start, frame_count, params_hash, dtype, offset
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{} is not a sine rotation cache".format(path))
+        size, = _SIZE.unpack(f.read(_SIZE.size))
+        return json.loads(f.read(size).decode("utf-8"))
+
+
+def create_cache(path, joints, start, frame_count, params_hash, dtype=DTYPE):
+    """Create a cache file and map its data for writing.
+
+    Arguments:
+        path (str): cache file.
+        joints (list of str): names of the cached joints.
+        start (float): frame of the first cached frame.
+        frame_count (int): number of cached frames, one per frame.
+        params_hash (str): hash of the parameter state, see state_hash().
+        dtype (str): data type of the stored rotations.
+
+    Returns:
+        np.memmap: writable (frames, joints, 3) array
+    """
+    header = dict(version=VERSION,
+                  joints=list(joints),
+                  start=float(start),
+                  frame_count=int(frame_count),
+                  params_hash=params_hash,
+                  dtype=np.dtype(dtype).name)
+    size = len(json.dumps(header).encode("utf-8"))
+    # the offset is stored in the header, reserve its digits before measuring
+    offset = -(-(len(MAGIC) + _SIZE.size + size + 32) // PAGE_SIZE) * PAGE_SIZE
+    header["offset"] = offset
+    data = json.dumps(header).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(_SIZE.pack(len(data)))
+        f.write(data)
+    return np.memmap(path, dtype=header["dtype"], mode="r+", offset=offset,
+                     shape=(header["frame_count"], len(header["joints"]), 3))
+
+
+def write_cache(path, rotations, joints, start, params_hash, dtype=DTYPE):
+    """Write a whole (frames, joints, 3) rotation array to a cache file, see create_cache()"""
+    rotations = np.asarray(rotations)
+    data = create_cache(path, joints, start, rotations.shape[0], params_hash, dtype)
+    data[:] = rotations
+    data.flush()
+    del data
+    return path
+
+
+class RotationCache(object):
+    """
+    Read only view of a cache file, frames are loaded lazily by the memory map
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.header = read_header(path)
+        self.data = np.memmap(path, dtype=self.header["dtype"], mode="r", offset=self.header["offset"],
+                              shape=(self.header["frame_count"], len(self.header["joints"]), 3))
+
+    @property
+    def joints(self):
+        return self.header["joints"]
+
+    @property
+    def start(self):
+        return self.header["start"]
+
+    @property
+    def frame_count(self):
+        return self.header["frame_count"]
+
+    @property
+    def params_hash(self):
+        return self.header["params_hash"]
+
+    def frames(self, frames):
+        """Get the rotations at frames, fractional frames are interpolated and the cached range is held outside
+
+        Returns:
+            ndarray: (frames, joints, 3) rotations in degrees
+        """
+        position = np.clip(np.asarray(frames, dtype=np.float64).reshape(-1) - self.start, 0, self.frame_count - 1)
+        index = np.minimum(np.floor(position).astype(np.int64), self.frame_count - 1)
+        following = np.minimum(index + 1, self.frame_count - 1)
+        weight = (position - index)[:, np.newaxis, np.newaxis]
+        return self.data[index] * (1.0 - weight) + self.data[following] * weight
+
+    def frame(self, frame):
+        """Get the (joints, 3) rotations at one frame"""
+        return self.frames([frame])[0]
+
+
+class FrameCache(object):
+    """
+    Least recently used cache of per frame results, keyed by (frame, state hash)
+
+    Every entry belongs to the same parameter state, a new state empties the cache.
+    """
+
+    def __init__(self, max_mb=FRAME_CACHE_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.state = None
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def resize(self, max_mb):
+        """Change the memory cap, the oldest entries are dropped to fit"""
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._evict()
+
+    def _evict(self):
+        while self.entries and self.size > self.max_bytes:
+            _, value = self.entries.popitem(last=False)
+            self.size -= value.nbytes
+
+    def get(self, frame, state):
+        """Get the cached value of a frame, None if it is not cached or the state changed"""
+        if state != self.state:
+            self.clear()
+            self.state = state
+            return None
+        value = self.entries.pop(frame, None)
+        if value is not None:
+            self.entries[frame] = value
+        return value
+
+    def put(self, frame, state, value):
+        """Cache the value of a frame, stored as a read only array"""
+        if state != self.state:
+            self.clear()
+            self.state = state
+        value = np.array(value)
+        value.flags.writeable = False
+        if value.nbytes > self.max_bytes:
+            return value
+        previous = self.entries.pop(frame, None)
+        if previous is not None:
+            self.size -= previous.nbytes
+        self.entries[frame] = value
+        self.size += value.nbytes
+        self._evict()
+        return value
+
+
+def evaluation_key(params, frames, joint_counts, fk_multipliers=None, sine_multipliers=None,
+                   frame_rate=24.0, chain_indices=None, chain_count=None):
+    """Get the DiskCache key of an evaluator.evaluate() call, same arguments"""
+    frames = np.asarray(frames, dtype=np.float64).reshape(-1)
+    return state_hash("evaluate", params, frames, joint_counts, fk_multipliers, sine_multipliers,
+                      float(frame_rate), chain_indices, chain_count)
+
+
+class DiskCache(object):
+    """
+    Content addressed cache of arrays on disk, least recently used entries are
+    deleted when the directory grows over max_mb
+
+    Entries are written to a temporary file then atomically replace the entry,
+    several processes can share the directory. A hit touches the file, its
+    modification time is the last use. The size written since the last scan is
+    tracked, the directory is only scanned when it may be full or every
+    EVICT_INTERVAL puts.
+    """
+
+    def __init__(self, directory=DISK_CACHE_DIR, max_mb=DISK_CACHE_MB):
+        self.directory = directory
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        # size found by the last scan, None before the first one
+        self._size = None
+        self._written = 0
+        self._puts = 0
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".npz").replace("\\", "/")
+
+    def get(self, key):
+        """Get the arrays of a key, None if it is not cached
+
+        Returns:
+            dict: name -> ndarray
+        """
+        path = self.path(key)
+        try:
+            with np.load(path) as data:
+                arrays = dict((name, data[name]) for name in data.files)
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            return None
+        return arrays
+
+    def put(self, key, arrays):
+        """Store arrays (dict name -> array) under a key"""
+        path = self.path(key)
+        folder = os.path.dirname(path)
+        if not os.path.isdir(folder):
+            try:
+                os.makedirs(folder)
+            except OSError:
+                # made by another process
+                pass
+        handle, temp = tempfile.mkstemp(suffix=".npz", dir=folder)
+        try:
+            with os.fdopen(handle, "wb") as f:
+                np.savez(f, **arrays)
+            size = os.path.getsize(temp)
+            _replace(temp, path)
+        except OSError:
+            if os.path.exists(temp):
+                os.remove(temp)
+            return False
+        self._written += size
+        self._puts += 1
+        if self._size is None or self._puts >= EVICT_INTERVAL or self._size + self._written > self.max_bytes:
+            self.evict()
+        return True
+
+    def entries(self):
+        """Get (last use, size, path) of every entry, oldest first"""
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".npz"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def size(self):
+        return sum(i[1] for i in self.entries())
+
+    def evict(self):
+        """Delete the least recently used entries until the cache fits in max_bytes
+
+        Returns:
+            int: number of deleted entries
+        """
+        entries = self.entries()
+        size = sum(i[1] for i in entries)
+        deleted = 0
+        for _, entry_size, path in entries:
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= entry_size
+            deleted += 1
+        self._size, self._written, self._puts = size, 0, 0
+        return deleted
+
+    def clear(self):
+        for _, _, path in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._size, self._written, self._puts = 0, 0, 0
+
+
+def cached_evaluate(cache, params, frames, joint_counts, fk_multipliers=None, sine_multipliers=None,
+                    frame_rate=24.0, chain_indices=None, chain_count=None):
+    """evaluator.evaluate() through a DiskCache, same arguments
+
+    Returns:
+        ndarray: rotations in degrees with shape (chains, joints, 3, frames)
+    """
+    kwargs = dict(fk_multipliers=fk_multipliers,
+                  sine_multipliers=sine_multipliers,
+                  frame_rate=frame_rate,
+                  chain_indices=chain_indices,
+                  chain_count=chain_count)
+    key = evaluation_key(params, frames, joint_counts, **kwargs)
+    arrays = cache.get(key)
+    if arrays is not None:
+        return arrays["rotations"]
+    rotations = evaluate(params, frames, joint_counts, **kwargs)
+    cache.put(key, dict(rotations=rotations))
+    return rotations
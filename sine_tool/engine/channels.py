@@ -0,0 +1,126 @@
+"""
+Conversion of the expression joint rotations to the channels of the slaves
+
+Matrices follow Maya's row vector convention (point * matrix, child * parent).
+A slave is driven through its FK joint, between two frames only the rotation of its
+expression joint changes, so its local matrix is
+
+    local(t) = left * R(t) * right
+
+left holds the FK controller / joint offset below the expression joint and right
+everything above it up to the slave parent. Both are captured from the scene once,
+see rest_matrices().
+"""
+import numpy as np
+
+# same order as the rotateOrder enum of Maya transforms
+ROTATE_ORDERS = ("xyz", "yzx", "zxy", "xzy", "yxz", "zyx")
+
+
+def _axis_rotation(axis, angles):
+    """Get row vector rotation matrices about one axis, angles in radians (...,) -> (..., 3, 3)"""
+    c, s = np.cos(angles), np.sin(angles)
+    one, zero = np.ones_like(angles), np.zeros_like(angles)
+    if axis == "x":
+        rows = [[one, zero, zero], [zero, c, s], [zero, -s, c]]
+    elif axis == "y":
+        rows = [[c, zero, -s], [zero, one, zero], [s, zero, c]]
+    else:
+        rows = [[c, s, zero], [-s, c, zero], [zero, zero, one]]
+    return np.stack([np.stack(row, axis=-1) for row in rows], axis=-2)
+
+
+def euler_to_matrix(rotations, order=0):
+    """Convert euler rotations to rotation matrices.
+
+    Arguments:
+        rotations (array_like): rotations in degrees, shape (..., 3)
+        order (int or str): rotate order, index of ROTATE_ORDERS or its name
+
+    Returns:
+        ndarray: row vector rotation matrices, shape (..., 3, 3)
+    """
+    order = ROTATE_ORDERS[order] if not isinstance(order, str) else order
+    radians = np.radians(np.asarray(rotations, dtype=np.float64))
+    matrix = None
+    for axis in order:
+        rotation = _axis_rotation(axis, radians[..., "xyz".index(axis)])
+        matrix = rotation if matrix is None else np.matmul(matrix, rotation)
+    return matrix
+
+
+def matrix_to_euler(matrices, order=0):
+    """Convert rotation matrices to euler rotations.
+
+    Arguments:
+        matrices (array_like): row vector rotation matrices, shape (..., 3, 3)
+        order (int or str): rotate order, index of ROTATE_ORDERS or its name
+
+    Returns:
+        ndarray: rotations in degrees, shape (..., 3)
+    """
+    order = ROTATE_ORDERS[order] if not isinstance(order, str) else order
+    # column vector form : R_third * R_second * R_first
+    m = np.swapaxes(np.asarray(matrices, dtype=np.float64), -1, -2)
+    a1, a2, a3 = ["xyz".index(i) for i in order]
+    parity = 1.0 if (a1, a2, a3) in ((0, 1, 2), (1, 2, 0), (2, 0, 1)) else -1.0
+
+    second = np.arcsin(np.clip(-parity * m[..., a3, a1], -1.0, 1.0))
+    first = np.arctan2(parity * m[..., a3, a2], m[..., a3, a3])
+    third = np.arctan2(parity * m[..., a2, a1], m[..., a1, a1])
+
+    euler = np.empty(m.shape[:-2] + (3,), dtype=np.float64)
+    euler[..., a1] = first
+    euler[..., a2] = second
+    euler[..., a3] = third
+    return np.degrees(euler)
+
+
+def rest_matrices(local, exp_rotation, fk_world, exp_world):
+    """Get the constant parts of a slave local matrix from its current state.
+
+    Arguments:
+        local (array_like): current 4x4 local matrix of the slave.
+        exp_rotation (array_like): current rotation of the expression joint in degrees (rotate order xyz).
+        fk_world (array_like): current 4x4 world matrix of the FK joint driving the slave.
+        exp_world (array_like): current 4x4 world matrix of the expression joint.
+
+    Returns:
+        tuple: left, right 4x4 matrices
+    """
+    local = np.asarray(local, dtype=np.float64).reshape(4, 4)
+    left = np.asarray(fk_world, dtype=np.float64).reshape(4, 4).dot(
+        np.linalg.inv(np.asarray(exp_world, dtype=np.float64).reshape(4, 4)))
+    rotation = np.identity(4)
+    rotation[:3, :3] = euler_to_matrix(exp_rotation)
+    right = np.linalg.inv(rotation).dot(np.linalg.inv(left)).dot(local)
+    return left, right
+
+
+def slave_channels(rotations, left, right, rotate_order=0, rotate_axis=(0, 0, 0), joint_orient=(0, 0, 0)):
+    """Get the translate / rotate channels of a slave for expression joint rotations.
+
+    Arguments:
+        rotations (array_like): expression joint rotations in degrees, shape (3, times)
+        left (array_like): 4x4 matrix, see rest_matrices()
+        right (array_like): 4x4 matrix, see rest_matrices()
+        rotate_order (int): rotateOrder of the slave.
+        rotate_axis (array_like): rotateAxis of the slave in degrees.
+        joint_orient (array_like): jointOrient of the slave in degrees, zero for transforms.
+
+    Returns:
+        tuple: translate (3, times), rotate in degrees (3, times), unwrapped over time
+    """
+    rotations = np.asarray(rotations, dtype=np.float64)
+    left = np.asarray(left, dtype=np.float64)
+    right = np.asarray(right, dtype=np.float64)
+    local = np.matmul(np.matmul(left[:3, :3], euler_to_matrix(rotations.T)), right[:3, :3])
+    translate = np.matmul(left[3, :3], np.matmul(euler_to_matrix(rotations.T), right[:3, :3])) + right[3, :3]
+
+    # remove the scale, then the rotate axis and joint orient : local = RA * R * JO
+    local = local / np.linalg.norm(local, axis=-1)[..., np.newaxis]
+    pre = np.linalg.inv(euler_to_matrix(rotate_axis))
+    post = np.linalg.inv(euler_to_matrix(joint_orient))
+    rotate = matrix_to_euler(np.matmul(np.matmul(pre, local), post), rotate_order)
+    rotate = np.degrees(np.unwrap(np.radians(rotate), axis=0))
+    return translate.T, rotate.T
@@ -0,0 +1,440 @@
+"""
+Vectorized NumPy evaluation of the sine motion generated by SineSetupMain._set_exp
+
+The evaluator does not need Maya, every chain / joint / axis / frame is computed
+in a single call so it can be used for previews, bakes and as a test oracle, see
+sine_tool.engine.selfcheck.
+"""
+from math import pi
+
+import numpy as np
+
+from .noise import noise
+from .params import AXES, default_params
+
+tau = pi * 2
+# frames evaluated at once by evaluate_chunks()
+CHUNK_SIZE = 1024
+# motion blur sub-steps of evaluate_subframes()
+SUBFRAME_STEPS = 5
+# default working memory of evaluate_budget(), in MB
+MEMORY_BUDGET_MB = 256.0
+# arrays of the size of the result alive at once in evaluate_times(), peak plus margin
+WORK_ARRAYS = 16
+
+
+def _axis_values(params, attr, dtype=np.float64):
+    """Stack the X/Y/Z values of an attribute.
+
+    Each value can be a scalar or an array with one value per evaluated time.
+
+    Returns:
+        ndarray: shape (3, 1) or (3, times)
+    """
+    defaults = default_params()
+    values = [np.asarray(params.get(attr + axis, defaults[attr + axis]), dtype=dtype).reshape(-1)
+              for axis in AXES]
+    return np.vstack(np.broadcast_arrays(*values))
+
+
+def _layout(joint_counts, chain_indices, chain_count, dtype=np.float64):
+    """Get the chain index, joint count and joint index arrays, broadcastable to (chains, joints, axes, times)"""
+    joint_counts = [int(i) for i in joint_counts]
+    if chain_indices is None:
+        chain_indices = range(len(joint_counts))
+    if chain_count is None:
+        chain_count = len(joint_counts)
+    max_joints = max(joint_counts) if joint_counts else 0
+    c_index = np.asarray(chain_indices, dtype=dtype).reshape(-1, 1, 1, 1)
+    j_count = np.asarray(joint_counts, dtype=dtype).reshape(-1, 1, 1, 1)
+    j_index = np.arange(1, max_joints + 1, dtype=dtype).reshape(1, -1, 1, 1)
+    return c_index, j_count, j_index, chain_count
+
+
+def _phase(params, times, c_index, j_count, j_index, chain_count, frame_rate, dtype=np.float64):
+    """Get the sine phase and the joint weight, shape (chains, joints, axes, times)"""
+    def axis(attr):
+        return _axis_values(params, attr, dtype)[np.newaxis, np.newaxis]
+
+    loop_per_second = axis("loop_per_second_")
+    if np.dtype(dtype) == np.float64:
+        freq = loop_per_second * tau * times
+    else:
+        # the loops are counted in double precision and wrapped, a float32 phase of a long shot drifts
+        loops = _axis_values(params, "loop_per_second_")[np.newaxis, np.newaxis] * times
+        freq = (np.mod(loops, 1.0) * tau).astype(dtype)
+    falloff = axis("falloff") * j_count * 0.1
+    delay = axis("delay") * -7
+    # "offset_frame / frame_rate * freq / time" in the expression, time cancels out
+    offset = axis("offset_frame") / float(frame_rate) * loop_per_second * tau
+    offset_noise = axis("offset_noise") * (c_index + 1) / float(chain_count)
+    offset_rdm = axis("offset_rdm")
+    rdm = offset_rdm * noise(offset_rdm + c_index, dtype)
+
+    weight = (j_index - np.minimum(np.maximum(falloff, 0), j_index)) / (j_count * 2.0)
+    return freq + rdm + offset_noise + offset + delay * weight, weight
+
+
+def _gain(params, j_count, j_index, weight, dtype=np.float64):
+    """Get the amplitude of the sine of each joint before the bias, shape (chains, joints, axes, times)"""
+    def axis(attr):
+        return _axis_values(params, attr, dtype)[np.newaxis, np.newaxis]
+
+    strength = np.asarray(params.get("strength", 1.0), dtype=dtype).reshape(-1)
+    falloff = axis("falloff") * j_count * 0.1
+    amp = axis("amp") * 0.1 * ((falloff / 5) + 1)
+    return 100 * weight * (1.0 - (j_index + 1) / (j_count * 2.0)) * amp * strength
+
+
+def _multipliers(joint_counts, fk_multipliers, sine_multipliers, dtype=np.float64):
+    """Get the FK_multiplier_i * sine_multiplier_All of every joint, shape (chains, joints)"""
+    max_joints = max(joint_counts) if joint_counts else 0
+    multipliers = np.zeros((len(joint_counts), max_joints), dtype=dtype)
+    for i, count in enumerate(joint_counts):
+        fk_mult = fk_multipliers[i] if fk_multipliers is not None else [1.0] * count
+        sine_mult = sine_multipliers[i] if sine_multipliers is not None else 1.0
+        multipliers[i, :count] = np.asarray(fk_mult, dtype=dtype)[:count] * sine_mult
+    return multipliers
+
+
+def error_gains(params, joint_counts, fk_multipliers=None, sine_multipliers=None,
+                frame_rate=24.0, chain_indices=None, chain_count=None):
+    """Get how much an error of the sine and of the bias noise can move the rotations.
+
+    The rotation error of an axis is at most gain * ((1 + bias_range * max|noise|) * sine error
+    + bias_range * noise error), see sine_tool.engine.approx.
+
+    Returns:
+        tuple: gain (3,) in degrees per unit of sine, bias_range (3,), the largest over the joints and times
+    """
+    joint_counts = [int(i) for i in joint_counts]
+    if not joint_counts or not max(joint_counts):
+        return np.zeros(3), np.zeros(3)
+    c_index, j_count, j_index, chain_count = _layout(joint_counts, chain_indices, chain_count)
+    _, weight = _phase(params, np.zeros(1), c_index, j_count, j_index, chain_count, frame_rate)
+    mult = np.maximum(np.abs(_axis_values(params, "amp_positive_mult")),
+                      np.abs(_axis_values(params, "amp_negative_mult")))[np.newaxis, np.newaxis]
+    multipliers = _multipliers(joint_counts, fk_multipliers, sine_multipliers)[:, :, np.newaxis, np.newaxis]
+    gain = np.abs(_gain(params, j_count, j_index, weight) * mult * multipliers)
+    gain = np.moveaxis(np.broadcast_to(gain, np.broadcast(gain, np.zeros((1, 1, 3, 1))).shape), 2, 0)
+    bias_range = np.abs(_axis_values(params, "amp_bias_range")).max(axis=1)
+    return gain.reshape(3, -1).max(axis=1), bias_range
+
+
+def phase_offsets(params, joint_counts, frame_rate=24.0, chain_indices=None, chain_count=None):
+    """Get the sine phase of every joint for constant master controller values.
+
+    The phase of a joint is angular_speed * time + offset, so the zero crossings and
+    extrema of its sine are known analytically.
+
+    Returns:
+        tuple: angular speed in radians per second (3,), offsets in radians (chains, joints, 3)
+    """
+    c_index, j_count, j_index, chain_count = _layout(joint_counts, chain_indices, chain_count)
+    phase, _ = _phase(params, np.zeros(1), c_index, j_count, j_index, chain_count, frame_rate)
+    return _axis_values(params, "loop_per_second_")[:, 0] * tau, phase[..., 0]
+
+
+def evaluate_times(params, times, joint_counts, fk_multipliers=None, sine_multipliers=None,
+                   frame_rate=24.0, chain_indices=None, chain_count=None, dtype=np.float64, approx=None):
+    """Evaluate the rotations of every joint at the given times.
+
+    Arguments:
+        params (dict): master controller attribute values, see default_params().
+            Values can be scalars or arrays holding one value per time.
+        times (array_like): times in seconds, the MEL "time" variable.
+        joint_counts (list of int): expression joint count of each evaluated chain.
+        fk_multipliers (list of list of float): FK_multiplier_i values for each chain.
+        sine_multipliers (list of float): sine_multiplier_All value for each chain.
+        frame_rate (float): the scene frame rate used by the offset_frame attributes.
+        chain_indices (list of int): chain index of each evaluated chain,
+            defaults to 0 ~ len(joint_counts) - 1.
+        chain_count (int): total number of chains of the setup, defaults to len(joint_counts).
+        dtype: floating point type of the working arrays and of the result.
+        approx (sine_tool.engine.approx.Approximation): table based sin and noise, exact if None.
+
+    Returns:
+        ndarray: rotations in degrees with shape (chains, joints, 3, times).
+            Chains shorter than the longest one are padded with zeros.
+    """
+    seconds = np.asarray(times, dtype=np.float64).reshape(-1)
+    times = seconds.astype(dtype)
+    joint_counts = [int(i) for i in joint_counts]
+
+    # axes layout for the whole computation : (chains, joints, axes, times)
+    c_index, j_count, j_index, chain_count = _layout(joint_counts, chain_indices, chain_count, dtype)
+
+    def axis(attr):
+        return _axis_values(params, attr, dtype)[np.newaxis, np.newaxis]
+
+    sin, bias_noise = (approx.sin, approx.noise) if approx is not None else (np.sin, noise)
+    loop_per_second = axis("loop_per_second_")
+
+    freq = loop_per_second * tau * times
+    bias_freq = axis("amp_bias_LPS_mult") * freq
+    bias_freq[:, :, 2] /= 100.0
+    bias = axis("amp_bias_range") * bias_noise(bias_freq + (c_index + 1) * axis("amp_bias_noise"), dtype)
+    phase, weight = _phase(params, seconds, c_index, j_count, j_index, chain_count, frame_rate, dtype)
+    sine = sin(phase) * (1 + bias) * _gain(params, j_count, j_index, weight, dtype)
+
+    amp_offset = axis("amp_offset")
+    # X and Y add the amp offset after the positive / negative multiplier, Z before it
+    sine[:, 0:1, 2:3] = sine[:, 0:1, 2:3] + amp_offset[:, :, 2:3]
+    rotation = np.where(sine >= 0, sine * axis("amp_positive_mult"), sine * axis("amp_negative_mult"))
+    rotation[:, 0:1, 0:2] = rotation[:, 0:1, 0:2] + amp_offset[:, :, 0:2]
+
+    multipliers = _multipliers(joint_counts, fk_multipliers, sine_multipliers, dtype)
+    return rotation * multipliers[:, :, np.newaxis, np.newaxis]
+
+
+def evaluate(params, frames, joint_counts, fk_multipliers=None, sine_multipliers=None,
+             frame_rate=24.0, chain_indices=None, chain_count=None, dtype=np.float64, approx=None):
+    """Evaluate the rotations of every joint at the given frames.
+
+    Same as evaluate_times() but the samples are given in frames of the scene frame rate.
+
+    >>> rotations = evaluate(params, np.arange(1, 121), [6, 6, 8], frame_rate=getFrameRate())
+
+    Returns:
+        ndarray: rotations in degrees with shape (chains, joints, 3, frames).
+    """
+    # frames are divided in double precision, only the working arrays use dtype
+    times = np.asarray(frames, dtype=np.float64) / float(frame_rate)
+    return evaluate_times(params, times, joint_counts,
+                          fk_multipliers=fk_multipliers,
+                          sine_multipliers=sine_multipliers,
+                          frame_rate=frame_rate,
+                          chain_indices=chain_indices,
+                          chain_count=chain_count,
+                          dtype=dtype,
+                          approx=approx)
+
+
+def remap_frames(frames, time_curve=None):
+    """Get the frames the motion is evaluated at through a time curve.
+
+    Arguments:
+        frames (array_like): scene frames.
+        time_curve: None for no remap, an array of source frames (one per scene frame),
+            a (curve frames, source frames) pair of samples linearly interpolated and held
+            outside of the samples, or a callable taking and returning frame arrays.
+
+    Returns:
+        ndarray: source frames with the shape of frames
+    """
+    frames = np.asarray(frames, dtype=np.float64)
+    if time_curve is None:
+        return frames
+    if callable(time_curve):
+        return np.asarray(time_curve(frames), dtype=np.float64).reshape(frames.shape)
+    if isinstance(time_curve, tuple):
+        return np.interp(frames, *time_curve)
+    return np.asarray(time_curve, dtype=np.float64).reshape(frames.shape)
+
+
+def evaluate_remapped(params, frames, joint_counts, time_curve=None, fk_multipliers=None, sine_multipliers=None,
+                      frame_rate=24.0, chain_indices=None, chain_count=None, dtype=np.float64, approx=None):
+    """Evaluate the rotations at scene frames whose time is remapped by a time curve (retime, speed ramp, hold).
+
+    Only the "time" of the expression goes through the curve, parameter arrays holding
+    one value per frame stay on the scene frames.
+
+    >>> ramp = (np.array([1.0, 48.0, 96.0]), np.array([1.0, 24.0, 120.0]))
+    >>> rotations = evaluate_remapped(params, np.arange(1, 97), [6, 6], ramp)
+
+    Returns:
+        ndarray: rotations in degrees with shape (chains, joints, 3, frames).
+    """
+    return evaluate(params, remap_frames(frames, time_curve).reshape(-1), joint_counts,
+                    fk_multipliers=fk_multipliers,
+                    sine_multipliers=sine_multipliers,
+                    frame_rate=frame_rate,
+                    chain_indices=chain_indices,
+                    chain_count=chain_count,
+                    dtype=dtype,
+                    approx=approx)
+
+
+def evaluate_chunks(params, frames, joint_counts, fk_multipliers=None, sine_multipliers=None,
+                    frame_rate=24.0, chain_indices=None, chain_count=None, chunk_size=CHUNK_SIZE):
+    """Evaluate the rotations over fixed-size chunks of frames.
+
+    Same arguments as evaluate(), parameter arrays holding one value per frame are
+    split with the frames. Only one chunk of rotations is alive at a time if the
+    caller drops it before asking for the next one.
+
+    Yields:
+        tuple: index of the first frame of the chunk, rotations (chains, joints, 3, chunk frames)
+    """
+    frames = np.asarray(frames, dtype=np.float64).reshape(-1)
+    for offset in range(0, frames.size, chunk_size):
+        part = slice(offset, offset + chunk_size)
+        chunk_params = dict((k, v[part] if np.ndim(v) else v) for k, v in params.items())
+        yield offset, evaluate(chunk_params, frames[part], joint_counts,
+                               fk_multipliers=fk_multipliers,
+                               sine_multipliers=sine_multipliers,
+                               frame_rate=frame_rate,
+                               chain_indices=chain_indices,
+                               chain_count=chain_count)
+
+
+def subframe_samples(frames, steps=SUBFRAME_STEPS, shutter_open=-0.5, shutter_close=0.5):
+    """Get evenly spaced sub-frame samples around each frame.
+
+    Arguments:
+        frames (array_like): center frames.
+        steps (int): samples per frame, both shutter ends included when more than one.
+        shutter_open (float): first sample, in frames relative to the center frame.
+        shutter_close (float): last sample, in frames relative to the center frame.
+
+    Returns:
+        ndarray: fractional frames with shape (frames, steps)
+    """
+    frames = np.asarray(frames, dtype=np.float64).reshape(-1, 1)
+    if steps > 1:
+        offsets = np.linspace(shutter_open, shutter_close, int(steps))
+    else:
+        offsets = np.full(1, (shutter_open + shutter_close) * 0.5)
+    return frames + offsets
+
+
+def evaluate_subframes(params, frames, joint_counts, fk_multipliers=None, sine_multipliers=None,
+                       frame_rate=24.0, chain_indices=None, chain_count=None,
+                       steps=SUBFRAME_STEPS, shutter_open=-0.5, shutter_close=0.5):
+    """Evaluate the rotations at the motion blur sub-steps of every frame in one call.
+
+    Same arguments as evaluate(), parameter arrays holding one value per frame are
+    held over the sub-steps of their frame. The time of the expression is continuous
+    and offset_frame / frame_rate is a constant phase, so fractional frames give the
+    values the expression would give at those times.
+
+    >>> rotations = evaluate_subframes(params, np.arange(1, 121), [6, 6], steps=5, shutter_open=-0.25,
+    ...                                shutter_close=0.25)
+
+    Returns:
+        ndarray: rotations in degrees with shape (chains, joints, 3, frames, steps)
+    """
+    samples = subframe_samples(frames, steps, shutter_open, shutter_close)
+    count, steps = samples.shape
+    # per frame values repeated on the sub-steps, scalars and per sample values are left as they are
+    sample_params = dict((k, np.repeat(v, steps) if np.size(v) == count and np.ndim(v) else v)
+                         for k, v in params.items())
+    rotations = evaluate(sample_params, samples.reshape(-1), joint_counts,
+                         fk_multipliers=fk_multipliers,
+                         sine_multipliers=sine_multipliers,
+                         frame_rate=frame_rate,
+                         chain_indices=chain_indices,
+                         chain_count=chain_count)
+    return rotations.reshape(rotations.shape[:3] + (count, steps))
+
+
+def tile_shape(joint_counts, frame_count, memory_mb=MEMORY_BUDGET_MB, dtype=np.float32):
+    """Get the largest tile of chains and frames whose evaluation fits in a memory budget.
+
+    Chains are tiled first, frames are only split when a single chain over every
+    frame does not fit.
+
+    Returns:
+        tuple: chains per tile, frames per tile
+    """
+    max_joints = max([int(i) for i in joint_counts] or [1])
+    budget = memory_mb * 1024 * 1024 / float(WORK_ARRAYS * np.dtype(dtype).itemsize * max_joints * 3)
+    frame_count = max(int(frame_count), 1)
+    chains = int(budget // frame_count)
+    if chains >= 1:
+        return min(chains, max(len(joint_counts), 1)), frame_count
+    return 1, max(int(budget), 1)
+
+
+def evaluate_tiles(params, frames, joint_counts, fk_multipliers=None, sine_multipliers=None,
+                   frame_rate=24.0, chain_indices=None, chain_count=None,
+                   memory_mb=MEMORY_BUDGET_MB, dtype=np.float32, approx=None):
+    """Evaluate the rotations over tiles of chains and frames sized by tile_shape().
+
+    Same arguments as evaluate(), the noise terms still see the index of each chain
+    in the whole setup so the tiles match a single call.
+
+    Yields:
+        tuple: index of the first chain, index of the first frame, rotations (chains, joints, 3, frames)
+            with joints padded to the longest chain of the tile
+    """
+    frames = np.asarray(frames, dtype=np.float64).reshape(-1)
+    joint_counts = [int(i) for i in joint_counts]
+    chain_indices = list(range(len(joint_counts))) if chain_indices is None else list(chain_indices)
+    chain_count = len(joint_counts) if chain_count is None else chain_count
+    tile_chains, tile_frames = tile_shape(joint_counts, frames.size, memory_mb, dtype)
+    for c in range(0, len(joint_counts), tile_chains):
+        chains = slice(c, c + tile_chains)
+        for f in range(0, frames.size, tile_frames):
+            part = slice(f, f + tile_frames)
+            tile_params = dict((k, v[part] if np.ndim(v) else v) for k, v in params.items())
+            yield c, f, evaluate(tile_params, frames[part], joint_counts[chains],
+                                 fk_multipliers=fk_multipliers[chains] if fk_multipliers is not None else None,
+                                 sine_multipliers=sine_multipliers[chains] if sine_multipliers is not None else None,
+                                 frame_rate=frame_rate,
+                                 chain_indices=chain_indices[chains],
+                                 chain_count=chain_count,
+                                 dtype=dtype,
+                                 approx=approx)
+
+
+def evaluate_budget(params, frames, joint_counts, fk_multipliers=None, sine_multipliers=None,
+                    frame_rate=24.0, chain_indices=None, chain_count=None,
+                    memory_mb=MEMORY_BUDGET_MB, dtype=np.float32, approx=None, out=None):
+    """Evaluate the rotations of many chains with the working memory bounded by memory_mb.
+
+    Same arguments as evaluate(). The result itself is not part of the budget, pass
+    a np.memmap as out to keep it on disk.
+
+    >>> rotations = evaluate_budget(params, np.arange(1, 241), [12] * 5000, memory_mb=128)
+
+    Returns:
+        ndarray: rotations in degrees (chains, joints, 3, frames) of type dtype
+    """
+    frames = np.asarray(frames, dtype=np.float64).reshape(-1)
+    max_joints = max([int(i) for i in joint_counts] or [0])
+    if out is None:
+        out = np.zeros((len(joint_counts), max_joints, 3, frames.size), dtype=dtype)
+    for c, f, rotations in evaluate_tiles(params, frames, joint_counts,
+                                          fk_multipliers=fk_multipliers,
+                                          sine_multipliers=sine_multipliers,
+                                          frame_rate=frame_rate,
+                                          chain_indices=chain_indices,
+                                          chain_count=chain_count,
+                                          memory_mb=memory_mb,
+                                          dtype=dtype,
+                                          approx=approx):
+        out[c:c + rotations.shape[0], :rotations.shape[1], :, f:f + rotations.shape[3]] = rotations
+    return out
+
+
+def precision_report(params, frames, joint_counts, fk_multipliers=None, sine_multipliers=None,
+                     frame_rate=24.0, chain_indices=None, chain_count=None, dtype=np.float32,
+                     max_samples=CHUNK_SIZE):
+    """Measure the error of a reduced precision evaluation against float64.
+
+    At most max_samples evenly spaced frames are compared, the first and last frames
+    are always part of them since the error grows with the time.
+
+    Returns:
+        dict: max_error and mean_error in degrees, max_rotation (largest float64 rotation),
+            frames (compared frame count)
+    """
+    frames = np.asarray(frames, dtype=np.float64).reshape(-1)
+    if frames.size > max_samples:
+        index = np.unique(np.linspace(0, frames.size - 1, max_samples).round().astype(np.int64))
+        frames = frames[index]
+        params = dict((k, v[index] if np.ndim(v) else v) for k, v in params.items())
+    kwargs = dict(fk_multipliers=fk_multipliers,
+                  sine_multipliers=sine_multipliers,
+                  frame_rate=frame_rate,
+                  chain_indices=chain_indices,
+                  chain_count=chain_count)
+    exact = evaluate(params, frames, joint_counts, **kwargs)
+    error = np.abs(evaluate(params, frames, joint_counts, dtype=dtype, **kwargs) - exact)
+    if not error.size:
+        return dict(max_error=0.0, mean_error=0.0, max_rotation=0.0, frames=int(frames.size))
+    return dict(max_error=float(error.max()),
+                mean_error=float(error.mean()),
+                max_rotation=float(np.abs(exact).max()),
+                frames=int(frames.size))
@@ -0,0 +1,343 @@
+"""
+Optimizing MEL compiler for the sine expression of a single chain
+
+The motion formula is first built as an expression tree, the tree builders fold
+constants on the fly: per joint constants and the attributes known to be static.
+Only the attributes passed as static are folded, a keyable attribute at zero (an
+unused amp axis on a setup built by the UI) can still be animated and is read.
+
+The time invariant sub-expressions (falloff weights, amplitudes, the offset_rdm
+noise...) are then moved to attributes of the chain by hoist_invariants(), they
+are computed by an expression which does not read the time, evaluated again only
+when an attribute changes. The compiler reads every attribute once and shares
+every repeated sub-expression through a temporary variable.
+
+Tree nodes are plain tuples:
+    ("const", value)
+    ("attr", "node.attr")
+    ("time",)
+    ("+", a, b, ...) / ("*", a, b, ...) / ("-", a, b) / ("/", a, b)
+    ("call", name, a, ...)
+    ("select", value, positive, negative)  -> value >= 0 ? positive : negative
+"""
+import math
+from math import pi
+
+tau = pi * 2
+
+ZERO = ("const", 0.0)
+ONE = ("const", 1.0)
+TIME = ("time",)
+
+# pure math functions which can be folded when every argument is a constant
+_FOLDABLE = {
+    "sin": math.sin,
+    "clamp": lambda low, high, value: min(max(value, low), high),
+}
+
+
+def const(value):
+    return "const", float(value)
+
+
+def attr(plug):
+    return "attr", plug
+
+
+def is_const(node):
+    return node[0] == "const"
+
+
+def _wrap(value):
+    return value if isinstance(value, tuple) else const(value)
+
+
+def add(*args):
+    args = [_wrap(i) for i in args]
+    total = sum(i[1] for i in args if is_const(i))
+    terms = [i for i in args if not is_const(i)]
+    if total:
+        terms.append(const(total))
+    if not terms:
+        return ZERO
+    if len(terms) == 1:
+        return terms[0]
+    return ("+",) + tuple(terms)
+
+
+def mul(*args):
+    args = [_wrap(i) for i in args]
+    factor = 1.0
+    for i in args:
+        if is_const(i):
+            factor *= i[1]
+    if factor == 0:
+        return ZERO
+    factors = [i for i in args if not is_const(i)]
+    if factor != 1:
+        factors.insert(0, const(factor))
+    if not factors:
+        return ONE
+    if len(factors) == 1:
+        return factors[0]
+    return ("*",) + tuple(factors)
+
+
+def sub(a, b):
+    a, b = _wrap(a), _wrap(b)
+    if is_const(a) and is_const(b):
+        return const(a[1] - b[1])
+    if b == ZERO:
+        return a
+    if a == b:
+        return ZERO
+    return "-", a, b
+
+
+def div(a, b):
+    a, b = _wrap(a), _wrap(b)
+    if is_const(b):
+        return mul(a, 1.0 / b[1])
+    if a == ZERO:
+        return ZERO
+    return "/", a, b
+
+
+def call(name, *args):
+    args = tuple(_wrap(i) for i in args)
+    if name in _FOLDABLE and all(is_const(i) for i in args):
+        return const(_FOLDABLE[name](*[i[1] for i in args]))
+    return ("call", name) + args
+
+
+def select(value, positive, negative):
+    value, positive, negative = _wrap(value), _wrap(positive), _wrap(negative)
+    if is_const(value):
+        return positive if value[1] >= 0 else negative
+    if positive == negative:
+        return positive
+    return "select", value, positive, negative
+
+
+def _children(node):
+    if node[0] in ("const", "attr", "time"):
+        return ()
+    if node[0] == "call":
+        return node[2:]
+    return node[1:]
+
+
+def _depends_on_time(node, memo):
+    if node not in memo:
+        memo[node] = node == TIME or any(_depends_on_time(i, memo) for i in _children(node))
+    return memo[node]
+
+
+def _cost(node):
+    """number of operations of a tree, calls count for more"""
+    if node[0] in ("const", "attr", "time"):
+        return 0
+    return (4 if node[0] == "call" else 1) + sum(_cost(i) for i in _children(node))
+
+
+def chain_statements(master, ik_ctl, targets, chain_index, chain_count, frame_rate, static=None):
+    """Build the expression trees driving the rotations of one chain.
+
+    Arguments:
+        master (str): name of the master controller.
+        ik_ctl (str): name of the first IK controller holding the chain multipliers.
+        targets (list of str): expression joints of the chain.
+        chain_index (int): index of the chain in the setup.
+        chain_count (int): number of chains in the setup.
+        frame_rate (float): scene frame rate.
+        static (dict): plug -> value of the attributes which can not change
+            (locked and not connected), they are folded as constants. The axes are
+            only dropped when their amp is static at zero, see plan_master().
+
+    Returns:
+        list of tuple: (target plug, expression tree), rotations fixed at zero are dropped.
+    """
+    static = static or {}
+    joint_count = len(targets)
+
+    def plug(node, name):
+        _plug = "{}.{}".format(node, name)
+        return const(static[_plug]) if _plug in static else attr(_plug)
+
+    sine_mult = plug(ik_ctl, "sine_multiplier_All")
+    strength = plug(master, "strength")
+
+    statements = []
+    axes = {}
+    for axis in "XYZ":
+        def master_attr(name):
+            return plug(master, name + axis)
+
+        loop_per_second = master_attr("loop_per_second_")
+        freq = mul(loop_per_second, tau, TIME)
+        falloff = mul(master_attr("falloff"), joint_count, 0.1)
+        val = mul(master_attr("amp"), 0.1, add(div(falloff, 5), 1))
+        bias_freq = mul(master_attr("amp_bias_LPS_mult"), freq, 0.01 if axis == "Z" else 1.0)
+        bias = mul(master_attr("amp_bias_range"),
+                   call("noise", add(bias_freq, mul(chain_index + 1, master_attr("amp_bias_noise")))))
+        offset_rdm = master_attr("offset_rdm")
+        # "offset_frame / frame_rate * freq / time" in the original expression, time cancels out
+        phase = add(freq,
+                    mul(offset_rdm, call("noise", add(offset_rdm, chain_index))),
+                    mul(master_attr("offset_noise"), (chain_index + 1) / float(chain_count)),
+                    mul(master_attr("offset_frame"), 1.0 / frame_rate, loop_per_second, tau))
+        axes[axis] = dict(falloff=falloff,
+                          val=val,
+                          bias=add(1, bias),
+                          delay=mul(master_attr("delay"), -7),
+                          phase=phase,
+                          amp_offset=master_attr("amp_offset"),
+                          plus=master_attr("amp_positive_mult"),
+                          minus=master_attr("amp_negative_mult"))
+
+    for jnt_index, target in enumerate(targets):
+        index = jnt_index + 1
+        fk_mult = plug(ik_ctl, "FK_multiplier_{}".format(jnt_index))
+        for axis in "XYZ":
+            a = axes[axis]
+            weight = div(sub(index, call("clamp", 0, index, a["falloff"])), joint_count * 2.0)
+            sine = mul(call("sin", add(a["phase"], mul(a["delay"], weight))),
+                       100,
+                       a["bias"],
+                       weight,
+                       1.0 - (index + 1) / (joint_count * 2.0),
+                       a["val"],
+                       strength)
+            if axis == "Z" and index == 1:
+                sine = add(sine, a["amp_offset"])
+            rotation = select(sine, mul(sine, a["plus"]), mul(sine, a["minus"]))
+            if axis != "Z" and index == 1:
+                rotation = add(rotation, a["amp_offset"])
+            rotation = mul(rotation, sine_mult, fk_mult)
+            if rotation != ZERO:
+                statements.append(("{}.rotate{}".format(target, axis), rotation))
+    return statements
+
+
+def hoist_invariants(statements, node, prefix="sine_invariant_"):
+    """Move the time invariant sub-expressions of the statements to attributes of a node.
+
+    Every maximal sub-expression which does not depend on the time and costs more
+    than a single operation becomes an attribute, the invariant factors of a
+    product / terms of a sum are grouped first so a joint amplitude is one attribute.
+
+    Arguments:
+        statements (list of tuple): (target plug, expression tree)
+        node (str): node holding the attributes, the first IK controller of the chain.
+        prefix (str): prefix of the attribute names, followed by their index.
+
+    Returns:
+        tuple: (invariant statements, statements reading their attributes)
+    """
+    memo = {}
+    hoisted = {}
+    invariants = []
+
+    def invariant(tree):
+        if tree not in hoisted:
+            plug = "{}.{}{}".format(node, prefix, len(invariants))
+            invariants.append((plug, tree))
+            hoisted[tree] = attr(plug)
+        return hoisted[tree]
+
+    def visit(tree):
+        if not _depends_on_time(tree, memo):
+            return invariant(tree) if _cost(tree) > 1 else tree
+        kind = tree[0]
+        if kind == "time":
+            return tree
+        if kind == "call":
+            return tree[:2] + tuple(visit(i) for i in tree[2:])
+        children = tree[1:]
+        if kind in ("+", "*"):
+            fixed = [i for i in children if not _depends_on_time(i, memo)]
+            if len(fixed) > 1 and len(fixed) < len(children) and _cost(tree[:1] + tuple(fixed)) > 1:
+                children = [invariant((kind,) + tuple(fixed))] + [i for i in children if i not in fixed]
+                return (kind,) + tuple(visit(i) for i in children)
+        return (kind,) + tuple(visit(i) for i in children)
+
+    statements = [(target, visit(tree)) for target, tree in statements]
+    return invariants, statements
+
+
+def _format_number(value):
+    text = repr(float(value))
+    if "e" in text or "inf" in text or "nan" in text:
+        text = "{:.17f}".format(value).rstrip("0")
+    return "({})".format(text) if value < 0 else text
+
+
+def compile_mel(statements):
+    """Compile expression trees to MEL with every repeated sub-expression shared.
+
+    Arguments:
+        statements (list of tuple): (target plug, expression tree)
+
+    Returns:
+        str: MEL expression
+    """
+    counts = {}
+
+    def count(node):
+        counts[node] = counts.get(node, 0) + 1
+        if counts[node] == 1:
+            for child in _children(node):
+                count(child)
+
+    for _, tree in statements:
+        count(tree)
+
+    names = {}
+    declarations = []
+
+    def declare(node, text):
+        if node[0] == "attr":
+            base = "$" + node[1].split(".")[-1]
+        else:
+            base = "$t{}".format(len(declarations))
+        name = base
+        while name in names.values():
+            name = "{}_{}".format(base, len(declarations))
+        names[node] = name
+        declarations.append("float {} = {};".format(name, text))
+        return name
+
+    def emit(node):
+        if node in names:
+            return names[node]
+        kind = node[0]
+        if kind == "const":
+            return _format_number(node[1])
+        if kind == "time":
+            return "time"
+        if kind == "attr":
+            return declare(node, node[1])
+        if kind == "call":
+            text = "{}({})".format(node[1], ", ".join(emit(i) for i in node[2:]))
+        elif kind == "select":
+            text = "({0} >= 0 ? {1} : {2})".format(*[emit(i) for i in node[1:]])
+        else:
+            text = "(" + " {} ".format(kind).join(emit(i) for i in node[1:]) + ")"
+        if counts.get(node, 0) > 1:
+            return declare(node, text)
+        return text
+
+    assignments = ["{} = {};".format(target, emit(tree)) for target, tree in statements]
+    return "\n".join(declarations + assignments) + "\n"
+
+
+def chain_expression(master, ik_ctl, targets, chain_index, chain_count, frame_rate, static=None):
+    """Get the optimized MEL expressions of one chain, see chain_statements() for the arguments
+
+    Returns:
+        tuple: (attributes to add on the ik_ctl, MEL computing them or "", MEL run every frame)
+    """
+    statements = chain_statements(master, ik_ctl, targets, chain_index, chain_count, frame_rate, static)
+    invariants, statements = hoist_invariants(statements, ik_ctl)
+    attrs = [plug.split(".", 1)[1] for plug, _ in invariants]
+    return attrs, compile_mel(invariants) if invariants else "", compile_mel(statements)
@@ -0,0 +1,211 @@
+"""
+Sparse keyframe fitting of sampled channels
+
+A channel is keyed with broken Hermite tangents, which is how Maya interpolates
+keys with fixed, non weighted tangents. The first keys go at the analytically
+known extrema and zero crossings of the sine (see sine_key_frames()). Each key
+gets the exact one-sided slopes of the channel, so the kinks of the
+positive / negative amplitude multipliers are kept. Segments whose error
+against the sampled channel exceeds the tolerance are subdivided at their worst
+sample until every channel fits.
+"""
+from math import pi
+
+import numpy as np
+
+# step of the one-sided finite differences giving the key slopes, in frames
+SLOPE_STEP = 1e-3
+
+
+def hermite(frames, key_frames, values, in_slopes, out_slopes):
+    """Evaluate a keyed channel like a Maya anim curve with fixed non weighted tangents.
+
+    Arguments:
+        frames (array_like): frames to evaluate.
+        key_frames (array_like): sorted key frames.
+        values (array_like): key values.
+        in_slopes (array_like): in tangent slopes per frame.
+        out_slopes (array_like): out tangent slopes per frame.
+
+    Returns:
+        ndarray: channel values, constant outside of the keyed range
+    """
+    frames = np.asarray(frames, dtype=np.float64)
+    key_frames = np.asarray(key_frames, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    if key_frames.size == 1:
+        return np.full(frames.shape, values[0])
+    frames = np.clip(frames, key_frames[0], key_frames[-1])
+    segment = np.clip(np.searchsorted(key_frames, frames, side="right") - 1, 0, key_frames.size - 2)
+    x0, x1 = key_frames[segment], key_frames[segment + 1]
+    length = x1 - x0
+    s = (frames - x0) / length
+    s2, s3 = s * s, s * s * s
+    return ((2 * s3 - 3 * s2 + 1) * values[segment]
+            + (s3 - 2 * s2 + s) * length * np.asarray(out_slopes, dtype=np.float64)[segment]
+            + (-2 * s3 + 3 * s2) * values[segment + 1]
+            + (s3 - s2) * length * np.asarray(in_slopes, dtype=np.float64)[segment + 1])
+
+
+def sine_key_frames(angular_speed, offset, start, end, frame_rate):
+    """Get the frames where a sine phase reaches a multiple of pi / 2.
+
+    Those are the zero crossings and the extrema of the sine, where its in and out
+    tangents are known exactly.
+
+    Arguments:
+        angular_speed (float): phase speed in radians per second.
+        offset (float): phase at time zero in radians.
+        start (float): first frame of the range.
+        end (float): last frame of the range.
+        frame_rate (float): scene frame rate.
+
+    Returns:
+        ndarray: sorted frames inside [start, end]
+    """
+    if not angular_speed:
+        return np.zeros(0)
+    quarter = pi / 2.0
+    bounds = sorted([(start / float(frame_rate) * angular_speed + offset) / quarter,
+                     (end / float(frame_rate) * angular_speed + offset) / quarter])
+    steps = np.arange(np.ceil(bounds[0]), np.floor(bounds[1]) + 1)
+    return np.sort((steps * quarter - offset) / angular_speed * frame_rate)
+
+
+def _sample(sample, frames, grid):
+    """Sample frames together with the check grid, in time order so angles unwrap consistently"""
+    merged, inverse = np.unique(np.concatenate([grid, frames]), return_inverse=True)
+    return sample(merged)[:, inverse[grid.size:]]
+
+
+def fit_channels(sample, start, end, candidates=None, tolerance=0.01, check_step=0.5, max_passes=24):
+    """Fit sparse keys on sampled channels.
+
+    Arguments:
+        sample (callable): frames (ndarray) -> channel values (channels, frames).
+        start (float): first frame to key.
+        end (float): last frame to key.
+        candidates (list of array_like): initial key frames of each channel,
+            the range ends are always keyed.
+        tolerance (float): max absolute error of the fitted channels.
+        check_step (float): spacing in frames of the samples the error is measured on.
+        max_passes (int): max subdivision passes.
+
+    Returns:
+        list of tuple: (frames, values, in_slopes, out_slopes) of each channel
+    """
+    grid = np.unique(np.append(np.arange(start, end, check_step), end))
+    reference = sample(grid)
+    channel_count = reference.shape[0]
+    if candidates is None:
+        candidates = [()] * channel_count
+
+    keys = []
+    for channel, frames in enumerate(candidates):
+        frames = np.asarray(frames, dtype=np.float64)
+        frames = frames[(frames > start) & (frames < end)]
+        # faster than the check grid, the sine is better keyed on the grid itself
+        if frames.size > grid.size:
+            frames = grid
+        keys.append(np.unique(np.concatenate([[start, end], frames])))
+
+    known = {}
+    for iteration in range(max_passes + 1):
+        needed = np.unique(np.concatenate(keys))
+        needed = needed[[i not in known for i in needed.tolist()]]
+        if needed.size:
+            h = SLOPE_STEP
+            offsets = np.array([0.0, -h, -2 * h, h, 2 * h])
+            samples = _sample(sample, (needed[np.newaxis] + offsets[:, np.newaxis]).reshape(-1), grid)
+            v, m1, m2, p1, p2 = samples.reshape(channel_count, offsets.size, needed.size).transpose(1, 0, 2)
+            # second order one-sided differences
+            in_slopes = (3 * v - 4 * m1 + m2) / (2 * h)
+            out_slopes = (-3 * v + 4 * p1 - p2) / (2 * h)
+            for i, frame in enumerate(needed.tolist()):
+                known[frame] = (v[:, i], in_slopes[:, i], out_slopes[:, i])
+        if iteration == max_passes:
+            break
+
+        refined = False
+        for channel in range(channel_count):
+            frames = keys[channel]
+            data = [known[i] for i in frames.tolist()]
+            fitted = hermite(grid, frames,
+                             [i[0][channel] for i in data],
+                             [i[1][channel] for i in data],
+                             [i[2][channel] for i in data])
+            error = np.abs(fitted - reference[channel])
+            bad = np.nonzero(error > tolerance)[0]
+            if not bad.size:
+                continue
+            # the worst sample of every failing segment becomes a key
+            bad = bad[np.argsort(-error[bad], kind="stable")]
+            segments = np.searchsorted(frames, grid[bad], side="right")
+            _, first = np.unique(segments, return_index=True)
+            keys[channel] = np.unique(np.concatenate([frames, grid[bad[first]]]))
+            refined = True
+        if not refined:
+            break
+
+    result = []
+    for channel, frames in enumerate(keys):
+        data = [known[i] for i in frames.tolist()]
+        result.append((frames,
+                       np.array([i[0][channel] for i in data]),
+                       np.array([i[1][channel] for i in data]),
+                       np.array([i[2][channel] for i in data])))
+    return result
+
+
+def reduce_keys(frames, values, in_slopes=None, out_slopes=None, tolerance=0.01, check_step=0.5):
+    """Drop the keys of a channel which are not needed to stay within tolerance of it.
+
+    The kept keys are a subset of the given ones, top-down: starting from the range
+    ends, the key nearest to the worst sample of every failing segment is restored
+    until the curve fits.
+
+    Arguments:
+        frames (array_like): sorted key frames.
+        values (array_like): key values.
+        in_slopes (array_like): in tangent slopes per frame, estimated from the keys if None.
+        out_slopes (array_like): out tangent slopes per frame, same as in_slopes if None.
+        tolerance (float): max absolute error against the given curve.
+        check_step (float): spacing in frames of the samples the error is measured on.
+
+    Returns:
+        tuple: (frames, values, in_slopes, out_slopes) of the kept keys
+    """
+    frames = np.asarray(frames, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    if frames.size < 3:
+        slopes = np.zeros(frames.size) if in_slopes is None else np.asarray(in_slopes, dtype=np.float64)
+        return frames, values, slopes, slopes if out_slopes is None else np.asarray(out_slopes, dtype=np.float64)
+    if in_slopes is None:
+        in_slopes = np.gradient(values, frames)
+    in_slopes = np.asarray(in_slopes, dtype=np.float64)
+    out_slopes = in_slopes if out_slopes is None else np.asarray(out_slopes, dtype=np.float64)
+
+    grid = np.union1d(frames, np.arange(frames[0], frames[-1], check_step))
+    reference = hermite(grid, frames, values, in_slopes, out_slopes)
+    keep = np.zeros(frames.size, dtype=bool)
+    keep[[0, -1]] = True
+    while True:
+        kept = np.nonzero(keep)[0]
+        error = np.abs(hermite(grid, frames[kept], values[kept], in_slopes[kept], out_slopes[kept]) - reference)
+        bad = np.nonzero(error > tolerance)[0]
+        if not bad.size:
+            break
+        bad = bad[np.argsort(-error[bad], kind="stable")]
+        segments = np.searchsorted(frames[kept], grid[bad], side="right")
+        _, first = np.unique(segments, return_index=True)
+        worst = grid[bad[first]]
+        # nearest key not kept yet, a failing segment always holds one
+        after = np.clip(np.searchsorted(frames, worst), 1, frames.size - 1)
+        before = after - 1
+        nearest = np.where(worst - frames[before] <= frames[after] - worst, before, after)
+        other = np.where(nearest == before, after, before)
+        count = keep.sum()
+        keep[np.where(keep[nearest], other, nearest)] = True
+        if keep.sum() == count:
+            break
+    return frames[keep], values[keep], in_slopes[keep], out_slopes[keep]
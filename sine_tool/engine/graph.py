@@ -0,0 +1,301 @@
+"""
+Backend agnostic node network description of the sine motion
+
+The expression trees of engine.expression are lowered to a graph of standard Maya
+utility nodes (plusMinusAverage, multDoubleLinear, multiplyDivide, clamp, condition,
+unitConversion, eulerToQuat, animCurveUU). The graph is plain data : it can be
+serialized, built in a scene by scene.cmds_helper.apply_graph() or run by evaluate_graph(), a
+pure-Python stand-in of the node behaviours used to verify a graph without Maya.
+
+sin(x) is the outputQuatX of an eulerToQuat node rotated by 2x on X.
+noise(x) is rebuilt exactly from its lattice : cyclic animCurveUU lookups give the
+position inside the lattice cell and the gradients of the two cell corners.
+"""
+import math
+
+from .expression import add, call, chain_statements, div, is_const, mul, select, sub
+from .noise import LATTICE_SIZE, gradients
+
+# cyclic lookup curves used to rebuild the noise : name -> (tangent, keys)
+NOISE_FRACTION = "noise_fraction"
+NOISE_GRADIENT = "noise_gradient"
+NOISE_GRADIENT_NEXT = "noise_gradient_next"
+
+
+def lookup(table, value):
+    return "lookup", table, value
+
+
+def _lookup_tables():
+    table = [float(i) for i in gradients()]
+    table.append(table[0])
+    return {
+        NOISE_FRACTION: ("linear", [(0.0, 0.0), (1.0, 1.0)]),
+        NOISE_GRADIENT: ("step", [(float(i), table[i]) for i in range(LATTICE_SIZE + 1)]),
+        NOISE_GRADIENT_NEXT: ("step", [(float(i), table[(i + 1) % LATTICE_SIZE]) for i in range(LATTICE_SIZE + 1)]),
+    }
+
+
+def expand_noise(tree):
+    """Rebuild every noise() call of a tree from lattice lookups"""
+    kind = tree[0]
+    if kind in ("const", "attr", "time"):
+        return tree
+    if kind == "call":
+        args = [expand_noise(i) for i in tree[2:]]
+        if tree[1] != "noise":
+            return call(tree[1], *args)
+        position = args[0]
+        r = lookup(NOISE_FRACTION, position)
+        s = mul(r, r, sub(3, mul(2, r)))
+        return add(mul(r, sub(1, s), lookup(NOISE_GRADIENT, position)),
+                   mul(s, sub(r, 1), lookup(NOISE_GRADIENT_NEXT, position)))
+    args = [expand_noise(i) for i in tree[1:]]
+    if kind == "+":
+        return add(*args)
+    if kind == "*":
+        return mul(*args)
+    if kind == "-":
+        return sub(*args)
+    if kind == "/":
+        return div(*args)
+    if kind == "select":
+        return select(*args)
+    return (kind,) + tuple(args)
+
+
+class Graph(object):
+    """
+    Node network description
+        nodes : list of (name, type)
+        values : list of (plug, value) set on the node inputs
+        connections : list of (source plug, destination plug)
+        curves : anim curve name -> (tangent, [(input, output), ...]), cycled on both sides
+        outputs : plugs driven by the graph
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.nodes = []
+        self.values = []
+        self.connections = []
+        self.curves = {}
+        self.outputs = []
+
+    def add_node(self, node_type):
+        name = "{}_{}{}".format(self.prefix, node_type, len(self.nodes))
+        self.nodes.append((name, node_type))
+        return name
+
+    def feed(self, source, plug):
+        """connect a plug, or set it if the source is a constant"""
+        if isinstance(source, float):
+            self.values.append((plug, source))
+        else:
+            self.connections.append((source, plug))
+
+    def to_dict(self):
+        return dict(prefix=self.prefix,
+                    nodes=self.nodes,
+                    values=self.values,
+                    connections=self.connections,
+                    curves=self.curves,
+                    outputs=self.outputs)
+
+    @classmethod
+    def from_dict(cls, data):
+        graph = cls(data["prefix"])
+        graph.nodes = [tuple(i) for i in data["nodes"]]
+        graph.values = [tuple(i) for i in data["values"]]
+        graph.connections = [tuple(i) for i in data["connections"]]
+        graph.curves = dict((k, (v[0], [tuple(i) for i in v[1]])) for k, v in data["curves"].items())
+        graph.outputs = list(data["outputs"])
+        return graph
+
+
+def lower(statements, prefix, frame_rate):
+    """Lower expression trees to a node network.
+
+    Arguments:
+        statements (list of tuple): (target plug, expression tree), see expression.chain_statements()
+        prefix (str): prefix of the node names.
+        frame_rate (float): scene frame rate, time1.outTime is read in frames.
+
+    Returns:
+        Graph: the node network
+    """
+    graph = Graph(prefix)
+    tables = _lookup_tables()
+    memo = {}
+
+    def node_output(tree):
+        if tree in memo:
+            return memo[tree]
+        kind = tree[0]
+        if is_const(tree):
+            return tree[1]
+        if kind == "attr":
+            return tree[1]
+        if kind == "time":
+            node = graph.add_node("multDoubleLinear")
+            graph.feed("time1.outTime", node + ".input1")
+            graph.feed(1.0 / frame_rate, node + ".input2")
+            out = node + ".output"
+        elif kind in ("+", "-"):
+            node = graph.add_node("plusMinusAverage")
+            graph.feed(1.0 if kind == "+" else 2.0, node + ".operation")
+            for i, arg in enumerate(tree[1:]):
+                graph.feed(node_output(arg), "{}.input1D[{}]".format(node, i))
+            out = node + ".output1D"
+        elif kind == "*":
+            out = node_output(tree[1])
+            for arg in tree[2:]:
+                node = graph.add_node("multDoubleLinear")
+                graph.feed(out, node + ".input1")
+                graph.feed(node_output(arg), node + ".input2")
+                out = node + ".output"
+        elif kind == "/":
+            node = graph.add_node("multiplyDivide")
+            graph.feed(2.0, node + ".operation")
+            graph.feed(node_output(tree[1]), node + ".input1X")
+            graph.feed(node_output(tree[2]), node + ".input2X")
+            out = node + ".outputX"
+        elif kind == "select":
+            node = graph.add_node("condition")
+            graph.feed(3.0, node + ".operation")
+            graph.feed(node_output(tree[1]), node + ".firstTerm")
+            graph.feed(0.0, node + ".secondTerm")
+            graph.feed(node_output(tree[2]), node + ".colorIfTrueR")
+            graph.feed(node_output(tree[3]), node + ".colorIfFalseR")
+            out = node + ".outColorR"
+        elif kind == "lookup":
+            node = graph.add_node("animCurveUU")
+            graph.curves[node] = tables[tree[1]]
+            graph.feed(node_output(tree[2]), node + ".input")
+            out = node + ".output"
+        elif kind == "call" and tree[1] == "sin":
+            conversion = graph.add_node("unitConversion")
+            graph.feed(node_output(tree[2]), conversion + ".input")
+            graph.feed(2.0, conversion + ".conversionFactor")
+            node = graph.add_node("eulerToQuat")
+            graph.feed(conversion + ".output", node + ".inputRotateX")
+            out = node + ".outputQuatX"
+        elif kind == "call" and tree[1] == "clamp":
+            node = graph.add_node("clamp")
+            graph.feed(node_output(tree[2]), node + ".minR")
+            graph.feed(node_output(tree[3]), node + ".maxR")
+            graph.feed(node_output(tree[4]), node + ".inputR")
+            out = node + ".outputR"
+        else:
+            raise ValueError("no node for {}".format(tree[:2]))
+        memo[tree] = out
+        return out
+
+    for target, tree in statements:
+        graph.feed(node_output(expand_noise(tree)), target)
+        graph.outputs.append(target)
+    return graph
+
+
+def chain_graph(master, ik_ctl, targets, chain_index, chain_count, frame_rate, static=None, prefix=None):
+    """Get the node network of one chain, see expression.chain_statements() for the arguments"""
+    statements = chain_statements(master, ik_ctl, targets, chain_index, chain_count, frame_rate, static)
+    return lower(statements, prefix or targets[0] + "_net", frame_rate)
+
+
+# stand-in evaluation
+# ///////////////////////////////////////////////////////////////
+_DEFAULTS = {
+    "multiplyDivide": {"operation": 1.0, "input1X": 0.0, "input2X": 1.0},
+    "plusMinusAverage": {"operation": 1.0},
+    "condition": {"operation": 0.0, "firstTerm": 0.0, "secondTerm": 0.0,
+                  "colorIfTrueR": 0.0, "colorIfFalseR": 1.0},
+    "unitConversion": {"conversionFactor": 1.0},
+}
+
+
+def _curve_value(curve, x):
+    tangent, keys = curve
+    start, end = keys[0][0], keys[-1][0]
+    x = start + math.fmod(x - start, end - start)
+    if x < start:
+        x += end - start
+    for (x0, y0), (x1, y1) in zip(keys[:-1], keys[1:]):
+        if x0 <= x < x1:
+            if tangent == "step":
+                return y0
+            return y0 + (y1 - y0) * (x - x0) / (x1 - x0)
+    return keys[-1][1]
+
+
+def evaluate_graph(graph, inputs):
+    """Evaluate a node network the way Maya would.
+
+    Arguments:
+        graph (Graph): the node network.
+        inputs (dict): plug -> value of every plug read outside of the graph,
+            "time1.outTime" is the current frame.
+
+    Returns:
+        dict: output plug -> value
+    """
+    sources = dict((dst, src) for src, dst in graph.connections)
+    values = dict(graph.values)
+    types = dict(graph.nodes)
+    cache = {}
+    multi = {}
+    for plug in list(sources) + list(values):
+        if plug.endswith("]"):
+            name, index = plug[:-1].split("[")
+            multi.setdefault(name, []).append((int(index), plug))
+
+    def read(plug):
+        if plug in sources:
+            return output(sources[plug])
+        if plug in values:
+            return values[plug]
+        node, attr_name = plug.split(".", 1)
+        return _DEFAULTS.get(types.get(node), {}).get(attr_name, 0.0)
+
+    def read_multi(node, attr_name):
+        return [read(plug) for _, plug in sorted(multi.get("{}.{}".format(node, attr_name), []))]
+
+    def output(plug):
+        node = plug.split(".", 1)[0]
+        if node not in types:
+            return inputs[plug]
+        if node in cache:
+            return cache[node]
+        node_type = types[node]
+        get = lambda name: read("{}.{}".format(node, name))
+        if node_type == "multDoubleLinear":
+            value = get("input1") * get("input2")
+        elif node_type == "multiplyDivide":
+            a, b, operation = get("input1X"), get("input2X"), int(get("operation"))
+            value = a * b if operation == 1 else a / b if operation == 2 else a ** b if operation == 3 else a
+        elif node_type == "plusMinusAverage":
+            items, operation = read_multi(node, "input1D"), int(get("operation"))
+            if operation == 1:
+                value = sum(items)
+            elif operation == 2:
+                value = items[0] - sum(items[1:]) if items else 0.0
+            else:
+                value = sum(items) / len(items) if items else 0.0
+        elif node_type == "condition":
+            a, b, operation = get("firstTerm"), get("secondTerm"), int(get("operation"))
+            test = [a == b, a != b, a > b, a >= b, a < b, a <= b][operation]
+            value = get("colorIfTrueR") if test else get("colorIfFalseR")
+        elif node_type == "clamp":
+            value = min(max(get("inputR"), get("minR")), get("maxR"))
+        elif node_type == "unitConversion":
+            value = get("input") * get("conversionFactor")
+        elif node_type == "eulerToQuat":
+            value = math.sin(get("inputRotateX") / 2.0)
+        elif node_type == "animCurveUU":
+            value = _curve_value(graph.curves[node], get("input"))
+        else:
+            raise ValueError("no stand-in for {}".format(node_type))
+        cache[node] = value
+        return value
+
+    return dict((plug, read(plug)) for plug in graph.outputs)
@@ -0,0 +1,238 @@
+"""
+Array based 1D gradient noise reproducing the MEL noise() calls of the sine expression
+
+Maya's noise() is a 1D Perlin gradient noise: zero on every integer lattice point,
+and inside a lattice cell a smoothstep blend of the two gradient ramps of its corners.
+Only the gradient of each lattice point is needed to reproduce it, they are stored
+in a table of LATTICE_SIZE values which is built once per process.
+
+The table has to be calibrated against Maya once per user: calibrate_from_maya()
+samples the real noise(), solves the gradients and saves them to user_tables_file().
+No calibrated table is shipped with the package, TABLES_FILE is only read when the
+user has none, for a studio wide table copied next to this module. A calibrated
+table is only accepted if it reproduces every Maya sample within TOLERANCE, so
+offline results match Maya within TOLERANCE for any input.
+
+Without a calibrated table the gradients come from a fixed seed, a noise with the
+same character as Maya's but not the same values. The backends and bakes which do
+not run MEL noise() call require_calibration() whenever their noise terms can be
+non-zero: it calibrates the table inside Maya and refuses to run outside of it.
+"""
+import hashlib
+import json
+import os
+import random
+
+import numpy as np
+
+LATTICE_SIZE = 0x100
+TOLERANCE = 1e-5
+TABLES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "noise_tables.json").replace("\\", "/")
+# environment variable overriding user_tables_file()
+TABLES_ENV = "SINE_TOOL_NOISE_TABLES"
+
+_MASK = LATTICE_SIZE - 1
+_SEED = 0x5e1e
+# lattice cell positions sampled during the calibration
+_SAMPLE_POSITIONS = (0.25, 0.5, 0.75)
+
+_gradients = None
+_calibrated = False
+_table_hash = None
+
+
+def _default_gradients():
+    rand = random.Random(_SEED)
+    gradients = [rand.uniform(-2.0, 2.0) for _ in range(LATTICE_SIZE)]
+    permutation = list(range(LATTICE_SIZE))
+    rand.shuffle(permutation)
+    return np.array([gradients[i] for i in permutation], dtype=np.float64)
+
+
+def user_tables_file():
+    """Get the json file holding the calibrated gradient table of the user
+
+    The TABLES_ENV environment variable, or sine_tool/noise_tables.json in MAYA_APP_DIR
+    (the home folder outside of Maya), the package folder may be read only.
+    """
+    path = os.environ.get(TABLES_ENV)
+    if not path:
+        base = os.environ.get("MAYA_APP_DIR") or os.path.expanduser("~")
+        path = os.path.join(base, "sine_tool", "noise_tables.json")
+    return path.replace("\\", "/")
+
+
+def gradients():
+    """Get the gradient table, building it on the first call
+
+    Returns:
+        ndarray: gradient of each lattice point, shape (LATTICE_SIZE,)
+    """
+    global _gradients
+    if _gradients is None:
+        for path in (user_tables_file(), TABLES_FILE):
+            if os.path.isfile(path):
+                load_tables(path)
+                break
+        else:
+            _gradients = _default_gradients()
+    return _gradients
+
+
+def table_hash():
+    """Get the hash of the gradient table, part of every cache key, see cache.state_hash()
+
+    Returns:
+        str: hex digest
+    """
+    global _table_hash
+    if _table_hash is None:
+        _table_hash = hashlib.sha1(np.ascontiguousarray(gradients(), dtype="<f8").tobytes()).hexdigest()
+    return _table_hash
+
+
+def is_calibrated():
+    """True if the gradient table was calibrated against Maya noise()"""
+    gradients()
+    return _calibrated
+
+
+def set_gradients(values, calibrated=False):
+    """Replace the gradient table of the current process
+
+    Arguments:
+        values (array_like): LATTICE_SIZE gradient values.
+        calibrated (bool): the values reproduce Maya noise() within TOLERANCE.
+    """
+    global _gradients, _calibrated, _table_hash
+    values = np.asarray(values, dtype=np.float64).reshape(-1)
+    if values.size != LATTICE_SIZE:
+        raise ValueError("expected {} gradients, got {}".format(LATTICE_SIZE, values.size))
+    _gradients = values
+    _calibrated = calibrated
+    _table_hash = None
+
+
+def load_tables(path=TABLES_FILE):
+    """Load a gradient table, it counts as calibrated if its recorded error is within TOLERANCE"""
+    with open(path) as f:
+        data = json.load(f)
+    error = data.get("max_error")
+    set_gradients(data["gradients"], calibrated=error is not None and error <= TOLERANCE)
+
+
+def save_tables(path=None, max_error=None):
+    """Save the gradient table, to user_tables_file() by default
+
+    Arguments:
+        path (str): json file.
+        max_error (float): error of the table against the Maya samples, None if it was not calibrated.
+    """
+    path = path or user_tables_file()
+    folder = os.path.dirname(path)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+    data = dict(lattice_size=LATTICE_SIZE, gradients=[float(i) for i in gradients()], max_error=max_error)
+    with open(path, "w") as f:
+        json.dump(data, f)
+    return path
+
+
+def _weights(r):
+    """Get the weights of the two corner gradients for positions r inside a cell"""
+    s = r * r * (3.0 - 2.0 * r)
+    return r * (1.0 - s), s * (r - 1.0)
+
+
+def noise(values, dtype=np.float64):
+    """Evaluate the noise for every element of an array.
+
+    Arguments:
+        values (array_like): Positions on the noise lattice.
+        dtype: floating point type of the computation.
+
+    Returns:
+        ndarray: noise values with the same shape as values.
+    """
+    values = np.asarray(values, dtype=dtype)
+    table = gradients().astype(dtype, copy=False)
+    lattice = np.floor(values)
+    r = values - lattice
+    b0 = lattice.astype(np.int64) & _MASK
+    w0, w1 = _weights(r)
+    return w0 * table[b0] + w1 * table[(b0 + 1) & _MASK]
+
+
+def solve_gradients(samples):
+    """Solve the gradient table from noise samples.
+
+    Arguments:
+        samples (dict): lattice position -> noise value, sampled with calibration_positions().
+
+    Returns:
+        tuple: gradients (ndarray), max absolute error of the table against the samples
+    """
+    positions = np.array(sorted(samples), dtype=np.float64)
+    values = np.array([samples[i] for i in sorted(samples)], dtype=np.float64)
+    lattice = np.floor(positions)
+    b0 = lattice.astype(np.int64) & _MASK
+    w0, w1 = _weights(positions - lattice)
+    system = np.zeros((positions.size, LATTICE_SIZE), dtype=np.float64)
+    rows = np.arange(positions.size)
+    system[rows, b0] += w0
+    system[rows, (b0 + 1) & _MASK] += w1
+    solved = np.linalg.lstsq(system, values, rcond=None)[0]
+    error = np.abs(system.dot(solved) - values).max()
+    return solved, error
+
+
+def calibration_positions():
+    """Get the positions to sample for calibrating the gradient table
+
+    Two lattice periods are sampled, the second one checks that the noise wraps
+    on LATTICE_SIZE like the table does.
+    """
+    return [float(i) + r for i in range(-LATTICE_SIZE, LATTICE_SIZE) for r in _SAMPLE_POSITIONS]
+
+
+def calibrate_from_maya(path=None):
+    """Sample MEL noise() inside Maya and store the solved gradient table.
+
+    Arguments:
+        path (str): json file to save the gradient table to, defaults to user_tables_file().
+
+    Returns:
+        float: max absolute error of the table against the Maya samples.
+    """
+    from maya import mel
+
+    samples = {}
+    for position in calibration_positions():
+        samples[position] = mel.eval("noise({!r})".format(position))
+    solved, error = solve_gradients(samples)
+    if error > TOLERANCE:
+        raise RuntimeError("noise calibration failed, error {} exceeds tolerance {}".format(error, TOLERANCE))
+    set_gradients(solved, calibrated=True)
+    save_tables(path, max_error=float(error))
+    return error
+
+
+def require_calibration(user):
+    """Make sure the gradient table reproduces Maya noise() before it is used in place of it.
+
+    Inside Maya a table which is not calibrated yet is calibrated and saved for the next sessions.
+
+    Arguments:
+        user (str): what needs the table, for the error message.
+
+    Raises:
+        RuntimeError: outside of Maya without a calibrated table, or if the calibration fails.
+    """
+    if is_calibrated():
+        return
+    try:
+        from maya import mel  # noqa
+    except ImportError:
+        raise RuntimeError("{} needs a noise table calibrated against Maya noise(), run "
+                           "sine_tool.engine.noise.calibrate_from_maya() once in Maya".format(user))
+    calibrate_from_maya()
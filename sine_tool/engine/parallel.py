@@ -0,0 +1,196 @@
+"""
+Process pool orchestration of the bakes
+
+A bake is split in jobs, one per setup and frame range. A job is plain picklable
+data: the setup description built by sine_tool.bake.BakeSetup.data() and the range
+to key, so it runs in any Python process with NumPy, Maya is not needed. Results
+are always returned in job order, whatever the worker which computed them, so
+the merged output does not depend on the number of processes.
+
+setup description :
+    params : name -> value, or (frames, values) for animated attributes
+    multipliers : (chains, joints) array, or (frames, (chains, joints, frames) array)
+    joint_counts, frame_rate, animated
+    slaves : list of dict (chain, joint, left, right, rotate_order, rotate_axis, joint_orient)
+    channel_count : number of channels of each slave
+    time_curve : (frames, source frames) samples remapping the time of the motion, optional
+    gradients : noise gradient table of the session, see sine_tool.engine.noise, optional
+Animated values are sampled once per frame and linearly interpolated in between.
+
+A job with a cache_dir reads and stores its keys in a sine_tool.engine.cache.DiskCache,
+keyed by the hash of the job, so the same setup baked over the same frames in
+another scene is not computed again.
+"""
+import multiprocessing
+from collections import deque
+
+import numpy as np
+
+from . import noise
+from .cache import DISK_CACHE_MB, DiskCache, state_hash
+from .channels import slave_channels
+from .evaluator import evaluate_remapped, phase_offsets
+from .fitting import fit_channels, reduce_keys, sine_key_frames
+from .params import AXES
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    # python 2 without the futures backport, jobs run in the current process, see _executor()
+    ProcessPoolExecutor = None
+
+
+def _interp(frames, samples, values):
+    """linear interpolation of values (..., samples) at frames, held outside of the samples"""
+    frames = np.clip(frames, samples[0], samples[-1])
+    index = np.clip(np.searchsorted(samples, frames, side="right") - 1, 0, len(samples) - 2)
+    weight = (frames - samples[index]) / (samples[index + 1] - samples[index])
+    return values[..., index] * (1.0 - weight) + values[..., index + 1] * weight
+
+
+def _value(value, frames):
+    if isinstance(value, tuple):
+        return _interp(frames, *value)
+    return value
+
+
+def sample_channels(data, frames):
+    """Get the values of every channel of a setup description, shape (channels, frames)"""
+    frames = np.asarray(frames, dtype=np.float64)
+    params = dict((name, _value(value, frames)) for name, value in data["params"].items())
+    rotations = evaluate_remapped(params, frames, data["joint_counts"], data.get("time_curve"),
+                                  frame_rate=data["frame_rate"])
+    multipliers = _value(data["multipliers"], frames)
+    if np.ndim(multipliers) == 2:
+        multipliers = multipliers[:, :, np.newaxis]
+    rotations = rotations * multipliers[:, :, np.newaxis]
+    values = []
+    for slave in data["slaves"]:
+        translate, rotate = slave_channels(rotations[slave["chain"], slave["joint"]],
+                                           slave["left"],
+                                           slave["right"],
+                                           slave["rotate_order"],
+                                           slave["rotate_axis"],
+                                           slave["joint_orient"])
+        values.extend([translate, rotate])
+    return np.concatenate(values)
+
+
+def key_candidates(data, start, end):
+    """Get the frames of the extrema and zero crossings of the sines driving each channel,
+    None when the motion is animated or retimed and can not be predicted"""
+    if data["animated"] or data.get("time_curve") is not None:
+        return None
+    params = data["params"]
+    speed, offsets = phase_offsets(params, data["joint_counts"], data["frame_rate"])
+    active = [i for i, axis in enumerate(AXES) if params["amp" + axis] and params["loop_per_second_" + axis]]
+    candidates = []
+    for slave in data["slaves"]:
+        frames = [sine_key_frames(speed[i], offsets[slave["chain"], slave["joint"], i], start, end,
+                                  data["frame_rate"])
+                  for i in active]
+        frames = np.unique(np.concatenate(frames)) if frames else np.zeros(0)
+        candidates.extend([frames] * data["channel_count"])
+    return candidates
+
+
+_KEY_FIELDS = ("frames", "values", "in_slopes", "out_slopes")
+
+
+def _pack_keys(keys):
+    return dict(("{}_{}".format(index, field), value)
+                for index, channel in enumerate(keys)
+                for field, value in zip(_KEY_FIELDS, channel) if value is not None)
+
+
+def _unpack_keys(arrays):
+    count = len([i for i in arrays if i.endswith("_frames")])
+    return [tuple(arrays.get("{}_{}".format(index, field)) for field in _KEY_FIELDS) for index in range(count)]
+
+
+def run_job(job):
+    """Compute the keys of one job.
+
+    Arguments:
+        job (dict): data (setup description), start, end, fit (bool, fitted sparse keys
+            or one key per frame), tolerance, budgets (reduction error budget of each channel or None),
+            cache_dir and cache_mb (DiskCache of the results, optional)
+
+    Returns:
+        list of tuple: (frames, values, in_slopes, out_slopes) of each channel, slopes are None for frame keys
+    """
+    if job.get("cache_dir"):
+        cache = DiskCache(job["cache_dir"], job.get("cache_mb") or DISK_CACHE_MB)
+        # salted by the engine version and the gradient table like every state_hash()
+        key = state_hash("bake", dict((k, v) for k, v in job.items() if k not in ("cache_dir", "cache_mb")))
+        arrays = cache.get(key)
+        if arrays is not None:
+            return _unpack_keys(arrays)
+        keys = _compute_job(job)
+        cache.put(key, _pack_keys(keys))
+        return keys
+    return _compute_job(job)
+
+
+def _compute_job(job):
+    data, start, end = job["data"], job["start"], job["end"]
+    if data.get("gradients") is not None and not np.array_equal(noise.gradients(), data["gradients"]):
+        # the workers evaluate the noise with the gradient table of the session
+        noise.set_gradients(data["gradients"])
+    if job["fit"]:
+        keys = fit_channels(lambda frames: sample_channels(data, frames),
+                            start, end,
+                            candidates=key_candidates(data, start, end),
+                            tolerance=job["tolerance"])
+    else:
+        frames = np.arange(start, end + 1, dtype=np.float64)
+        keys = [(frames, values, None, None) for values in sample_channels(data, frames)]
+    budgets = job.get("budgets") or [None] * len(keys)
+    return [reduce_keys(*channel, tolerance=budget) if budget is not None else channel
+            for channel, budget in zip(keys, budgets)]
+
+
+def _executor(processes, executable=None):
+    """the process pool, None when its workers can not be spawned (python 2 or python < 3.7)"""
+    if ProcessPoolExecutor is None or not hasattr(multiprocessing, "get_context"):
+        return None
+    # workers are spawned, forking a host application like Maya is not safe
+    context = multiprocessing.get_context("spawn")
+    if executable:
+        context.set_executable(executable)
+    try:
+        return ProcessPoolExecutor(max_workers=processes, mp_context=context)
+    except TypeError:
+        # mp_context is only accepted since python 3.7
+        return None
+
+
+def run_jobs(jobs, processes=None, executable=None):
+    """Run jobs over a process pool.
+
+    At most two jobs per process are in flight, so the memory held by finished
+    results waiting for their turn stays bounded.
+
+    Arguments:
+        jobs (iterable of dict): see run_job().
+        processes (int): worker count, defaults to the cpu count, 1 runs the jobs in the current process.
+        executable (str): Python interpreter of the workers, defaults to the current one.
+
+    Yields:
+        the result of each job, in job order
+    """
+    processes = processes or multiprocessing.cpu_count()
+    pool = _executor(processes, executable) if processes != 1 else None
+    if pool is None:
+        for job in jobs:
+            yield run_job(job)
+        return
+
+    with pool:
+        pending = deque()
+        for job in jobs:
+            pending.append(pool.submit(run_job, job))
+            if len(pending) >= processes * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
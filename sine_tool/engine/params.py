@@ -0,0 +1,36 @@
+"""
+Master controller parameters driving the sine motion, shared by every backend
+"""
+AXES = ("X", "Y", "Z")
+
+# per axis attributes of the master controller, the axis letter is appended to the name
+AXIS_ATTRS = ("loop_per_second_",
+              "amp", "amp_bias_range", "amp_bias_LPS_mult", "amp_bias_noise",
+              "offset_frame", "offset_noise", "offset_rdm",
+              "delay", "falloff",
+              "amp_offset", "amp_positive_mult", "amp_negative_mult")
+# per axis attributes scaling the noise() terms, the noise has no effect while they are zero
+NOISE_ATTRS = ("amp_bias_range", "offset_rdm")
+
+
+def default_params():
+    """Get the default values of the master controller attributes
+
+    Returns:
+        dict: attribute name -> default value, same defaults as SineSetupMain.create_master
+    """
+    params = {"strength": 1.0}
+    for axis in AXES:
+        for attr in AXIS_ATTRS:
+            params[attr + axis] = 1.0 if attr.endswith("_mult") and "_LPS" not in attr else 0.0
+    return params
+
+
+def param_names():
+    """Get the names of every master controller attribute used by the motion"""
+    return sorted(default_params())
+
+
+def noise_params():
+    """Get the names of the master controller attributes scaling the noise() terms"""
+    return [attr + axis for attr in NOISE_ATTRS for axis in AXES]
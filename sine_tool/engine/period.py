@@ -0,0 +1,77 @@
+"""
+Period detection of the sine motion
+
+Without the amplitude bias noise, every axis is a sine of loop_per_second_X/Y/Z
+loops per second shaped by constant per joint terms. When each loop rate is a
+rational number of loops per frame, the whole motion repeats exactly after the
+least common multiple of the per axis periods.
+"""
+from fractions import Fraction
+
+try:
+    from math import gcd
+except ImportError:
+    from fractions import gcd
+
+from .params import AXES, default_params
+
+# largest denominator accepted when reading a loop rate as a fraction
+MAX_DENOMINATOR = 1000
+# max difference between a loop rate and its fraction
+RATIONAL_TOLERANCE = 1e-9
+
+
+def _fraction(value):
+    fraction = Fraction(value).limit_denominator(MAX_DENOMINATOR)
+    if abs(float(fraction) - value) > RATIONAL_TOLERANCE:
+        return None
+    return fraction
+
+
+def _lcm(a, b):
+    """least common multiple of two positive fractions"""
+    numerator = a.numerator * b.numerator // gcd(a.numerator, b.numerator)
+    return Fraction(numerator, gcd(a.denominator, b.denominator))
+
+
+def axis_period(loop_per_second, frame_rate):
+    """Get the period of one axis.
+
+    Arguments:
+        loop_per_second (float): loop_per_second_ value of the axis.
+        frame_rate (float): scene frame rate.
+
+    Returns:
+        Fraction: period in frames, None if the loop rate is not rational
+    """
+    loops = _fraction(abs(float(loop_per_second)))
+    rate = _fraction(float(frame_rate))
+    if not loops or not rate:
+        return None
+    return rate / loops
+
+
+def common_period(params, frame_rate):
+    """Get the period of the whole motion.
+
+    Arguments:
+        params (dict): constant master controller values, see default_params().
+        frame_rate (float): scene frame rate.
+
+    Returns:
+        Fraction: period in frames, 0 for a still motion, None if the motion is not periodic
+    """
+    values = default_params()
+    values.update(params)
+    period = None
+    for axis in AXES:
+        if not values["amp" + axis] or not values["loop_per_second_" + axis]:
+            continue
+        # the bias noise is not periodic
+        if values["amp_bias_range" + axis]:
+            return None
+        current = axis_period(values["loop_per_second_" + axis], frame_rate)
+        if current is None:
+            return None
+        period = current if period is None else _lcm(period, current)
+    return Fraction(0) if period is None else period
@@ -0,0 +1,523 @@
+"""
+Build plan of the sine setups, computed without Maya and applied in a second phase
+
+plan_setup() computes every node of a setup from the slave joints world matrices
+and a small snapshot of the scene (sine_tool.scene.cmds_helper.scene_state()): names,
+types, parents, world matrices, attributes, connections, constraints, sets and the
+expression text. The plan is an ordered list of steps, plain data which can be
+serialized, diffed or inspected. It is built in a scene by
+sine_tool.scene.batch.apply_plan_batched(), helper.apply_plan() is the sequential
+reference build, one step after the other, see scene.cmds_helper.compare_appliers().
+
+steps : (op, fields)
+    node : name, type, parent, matrix (world, 16 floats), visibility, draw_style,
+           freeze (joint rotations moved to the joint orient)
+    control : name, parent, matrix, icon, color, w, h, d, po, see helper.create_ctl()
+    attr : node, name, flags (addAttr flags)
+    set_attr : plug, value
+    lock : plug, lock, keyable, channel_box
+    connect : source, destination
+    constraint : type, driver, driven, name, maintain_offset
+    ik_spline : handle, effector, curve, start, end
+    curve_controls : curve, parent, controls [(group, control, joint, size)], color, skin_cluster
+    controller : node, parent (controller tag parent, optional)
+    annotation : name, node, text, position
+    plugin : path
+    expression : name, text
+    graph : data (sine_tool.engine.graph.Graph.to_dict())
+    sets : name, members, mode (ensure, replace or new), parent (set holding it, optional)
+
+The controls of the spline IK are laid out at even lengths of the curve Maya fits
+on the joints, their names are planned and their positions solved when applied.
+"""
+import json
+import os
+
+from .expression import chain_expression
+from .params import noise_params, param_names
+
+# grp naming
+MASTER_GRP_NAME = "Sine_Grp"
+MASTER_CTRL_GRP_NAME = "Sine_MasterGrp"
+ELEMENT_Grp = "Sine_{_name}"
+FK_Grp = "Sine_{_name}_{_chain_index}_FK"
+SIK_Grp = "Sine_{_name}_{_chain_index}_SIK"
+SOLVER_NAME = "Sine_{_name}_solver"
+CACHE_READER_NAME = "Sine_{_name}_cacheReader"
+MAIN_SETS_NAME = "Sine_Main_Sets"
+MAIN_BAKE_SETS_NAME = "Sine_Main_Bake_Sets"
+
+PLUGIN_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          "plugins").replace("\\", "/")
+SOLVER_PLUGIN = PLUGIN_DIR + "/sine_solver.py"
+
+# backends driving the expression joints
+EXPRESSION_BACKEND = "expression"
+SOLVER_BACKEND = "solver"
+NETWORK_BACKEND = "network"
+BACKENDS = (EXPRESSION_BACKEND, SOLVER_BACKEND, NETWORK_BACKEND)
+
+# build backends applying the plans, see sine_tool.scene.cmds_helper
+PYMEL_BUILD = "pymel"
+CMDS_BUILD = "cmds"
+BUILD_BACKENDS = (PYMEL_BUILD, CMDS_BUILD)
+
+# bake modes of sine_tool.bake
+FRAME_BAKE = "frames"
+ANALYTIC_BAKE = "analytic"
+CYCLE_BAKE = "cyclic"
+BAKE_MODES = (FRAME_BAKE, ANALYTIC_BAKE, CYCLE_BAKE)
+
+# attributes of the master controller, in channel box order
+MASTER_ATTRS = ["Sine_All",
+                "fk_vis", "ik_vis", "annotation_vis", "roll", "twist",
+                "strength"]
+for _axis in "XYZ":
+    MASTER_ATTRS += ["parameter_" + _axis, "loop_per_second_" + _axis,
+                     "amp" + _axis, "amp_bias_range" + _axis, "amp_bias_LPS_mult" + _axis,
+                     "amp_bias_noise" + _axis,
+                     "offset_frame" + _axis, "offset_noise" + _axis, "offset_rdm" + _axis,
+                     "delay" + _axis, "falloff" + _axis,
+                     "amp_offset" + _axis, "amp_positive_mult" + _axis, "amp_negative_mult" + _axis]
+del _axis
+# master attributes scaling the noise() terms, fixed at zero when a setup is built without noise
+NOISE_ATTRS = noise_params()
+
+IDENTITY = [1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0]
+
+
+def alphabet_index(index):
+    alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"  # noqa
+    loop = alphabet[int(index / 26)] if int(index / 26) > 0 else ""
+    return loop + alphabet[int(index % 26)]
+
+
+def master_attr_flags(attr):
+    """addAttr flags of a master controller attribute"""
+    if attr == "strength":
+        return dict(at='double', dv=1, keyable=True)
+    elif "_vis" in attr:
+        return dict(at='bool', dv=1, min=0, max=1, keyable=True)
+    elif "_mult" in attr and "_LPS" not in attr:
+        return dict(at='double', dv=1, keyable=True)
+    elif attr.startswith("par") or attr == "Sine_All":
+        return dict(at='enum', en="----------:", keyable=True)
+    elif "_range" in attr:
+        return dict(at='double', dv=0, smn=0, smx=1, keyable=True)
+    elif attr.startswith("fall"):
+        return dict(at='double', dv=0, smn=0, smx=10, keyable=True)
+    return dict(at='double', dv=0, keyable=True)
+
+
+# matrices are Maya flat row major lists, points are row vectors
+# ///////////////////////////////////////////////////////////////
+def translation(m):
+    return [float(m[12]), float(m[13]), float(m[14])]
+
+
+def with_translation(m, point):
+    return [float(i) for i in m[:12]] + [float(point[0]), float(point[1]), float(point[2]), 1.0]
+
+
+def homogenize(m):
+    w = float(m[15]) or 1.0
+    return [float(i) / w for i in m]
+
+
+def _sub(a, b):
+    return [a[0] - b[0], a[1] - b[1], a[2] - b[2]]
+
+
+def _length(v):
+    return (v[0] * v[0] + v[1] * v[1] + v[2] * v[2]) ** 0.5
+
+
+def _normal(v):
+    length = _length(v)
+    return [i / length for i in v] if length else list(v)
+
+
+def _dot(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+
+def point_to_world(point, m):
+    """point in the space of the world matrix m to world space"""
+    return [point[0] * m[i] + point[1] * m[4 + i] + point[2] * m[8 + i] + m[12 + i] for i in range(3)]
+
+
+def point_to_local(point, m):
+    """world point to the space of the world matrix m"""
+    a, b, c, d, e, f, g, h, k = [float(m[i]) for i in (0, 1, 2, 4, 5, 6, 8, 9, 10)]
+    det = a * (e * k - f * h) - b * (d * k - f * g) + c * (d * h - e * g)
+    inverse = [(e * k - f * h) / det, (c * h - b * k) / det, (b * f - c * e) / det,
+               (f * g - d * k) / det, (a * k - c * g) / det, (c * d - a * f) / det,
+               (d * h - e * g) / det, (b * g - a * h) / det, (a * e - b * d) / det]
+    p = _sub(point, translation(m))
+    return [p[0] * inverse[i] + p[1] * inverse[3 + i] + p[2] * inverse[6 + i] for i in range(3)]
+
+
+def joint_index(index, count):
+    return "{:0>2d}".format(index) if count <= 100 else "{:0>3d}".format(index)
+
+
+class BuildPlan(object):
+    """
+    Ordered build steps of a setup
+        steps : list of (op, fields), see the module documentation
+        master : names of the master nodes
+        chains : names of the nodes of each chain, {"fk": ..., "ik": ...}
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.steps = []
+        self.master = {}
+        self.chains = []
+
+    def add(self, op, **fields):
+        self.steps.append((op, fields))
+        return fields
+
+    def find(self, *ops):
+        """fields of the steps of some ops"""
+        return [fields for op, fields in self.steps if op in ops]
+
+    def nodes(self):
+        """(name, type) of every planned node, the spline IK and its controls included"""
+        nodes = []
+        for op, fields in self.steps:
+            if op == "node":
+                nodes.append((fields["name"], fields["type"]))
+            elif op == "control":
+                nodes.append((fields["name"], "transform"))
+            elif op == "ik_spline":
+                nodes += [(fields["handle"], "ikHandle"), (fields["effector"], "ikEffector"),
+                          (fields["curve"], "transform")]
+            elif op == "curve_controls":
+                for group, control, joint, _ in fields["controls"]:
+                    nodes += [(group, "transform"), (control, "transform"), (joint, "joint")]
+        return nodes
+
+    def to_dict(self):
+        return dict(name=self.name,
+                    steps=[[op, fields] for op, fields in self.steps],
+                    master=self.master,
+                    chains=self.chains)
+
+    @classmethod
+    def from_dict(cls, data):
+        plan = cls(data["name"])
+        plan.steps = [(op, dict(fields)) for op, fields in data["steps"]]
+        plan.master = dict(data["master"])
+        plan.chains = list(data["chains"])
+        return plan
+
+    def dumps(self, indent=None):
+        return json.dumps(self.to_dict(), indent=indent, sort_keys=True)
+
+    @classmethod
+    def loads(cls, text):
+        return cls.from_dict(json.loads(text))
+
+
+def plan_fk_chain(plan, slaves, matrices, config, index, parent, scene):
+    """Plan the FK chain driving the slaves of one chain, see sine_tool.operation.FKSetup
+
+    Returns:
+        dict: names of the chain nodes, grp, offset, exp, fk, ctls, chain_name, base_name, prefix
+    """
+    name = config["name"]
+    count = len(slaves)
+    chain_index = alphabet_index(index)
+    fk_base_name = ELEMENT_Grp.format(_name=name) + "_"
+    chain_name = FK_Grp.format(_name=name, _chain_index=chain_index)
+    base_name = fk_base_name + chain_index
+    matrices = [homogenize(m) for m in matrices]
+    record = dict(grp=chain_name, base_name=base_name, prefix=fk_base_name, chain_name=chain_name,
+                  offset=[], exp=[], fk=[], ctls=[])
+
+    # groups : element / FK / setup, neutral poses of the first offset joint
+    plan.add("node", name=base_name, type="transform", parent=parent, matrix=matrices[0])
+    plan.add("node", name=chain_name, type="transform", parent=base_name, matrix=matrices[0])
+    plan.add("node", name=chain_name + "_Setup", type="transform", parent=chain_name, matrix=matrices[0])
+
+    # offset joints and the tip, its length is the average local length of the chain
+    offsets = []
+    worlds = list(matrices)
+    _length = 0
+    _localXsum = 0
+    locals_ = [[0.0, 0.0, 0.0]] + [point_to_local(translation(matrices[i]), matrices[i - 1])
+                                   for i in range(1, count)]
+    for i in range(1, count):
+        if i != count - 1:
+            _length += _length_between(translation(matrices[i]), translation(matrices[i - 1]))
+        else:
+            _length += _length_between(locals_[i], locals_[i - 1])
+        _localXsum += locals_[i][0]
+    average_length = _length / (count - 1.0) if count > 2 else _length
+    scale = _localXsum / _length
+    worlds.append(with_translation(matrices[-1], point_to_world([average_length * scale, 0.0, 0.0],
+                                                                matrices[-1])))
+    for i in range(count):
+        offsets.append(fk_base_name + chain_index + "_" + joint_index(i, count) + "_offset_jnt")
+    offsets.append(offsets[-1] + "_TIP")
+
+    # offset -> exp -> ctl -> fk -> next offset
+    negate = _negate_check(matrices)
+    v = -1.0 if negate else 1.0
+    previous = chain_name + "_Setup"
+    for i, offset in enumerate(offsets):
+        exp = offset.replace("_offset_jnt", "_exp_jnt")
+        fk = exp.replace("_exp_jnt", "_jnt")
+        plan.add("node", name=offset, type="joint", parent=previous, matrix=worlds[i], freeze=True,
+                 draw_style=2)
+        plan.add("node", name=exp, type="joint", parent=offset, matrix=worlds[i], freeze=True)
+        fk_parent = exp
+        if i < count:
+            ctl = chain_name + "_{}_Ctl".format(i)
+            length = _length_between(translation(worlds[i + 1]), translation(worlds[i]))
+            plan.add("control", name=ctl, parent=exp, matrix=matrices[i], icon="cube", color=config["color"],
+                     w=length, h=config["fk_size"], d=config["fk_size"],
+                     po=[v * length / 2.0, 0.0, 0.0])
+            plan.add("controller", node=ctl,
+                     parent=ELEMENT_Grp.format(_name=name) + "_MCtl" if i == 0 else record["ctls"][-1])
+            record["ctls"].append(ctl)
+            fk_parent = ctl
+        plan.add("node", name=fk, type="joint", parent=fk_parent, matrix=worlds[i], freeze=True)
+        record["offset"].append(offset)
+        record["exp"].append(exp)
+        record["fk"].append(fk)
+        previous = fk
+
+    # slaves follow the fk joints
+    for fk, slave in zip(record["fk"], slaves):
+        locked = scene.get("locked_scale", {}).get(slave, (False, False, False))
+        for axis, lock in zip("XYZ", locked):
+            if not lock:
+                plan.add("connect", source=fk + ".scale" + axis, destination=slave + ".scale" + axis)
+        slave_name = scene.get("names", {}).get(slave, slave)
+        plan.add("constraint", type="parentConstraint", driver=fk, driven=slave,
+                 name=slave_name + "_tempCns", maintain_offset=False)
+    return record
+
+
+def _length_between(a, b):
+    return _length(_sub(a, b))
+
+
+def _negate_check(matrices):
+    """controllers of a chain aiming down their negative X axis (mirrored chain)"""
+    aim = _normal(_sub(translation(matrices[1]), translation(matrices[0])))
+    x_axis = _normal([float(i) for i in matrices[0][:3]])
+    return not (0.99 <= _dot(aim, x_axis) <= 1.01)
+
+
+def plan_spline_ik_chain(plan, fk_record, matrices, config, index, parent):
+    """Plan the spline IK driving the offset joints of a FK chain, see sine_tool.operation.SplineIKSetup
+
+    Returns:
+        dict: names of the chain nodes, grp, joints, ctls, handle, effector, curve, chain_name
+    """
+    name = config["name"]
+    offsets = fk_record["offset"]
+    count = len(offsets)
+    chain_index = alphabet_index(index)
+    ik_base_name = ELEMENT_Grp.format(_name=name) + "_"
+    chain_name = SIK_Grp.format(_name=name, _chain_index=chain_index)
+    base_name = ik_base_name + chain_index
+    planned = dict((fields["name"], fields["matrix"]) for fields in plan.find("node"))
+    worlds = [homogenize(matrices[i]) if i != count - 1 else planned[offsets[-1]]
+              for i in range(count)]
+    record = dict(grp=chain_name, chain_name=chain_name, joints=[], ctls=[],
+                  handle=chain_name + "_handle", effector=chain_name + "_effector", curve=chain_name + "_curve")
+
+    if base_name not in planned:
+        plan.add("node", name=base_name, type="transform", parent=parent, matrix=worlds[0])
+    plan.add("node", name=chain_name, type="transform", parent=base_name, matrix=worlds[0])
+    plan.add("node", name=chain_name + "_Setup", type="transform", parent=chain_name, matrix=worlds[0])
+    previous = chain_name + "_Setup"
+    for i in range(count):
+        joint = ik_base_name + chain_index + "_" + joint_index(i, count) + "_SIK_jnt"
+        plan.add("node", name=joint, type="joint", parent=previous, matrix=worlds[i], freeze=True,
+                 visibility=False)
+        record["joints"].append(joint)
+        previous = joint
+
+    plan.add("ik_spline", handle=record["handle"], effector=record["effector"], curve=record["curve"],
+             start=record["joints"][0], end=record["joints"][-1])
+    controls = []
+    for i in range(config["ik_count"]):
+        prefix = chain_name + "_{}_".format(i)
+        size = config["ik_size"] * 1.5 if i == 0 else config["ik_size"]
+        controls.append([prefix + "CGrp", prefix + "Ctl", prefix + "CJnt", size])
+        record["ctls"].append(prefix + "Ctl")
+    plan.add("curve_controls", curve=record["curve"], parent=chain_name, controls=controls,
+             color=config["color"], skin_cluster=record["curve"] + "Shape_skinCluster")
+
+    for ik, fk in zip(record["joints"], offsets):
+        for attr in ("rotateX", "rotateY", "rotateZ", "translateX", "translateY", "translateZ"):
+            plan.add("connect", source=ik + "." + attr, destination=fk + "." + attr)
+
+    ik_ctl = record["ctls"][0]
+    plan.add("attr", node=ik_ctl, name="sine_multiplier_All",
+             flags=dict(at='double', dv=1, min=0, max=1, keyable=True))
+    for i in range(count):
+        plan.add("attr", node=ik_ctl, name="FK_multiplier_{}".format(i), flags=dict(at='double', dv=1, keyable=True))
+    return record
+
+
+def plan_master(plan, slaves, matrices, config, scene):
+    """Plan the master controller, its groups and annotation, see sine_tool.operation.SineSetupMain"""
+    size = 1.5 * config["ik_size"]
+    element_grp = ELEMENT_Grp.format(_name=config["name"])
+    master_ctl = element_grp + "_MCtl"
+
+    # the average position of the chain roots
+    roots = [translation(matrices[index][0]) for index in slaves]
+    root_position = [sum(i[axis] for i in roots) / len(roots) for axis in range(3)]
+    root_matrix = with_translation(IDENTITY, root_position)
+
+    if not scene.get("master_grp_exists"):
+        plan.add("node", name=MASTER_GRP_NAME, type="transform", parent=None, matrix=root_matrix)
+    plan.add("node", name=element_grp, type="transform", parent=MASTER_GRP_NAME, matrix=root_matrix)
+    plan.add("control", name=master_ctl, parent=element_grp, matrix=root_matrix, icon="sphere",
+             color=config["color"], w=size)
+    plan.add("controller", node=master_ctl, parent=None)
+    static = config.get("static", {})
+    for attr in MASTER_ATTRS:
+        flags = master_attr_flags(attr)
+        if attr in static:
+            flags["dv"] = float(static[attr])
+        plan.add("attr", node=master_ctl, name=attr, flags=flags)
+    # the static attributes are locked at their value and folded by the backends, see plan_backend()
+    for attr in MASTER_ATTRS:
+        if attr in static:
+            plan.add("lock", plug=master_ctl + "." + attr, lock=True, keyable=False, channel_box=True)
+
+    x, y, z = root_position
+    plan.add("annotation", name=element_grp + "_annotation", node=master_ctl, text=element_grp,
+             position=[x, y + size * 0.75, z])
+    plan.add("connect", source=master_ctl + ".annotation_vis", destination=element_grp + "_annotation.v")
+    for grp in (element_grp, MASTER_GRP_NAME):
+        for attr in ("tx", "ty", "tz", "rx", "ry", "rz", "sx", "sy", "sz", "v"):
+            plan.add("lock", plug=grp + "." + attr, lock=True, keyable=False, channel_box=False)
+    plan.master = dict(grp=MASTER_GRP_NAME, element_grp=element_grp, ctl=master_ctl)
+
+
+def plan_sets(plan, slaves):
+    base_name = ELEMENT_Grp.format(_name=plan.name) + "_"
+    plan.add("sets", name=MAIN_SETS_NAME, members=[], mode="ensure", parent=None)
+    for suffix in ("Sets", "FK_Sets", "EXP_Sets", "IK_Sets"):
+        plan.add("sets", name=base_name + suffix, members=[], mode="replace", parent=None)
+    for chain in plan.chains:
+        plan.add("sets", name=chain["fk"]["chain_name"] + "_Sets", members=chain["fk"]["ctls"], mode="new",
+                 parent=base_name + "FK_Sets")
+    for chain in plan.chains:
+        plan.add("sets", name=chain["fk"]["chain_name"] + "_Exp_Sets", members=chain["fk"]["exp"], mode="new",
+                 parent=base_name + "EXP_Sets")
+    for chain in plan.chains:
+        plan.add("sets", name=chain["ik"]["chain_name"] + "_Sets", members=chain["ik"]["ctls"], mode="new",
+                 parent=base_name + "IK_Sets")
+    plan.add("sets", name=base_name + "Sets",
+             members=[plan.master["ctl"], base_name + "FK_Sets", base_name + "IK_Sets", base_name + "EXP_Sets"],
+             mode="ensure", parent=MAIN_SETS_NAME)
+
+    plan.add("sets", name=MAIN_BAKE_SETS_NAME, members=[], mode="ensure", parent=None)
+    plan.add("sets", name=base_name + "Bake_Sets", members=[slave for index in slaves for slave in slaves[index]],
+             mode="replace", parent=MAIN_BAKE_SETS_NAME)
+
+
+def plan_backend(plan, config, frame_rate):
+    """Plan the nodes driving the expression joints with the backend of the config,
+    the master attributes of config["static"] are folded as constants, the only
+    ones the backends fold: a keyable attribute at zero can still be animated"""
+    backend = config.get("backend", EXPRESSION_BACKEND)
+    master_ctl = plan.master["ctl"]
+    chain_count = len(plan.chains)
+    static = dict((master_ctl + "." + attr, float(value)) for attr, value in config.get("static", {}).items())
+    if backend != EXPRESSION_BACKEND and any(static.get(master_ctl + "." + i) != 0 for i in NOISE_ATTRS):
+        # the other backends rebuild MEL noise() from the gradient table
+        from .noise import require_calibration
+        require_calibration("the {} backend".format(backend))
+    if backend == SOLVER_BACKEND:
+        solver = SOLVER_NAME.format(_name=config["name"])
+        plan.add("plugin", path=SOLVER_PLUGIN)
+        plan.add("node", name=solver, type="sineSolver", parent=None, matrix=None)
+        plan.add("connect", source="time1.outTime", destination=solver + ".time")
+        for attr in param_names():
+            plan.add("connect", source=master_ctl + "." + attr, destination=solver + "." + attr)
+        out_index = 0
+        for chain_index, chain in enumerate(plan.chains):
+            ik_ctl = chain["ik"]["ctls"][0]
+            plug = "{}.chain[{}]".format(solver, chain_index)
+            plan.add("set_attr", plug=plug + ".jointCount", value=len(chain["fk"]["exp"]))
+            plan.add("connect", source=ik_ctl + ".sine_multiplier_All", destination=plug + ".sineMultiplier")
+            for jnt_index, jnt in enumerate(chain["fk"]["exp"]):
+                plan.add("connect", source=ik_ctl + ".FK_multiplier_{}".format(jnt_index),
+                         destination="{}.fkMultiplier[{}]".format(plug, jnt_index))
+                for axis in "XYZ":
+                    plan.add("connect", source="{}.outRotate[{}].outRotate{}".format(solver, out_index, axis),
+                             destination=jnt + ".rotate" + axis)
+                out_index += 1
+        return
+
+    for chain_index, chain in enumerate(plan.chains):
+        kwargs = dict(master=master_ctl,
+                      ik_ctl=chain["ik"]["ctls"][0],
+                      targets=chain["fk"]["exp"],
+                      chain_index=chain_index,
+                      chain_count=chain_count,
+                      frame_rate=frame_rate,
+                      static=static)
+        if backend == NETWORK_BACKEND:
+            # numpy is only needed by this backend
+            from .graph import chain_graph
+            graph = chain_graph(prefix=chain["fk"]["chain_name"] + "_net", **kwargs)
+            plan.add("graph", data=graph.to_dict())
+        else:
+            # the time invariant terms are computed once by their own expression, see hoist_invariants()
+            attrs, invariant, text = chain_expression(**kwargs)
+            for attr in attrs:
+                plan.add("attr", node=kwargs["ik_ctl"], name=attr, flags=dict(at='double', dv=0, keyable=False))
+            if invariant:
+                plan.add("expression", name=chain["fk"]["exp"][0] + "_invariant_exp", text=invariant)
+            plan.add("expression", name=chain["fk"]["exp"][0] + "_exp", text=text)
+
+
+def plan_setup(slaves, matrices, config, scene=None):
+    """Compute the build plan of a sine setup.
+
+    Arguments:
+        slaves (dict): chain index -> slave joint names, root first.
+        matrices (dict): chain index -> world matrices (16 floats) of the slaves.
+        config (dict): see sine_tool.operation.SineSetupMain.
+        scene (dict): names (slave -> short name), parents (slave -> parent name),
+            locked_scale (slave -> 3 bools), master_grp_exists (bool), frame_rate (float).
+
+    Returns:
+        BuildPlan
+    """
+    scene = scene or {}
+    plan = BuildPlan(config["name"])
+    plan_master(plan, slaves, matrices, config, scene)
+    for index in slaves:
+        fk = plan_fk_chain(plan, slaves[index], matrices[index], config, index, plan.master["element_grp"], scene)
+        plan.add("connect", source=plan.master["ctl"] + ".fk_vis", destination=fk["grp"] + ".v")
+        plan.add("lock", plug=fk["grp"] + ".v", lock=True, keyable=False, channel_box=None)
+
+        ik = plan_spline_ik_chain(plan, fk, matrices[index], config, index, plan.master["element_grp"])
+        # temporarily constrained outside of the ik chain cuz this one is not related to its slave
+        driver = scene.get("parents", {}).get(slaves[index][0])
+        plan.add("constraint", type="parentConstraint", driver=driver, driven=ik["grp"],
+                 name=ik["grp"] + "_tempCns", maintain_offset=False)
+        for attr, plug in (("ik_vis", ik["grp"] + ".v"),
+                           ("roll", ik["handle"] + ".roll"),
+                           ("twist", ik["handle"] + ".twist")):
+            plan.add("connect", source=plan.master["ctl"] + "." + attr, destination=plug)
+        plan.add("lock", plug=ik["grp"] + ".v", lock=True, keyable=False, channel_box=None)
+        plan.chains.append(dict(fk=fk, ik=ik))
+
+    plan_backend(plan, config, scene.get("frame_rate", 24))
+    plan_sets(plan, slaves)
+    return plan
@@ -0,0 +1,154 @@
+"""
+Runtime export of the sine setups and its pure Python reference reader / evaluator
+
+A runtime (game engine, custom player) evaluates the sine formula from a few dozen
+parameters per setup instead of loading baked keys. The file is compact JSON:
+
+    {
+        "format": FORMAT, "version": VERSION, "frame_rate": 24.0,
+        "noise": {"lattice_size": 256, "gradients": [...]},
+        "setups": [{
+            "name": "Sine_<name>",
+            "params": {master attribute: value},
+            "chain_count": 2,
+            "chains": [{"index": 0, "sine_multiplier": 1.0, "fk_multipliers": [...],
+                        "joints": [expression joints], "slaves": [slave joint or null]}]
+        }]
+    }
+
+evaluate_setup() is a scalar, dependency free port of sine_tool.engine.evaluator,
+it is meant to be read side by side with a runtime implementation and to check
+its results.
+"""
+import json
+import math
+
+from .params import AXES, default_params
+
+FORMAT = "rxSine-runtime"
+VERSION = 1
+
+tau = math.pi * 2
+
+
+def runtime_data(setups, frame_rate, gradients):
+    """Build the runtime data of setups.
+
+    Arguments:
+        setups (list of dict): name, params, chain_count, chains, see the module documentation.
+        frame_rate (float): scene frame rate.
+        gradients (list of float): noise gradient table, see sine_tool.engine.noise.gradients().
+
+    Returns:
+        dict
+    """
+    gradients = [float(i) for i in gradients]
+    return dict(format=FORMAT,
+                version=VERSION,
+                frame_rate=float(frame_rate),
+                noise=dict(lattice_size=len(gradients), gradients=gradients),
+                setups=list(setups))
+
+
+def write_runtime(path, data):
+    with open(path, "w") as f:
+        json.dump(data, f, separators=(",", ":"), sort_keys=True)
+    return path
+
+
+def read_runtime(path):
+    """Read a runtime file, missing parameters get their default value
+
+    Returns:
+        dict: the runtime data
+    """
+    with open(path) as f:
+        data = json.load(f)
+    if data.get("format") != FORMAT:
+        raise ValueError("{} is not a sine runtime file".format(path))
+    if data.get("version", 0) > VERSION:
+        raise ValueError("{} version {} is newer than the reader {}".format(path, data["version"], VERSION))
+    for setup in data["setups"]:
+        params = default_params()
+        params.update(setup["params"])
+        setup["params"] = params
+    return data
+
+
+def noise(value, gradients):
+    """1D gradient noise, same as sine_tool.engine.noise.noise() for one value"""
+    mask = len(gradients) - 1
+    lattice = math.floor(value)
+    r = value - lattice
+    b0 = int(lattice) & mask
+    s = r * r * (3.0 - 2.0 * r)
+    return r * (1.0 - s) * gradients[b0] + s * (r - 1.0) * gradients[(b0 + 1) & mask]
+
+
+def evaluate_setup(setup, time, frame_rate, gradients):
+    """Evaluate the rotations of every expression joint of a setup at one time.
+
+    Arguments:
+        setup (dict): a setup of the runtime data.
+        time (float): time in seconds.
+        frame_rate (float): frame rate of the runtime data.
+        gradients (list of float): noise gradient table of the runtime data.
+
+    Returns:
+        list of list of tuple: rotations in degrees (x, y, z) of each joint of each chain
+    """
+    params = setup["params"]
+    strength = params["strength"]
+    chain_count = float(setup["chain_count"])
+    result = []
+    for chain in setup["chains"]:
+        c = chain["index"]
+        count = len(chain["fk_multipliers"])
+        rotations = []
+        for j, fk_mult in enumerate(chain["fk_multipliers"], 1):
+            rotation = []
+            for axis_index, axis in enumerate(AXES):
+                def value(attr):
+                    return params[attr + axis]
+
+                loop_per_second = value("loop_per_second_")
+                freq = loop_per_second * tau * time
+                falloff = value("falloff") * count * 0.1
+                weight = (j - min(max(falloff, 0), j)) / (count * 2.0)
+                offset_rdm = value("offset_rdm")
+                phase = (freq
+                         + offset_rdm * noise(offset_rdm + c, gradients)
+                         + value("offset_noise") * (c + 1) / chain_count
+                         + value("offset_frame") / float(frame_rate) * loop_per_second * tau
+                         + value("delay") * -7 * weight)
+
+                bias_freq = value("amp_bias_LPS_mult") * freq
+                if axis == "Z":
+                    bias_freq /= 100.0
+                bias = value("amp_bias_range") * noise(bias_freq + (c + 1) * value("amp_bias_noise"), gradients)
+                amp = value("amp") * 0.1 * ((falloff / 5) + 1)
+                gain = 100 * weight * (1.0 - (j + 1) / (count * 2.0)) * amp * strength
+                sine = math.sin(phase) * (1 + bias) * gain
+
+                # X and Y add the amp offset after the positive / negative multiplier, Z before it
+                if j == 1 and axis_index == 2:
+                    sine += value("amp_offset")
+                sine *= value("amp_positive_mult") if sine >= 0 else value("amp_negative_mult")
+                if j == 1 and axis_index < 2:
+                    sine += value("amp_offset")
+                rotation.append(sine * fk_mult * chain["sine_multiplier"])
+            rotations.append(tuple(rotation))
+        result.append(rotations)
+    return result
+
+
+def evaluate_runtime(data, frame):
+    """Evaluate every setup of runtime data at a frame
+
+    Returns:
+        dict: setup name -> rotations of evaluate_setup()
+    """
+    frame_rate = data["frame_rate"]
+    gradients = data["noise"]["gradients"]
+    return dict((setup["name"], evaluate_setup(setup, frame / float(frame_rate), frame_rate, gradients))
+                for setup in data["setups"])
@@ -0,0 +1,139 @@
+"""
+Maya free parity checks and benchmark of the engine
+
+The sine motion has three implementations outside of the MEL expression: the NumPy
+evaluator (also run by the sineSolver node), the utility node network of the network
+backend (run by graph.evaluate_graph(), the stand-in of the node behaviours) and the
+scalar reference reader of the runtime export. check_backends() evaluates the three
+of them on random parameters and compares their rotations, check_plan() round-trips
+a build plan through its JSON form. Run as a script:
+
+    python -m sine_tool.engine.selfcheck
+"""
+import random
+import time
+
+import numpy as np
+
+from .evaluator import evaluate
+from .graph import chain_graph, evaluate_graph
+from .noise import gradients
+from .params import AXES, param_names
+from .plan import IDENTITY, NOISE_ATTRS, NETWORK_BACKEND, BuildPlan, plan_setup
+from .runtime import evaluate_runtime, runtime_data
+
+# max absolute difference between the backends, in degrees
+TOLERANCE = 1e-6
+
+
+def random_params(rand):
+    """random master controller values, the noise terms included"""
+    params = {}
+    for name in param_names():
+        if name.endswith("_mult") and "_LPS" not in name:
+            params[name] = rand.uniform(0.5, 1.5)
+        elif name.startswith("falloff"):
+            params[name] = rand.uniform(0.0, 10.0)
+        elif name.startswith(("amp_bias_range", "offset_rdm")):
+            params[name] = rand.uniform(0.0, 1.0)
+        else:
+            params[name] = rand.uniform(-2.0, 2.0)
+    params["strength"] = rand.uniform(0.5, 2.0)
+    return params
+
+
+def check_backends(seed=0, joint_counts=(4, 7, 5), frames=48, frame_rate=24.0):
+    """Compare evaluator.evaluate(), graph.evaluate_graph() and runtime.evaluate_runtime().
+
+    Returns:
+        float: max absolute difference of the rotations, in degrees
+
+    Raises:
+        AssertionError: when a backend differs by more than TOLERANCE
+    """
+    rand = random.Random(seed)
+    params = random_params(rand)
+    chain_count = len(joint_counts)
+    fk_multipliers = [[rand.uniform(0.0, 1.5) for _ in range(count)] for count in joint_counts]
+    sine_multipliers = [rand.uniform(0.0, 1.0) for _ in range(chain_count)]
+    sampled = np.arange(1, frames + 1, dtype=np.float64) + rand.random()
+
+    expected = evaluate(params, sampled, joint_counts, fk_multipliers, sine_multipliers, frame_rate=frame_rate)
+
+    inputs = dict(("master.{}".format(k), v) for k, v in params.items())
+    graphs, chains = [], []
+    for chain_index, count in enumerate(joint_counts):
+        ik_ctl = "ik{}".format(chain_index)
+        targets = ["c{}_j{}".format(chain_index, i) for i in range(count)]
+        inputs[ik_ctl + ".sine_multiplier_All"] = sine_multipliers[chain_index]
+        for i, value in enumerate(fk_multipliers[chain_index]):
+            inputs["{}.FK_multiplier_{}".format(ik_ctl, i)] = value
+        graphs.append((targets, chain_graph("master", ik_ctl, targets, chain_index, chain_count, frame_rate)))
+        chains.append(dict(index=chain_index, sine_multiplier=sine_multipliers[chain_index],
+                           fk_multipliers=fk_multipliers[chain_index], joints=targets, slaves=[None] * count))
+    runtime = runtime_data([dict(name="setup", params=params, chain_count=chain_count, chains=chains)],
+                           frame_rate, gradients())
+
+    error = 0.0
+    for frame_index, frame in enumerate(sampled):
+        inputs["time1.outTime"] = frame
+        rotations = evaluate_runtime(runtime, frame)["setup"]
+        for chain_index, (targets, graph) in enumerate(graphs):
+            outputs = evaluate_graph(graph, inputs)
+            for joint_index, target in enumerate(targets):
+                for axis_index, axis in enumerate(AXES):
+                    value = expected[chain_index, joint_index, axis_index, frame_index]
+                    # rotations folded to zero are not driven by the network
+                    network = outputs.get("{}.rotate{}".format(target, axis), 0.0)
+                    reference = rotations[chain_index][joint_index][axis_index]
+                    error = max(error, abs(network - value), abs(reference - value))
+    assert error <= TOLERANCE, "backends differ by {} degrees".format(error)
+    return error
+
+
+def check_plan(joint_counts=(4, 6), backend=NETWORK_BACKEND):
+    """Round-trip a build plan through dumps() / loads() and to_dict() / from_dict()
+
+    The network backend lowers the noise from the gradient table, the noise attributes
+    are static so the check does not need a calibrated table.
+
+    Raises:
+        AssertionError: when the plan changes
+    """
+    slaves, matrices = {}, {}
+    for chain, count in enumerate(joint_counts):
+        slaves[chain] = ["chain{}_{}".format(chain, i) for i in range(count)]
+        matrices[chain] = [IDENTITY[:12] + [float(i), 0.0, float(chain), 1.0] for i in range(count)]
+    config = dict(name="check", fk_size=1.0, ik_size=1.0, ik_count=3, color=[1.0, 0.5, 0.0], backend=backend,
+                  static=dict.fromkeys(NOISE_ATTRS, 0.0))
+    plan = plan_setup(slaves, matrices, config, dict(frame_rate=24.0))
+    text = plan.dumps()
+    assert BuildPlan.loads(text).dumps() == text, "plan changed by its JSON round-trip"
+    assert BuildPlan.from_dict(plan.to_dict()).dumps() == text, "plan changed by from_dict()"
+    names = [name for name, _ in plan.nodes()]
+    assert len(names) == len(set(names)), "plan node names are not unique"
+
+
+def benchmark(chains=30, joints=20, frames=1000, frame_rate=24.0, seed=0):
+    """Time evaluator.evaluate() over a whole shot
+
+    Returns:
+        float: seconds
+    """
+    params = random_params(random.Random(seed))
+    sampled = np.arange(frames, dtype=np.float64)
+    start = time.time()
+    evaluate(params, sampled, [joints] * chains, frame_rate=frame_rate)
+    return time.time() - start
+
+
+def main():
+    for seed in range(5):
+        print("backends, seed {}: max difference {:.3g} degrees".format(seed, check_backends(seed)))
+    check_plan()
+    print("plan round-trip: ok")
+    print("evaluate, 30 chains x 20 joints x 1000 frames: {:.3f} s".format(benchmark()))
+
+
+if __name__ == "__main__":
+    main()
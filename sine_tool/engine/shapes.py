@@ -0,0 +1,112 @@
+"""
+Shape library of the control icons
+
+Each icon is a list of canonical curves, unit point arrays scaled, rotated and
+offset as whole arrays: no vector object is created per point. icon_curves() gives
+the points of every sub curve of an icon and curve_args() the flags of the curve
+command creating it.
+
+Rotations are XYZ euler angles in radians applied to row vectors, as
+MVector.rotateBy(MEulerRotation(x, y, z)).
+"""
+from math import cos, sin
+
+try:
+    import numpy as np
+except ImportError:
+    # hosts without numpy transform the icons point by point
+    np = None
+
+# p is positive, N is negative
+_CORNERS = dict(ppp=(1, 1, 1), ppN=(1, 1, -1), pNp=(1, -1, 1), Npp=(-1, 1, 1),
+                pNN=(1, -1, -1), NNp=(-1, -1, 1), NpN=(-1, 1, -1), NNN=(-1, -1, -1))
+CUBE = [[_CORNERS[i] for i in ("ppp", "ppN", "NpN", "NNN", "NNp", "Npp", "NpN", "Npp", "ppp", "pNp", "NNp",
+                               "pNp", "pNN", "ppN", "pNN", "NNN")]]
+_CIRCLE = [(0, 0, -1.108), (.78, 0, -.78), (1.108, 0, 0), (.78, 0, .78),
+           (0, 0, 1.108), (-.78, 0, .78), (-1.108, 0, 0), (-.78, 0, -.78)]
+SPHERE = [_CIRCLE, _CIRCLE, _CIRCLE]
+# rotations of the circles of the sphere, added to the rotation offset of the icon
+SPHERE_ROTATIONS = [(0, 0, 0), (1.5708, 0, 0), (1.5708 * 4, 0, 1.5708 * 3)]
+NULL = [[(1, 0, 0), (-1, 0, 0)], [(0, 1, 0), (0, -1, 0)], [(0, 0, 1), (0, 0, -1)]]
+
+
+def rotation_matrix(rotation):
+    """3x3 matrix of XYZ euler angles, rows are the rotated axes"""
+    cx, cy, cz = [cos(i) for i in rotation]
+    sx, sy, sz = [sin(i) for i in rotation]
+    rx = [[1, 0, 0], [0, cx, sx], [0, -sx, cx]]
+    ry = [[cy, 0, -sy], [0, 1, 0], [sy, 0, cy]]
+    rz = [[cz, sz, 0], [-sz, cz, 0], [0, 0, 1]]
+    return _matmul(_matmul(rx, ry), rz)
+
+
+def _matmul(a, b):
+    return [[sum(a[i][k] * b[k][j] for k in range(3)) for j in range(3)] for i in range(3)]
+
+
+def transform_points(points, scale=(1, 1, 1), rotation=None, offset=None):
+    """Scale, rotate then offset points.
+
+    Arguments:
+        points (list or ndarray): (N, 3) points.
+        scale (tuple): scale of each axis.
+        rotation (tuple): XYZ euler angles in radians, optional.
+        offset (tuple): position offset, optional.
+
+    Returns:
+        list of tuple: the transformed points
+    """
+    if np is None:
+        result = [[p[0] * scale[0], p[1] * scale[1], p[2] * scale[2]] for p in points]
+        if rotation is not None:
+            m = rotation_matrix(rotation)
+            result = [[sum(p[k] * m[k][j] for k in range(3)) for j in range(3)] for p in result]
+        if offset is not None:
+            result = [[p[i] + offset[i] for i in range(3)] for p in result]
+        return [tuple(p) for p in result]
+
+    result = np.asarray(points, dtype=np.float64) * np.asarray(scale, dtype=np.float64)
+    if rotation is not None:
+        result = result.dot(np.asarray(rotation_matrix(rotation)))
+    if offset is not None:
+        result += np.asarray(offset, dtype=np.float64)
+    return [tuple(p) for p in result.tolist()]
+
+
+def _add(a, b):
+    return tuple(float(i) + float(j) for i, j in zip(a, b))
+
+
+def icon_curves(icon, w=1, h=1, d=1, po=None, ro=None, degree=3):
+    """Get the sub curves of an icon, same shapes as helper.cube(), sphere() and null()
+
+    Arguments:
+        icon (str): cube, sphere or null.
+        w, h, d (float): size, the sphere and the null only use w.
+        po (tuple): position offset, optional.
+        ro (tuple): rotation offset, XYZ euler in radians, optional.
+        degree (int): degree of the sphere circles.
+
+    Returns:
+        list of tuple: (points, degree, close) of each sub curve
+    """
+    if po is not None:
+        po = tuple(float(i) for i in po)
+    if icon == "cube":
+        scale = (w * 0.5, h * 0.5, d * 0.5)
+        return [(transform_points(CUBE[0], scale, ro, po), 1, False)]
+    scale = (w * 0.5,) * 3
+    if icon == "sphere":
+        return [(transform_points(circle, scale, _add(rotation, ro) if ro else rotation, po), degree, True)
+                for circle, rotation in zip(SPHERE, SPHERE_ROTATIONS)]
+    if icon == "null":
+        return [(transform_points(line, scale, ro, po), 1, False) for line in NULL]
+    raise ValueError("invalid type of icon {}".format(icon))
+
+
+def curve_args(points, degree, close):
+    """Flags of the curve command building a sub curve, periodic curves repeat their first points"""
+    if not close:
+        return dict(d=degree, p=list(points))
+    points = list(points) + list(points[:degree])
+    return dict(d=degree, p=points, per=True, k=list(range(len(points) + degree - 1)))
@@ -0,0 +1,308 @@
+"""
+sineSolver : computes the sine rotations of every chain and joint of a setup in one compute()
+
+Python API 2.0 dependency node used by the "solver" backend of SineSetupMain.set_exp,
+the math itself is done by sine_tool.engine.evaluator.
+
+inputs :
+    time -> time1.outTime, or the output of an animCurveTT to retime the motion
+    strength, loop_per_second_X, ampX ... -> the master controller attributes
+    chain[i].jointCount, chain[i].sineMultiplier, chain[i].fkMultiplier[j]
+    cacheMemory -> memory cap of the frame cache in MB, 0 disables it
+outputs :
+    outRotate[k] -> rotate of the k-th expression joint, chains are stored one after the other
+
+Evaluated frames are kept in a sine_tool.engine.cache.FrameCache keyed by the
+frame and the hash of every other input, scrubbing over evaluated frames does
+not run the evaluator again and any input change invalidates the cache.
+
+sineCacheReader : plays the rotations of a setup back from a sine_tool.engine.cache file
+
+inputs :
+    time -> time1.outTime, or the output of an animCurveTT to retime the playback
+    cacheFile -> path of the cache file
+outputs :
+    outRotate[k] -> same layout as the sineSolver
+
+sineApiEdit : undoable command running an edit of sine_tool.scene.undo.run_edit() with
+an MDGModifier and an MAnimCurveChange it keeps for undo / redo, the bakes write
+their curves through it
+"""
+import maya.api.OpenMaya as om
+import maya.api.OpenMayaAnim as oma
+
+from sine_tool.engine.cache import FRAME_CACHE_MB, FrameCache, RotationCache, state_hash
+from sine_tool.engine.evaluator import evaluate_times
+from sine_tool.engine.params import default_params
+from sine_tool.scene.undo import COMMAND_NAME, take_edit
+
+
+def maya_useNewAPI():
+    pass
+
+
+def create_out_rotate():
+    """Create the outRotate[k] (outRotateX, outRotateY, outRotateZ) output array
+
+    Returns:
+        tuple: outRotate, outRotateX, outRotateY, outRotateZ attributes
+    """
+    n_attr = om.MFnNumericAttribute()
+    u_attr = om.MFnUnitAttribute()
+    out_x = u_attr.create("outRotateX", "orx", om.MFnUnitAttribute.kAngle, 0.0)
+    out_y = u_attr.create("outRotateY", "ory", om.MFnUnitAttribute.kAngle, 0.0)
+    out_z = u_attr.create("outRotateZ", "orz", om.MFnUnitAttribute.kAngle, 0.0)
+    out_rotate = n_attr.create("outRotate", "ort", out_x, out_y, out_z)
+    n_attr.array = True
+    n_attr.usesArrayDataBuilder = True
+    n_attr.writable = False
+    n_attr.storable = False
+    return out_rotate, out_x, out_y, out_z
+
+
+def write_out_rotate(data, attrs, rotations):
+    """Write (joints, 3) rotations in degrees to the outRotate array, attrs as returned by create_out_rotate()"""
+    out_rotate, out_x, out_y, out_z = attrs
+    handle = data.outputArrayValue(out_rotate)
+    builder = handle.builder()
+    for index, rotation in enumerate(rotations):
+        element = builder.addElement(index)
+        for child, value in zip((out_x, out_y, out_z), rotation):
+            element.child(child).setMAngle(om.MAngle(float(value), om.MAngle.kDegrees))
+    handle.set(builder)
+    handle.setAllClean()
+
+
+class SineSolver(om.MPxNode):
+    kNodeName = "sineSolver"
+    kNodeId = om.MTypeId(0x7F100)
+
+    aTime = None
+    aParams = {}
+    aChain = None
+    aJointCount = None
+    aSineMultiplier = None
+    aFkMultiplier = None
+    aCacheMemory = None
+    aOutRotate = None
+    aOutRotateX = None
+    aOutRotateY = None
+    aOutRotateZ = None
+
+    def __init__(self):
+        super(SineSolver, self).__init__()
+        self.frame_cache = FrameCache()
+
+    @classmethod
+    def creator(cls):
+        return cls()
+
+    @classmethod
+    def initialize(cls):
+        n_attr = om.MFnNumericAttribute()
+        u_attr = om.MFnUnitAttribute()
+        c_attr = om.MFnCompoundAttribute()
+
+        cls.aTime = u_attr.create("time", "tm", om.MFnUnitAttribute.kTime, 0.0)
+        cls.addAttribute(cls.aTime)
+
+        for name, value in sorted(default_params().items()):
+            cls.aParams[name] = n_attr.create(name, name, om.MFnNumericData.kDouble, value)
+            n_attr.keyable = True
+            cls.addAttribute(cls.aParams[name])
+
+        cls.aJointCount = n_attr.create("jointCount", "jc", om.MFnNumericData.kInt, 0)
+        cls.aSineMultiplier = n_attr.create("sineMultiplier", "sm", om.MFnNumericData.kDouble, 1.0)
+        cls.aFkMultiplier = n_attr.create("fkMultiplier", "fm", om.MFnNumericData.kDouble, 1.0)
+        n_attr.array = True
+        cls.aChain = c_attr.create("chain", "ch")
+        c_attr.addChild(cls.aJointCount)
+        c_attr.addChild(cls.aSineMultiplier)
+        c_attr.addChild(cls.aFkMultiplier)
+        c_attr.array = True
+        cls.addAttribute(cls.aChain)
+
+        cls.aCacheMemory = n_attr.create("cacheMemory", "cmem", om.MFnNumericData.kDouble, FRAME_CACHE_MB)
+        n_attr.setMin(0.0)
+        cls.addAttribute(cls.aCacheMemory)
+
+        cls.aOutRotate, cls.aOutRotateX, cls.aOutRotateY, cls.aOutRotateZ = create_out_rotate()
+        cls.addAttribute(cls.aOutRotate)
+
+        inputs = [cls.aTime, cls.aChain, cls.aJointCount, cls.aSineMultiplier, cls.aFkMultiplier]
+        for attr in inputs + list(cls.aParams.values()):
+            for out_attr in (cls.aOutRotate, cls.aOutRotateX, cls.aOutRotateY, cls.aOutRotateZ):
+                cls.attributeAffects(attr, out_attr)
+
+    def read_inputs(self, data):
+        """Read the node inputs as arguments of the engine evaluator"""
+        params = {}
+        for name, attr in self.aParams.items():
+            params[name] = data.inputValue(attr).asDouble()
+
+        chain_data = {}
+        chains = data.inputArrayValue(self.aChain)
+        for i in range(len(chains)):
+            chains.jumpToPhysicalElement(i)
+            chain = chains.inputValue()
+            count = chain.child(self.aJointCount).asInt()
+            fk_handle = om.MArrayDataHandle(chain.child(self.aFkMultiplier))
+            fk_values = {}
+            for j in range(len(fk_handle)):
+                fk_handle.jumpToPhysicalElement(j)
+                fk_values[fk_handle.elementLogicalIndex()] = fk_handle.inputValue().asDouble()
+            chain_data[chains.elementLogicalIndex()] = (count,
+                                                        [fk_values.get(j, 1.0) for j in range(count)],
+                                                        chain.child(self.aSineMultiplier).asDouble())
+        # the logical index is the chain index used by the noise terms
+        chain_indices = sorted(chain_data)
+        joint_counts = [chain_data[i][0] for i in chain_indices]
+        fk_multipliers = [chain_data[i][1] for i in chain_indices]
+        sine_multipliers = [chain_data[i][2] for i in chain_indices]
+
+        time = data.inputValue(self.aTime).asTime()
+        return dict(params=params,
+                    times=[time.asUnits(om.MTime.kSeconds)],
+                    joint_counts=joint_counts,
+                    fk_multipliers=fk_multipliers,
+                    sine_multipliers=sine_multipliers,
+                    frame_rate=om.MTime(1.0, om.MTime.kSeconds).asUnits(om.MTime.uiUnit()),
+                    chain_indices=chain_indices,
+                    chain_count=len(chain_indices))
+
+    def compute_rotations(self, data):
+        """Get the rotations of every joint, flattened chain after chain (joints, 3)"""
+        inputs = self.read_inputs(data)
+        memory = data.inputValue(self.aCacheMemory).asDouble()
+        if not memory:
+            self.frame_cache.clear()
+            return self.evaluate_rotations(inputs)
+
+        self.frame_cache.resize(memory)
+        time = inputs["times"][0]
+        state = state_hash(dict((k, v) for k, v in inputs.items() if k != "times"))
+        rotations = self.frame_cache.get(time, state)
+        if rotations is None:
+            rotations = self.frame_cache.put(time, state, self.evaluate_rotations(inputs))
+        return rotations
+
+    @staticmethod
+    def evaluate_rotations(inputs):
+        joint_counts = inputs["joint_counts"]
+        rotations = evaluate_times(**inputs)
+        return [rotations[c, j, :, 0] for c, count in enumerate(joint_counts) for j in range(count)]
+
+    def compute(self, plug, data):
+        attrs = (self.aOutRotate, self.aOutRotateX, self.aOutRotateY, self.aOutRotateZ)
+        if plug.attribute() not in attrs:
+            return None
+        write_out_rotate(data, attrs, self.compute_rotations(data))
+        data.setClean(plug)
+
+
+class SineCacheReader(om.MPxNode):
+    kNodeName = "sineCacheReader"
+    kNodeId = om.MTypeId(0x7F101)
+
+    aTime = None
+    aCacheFile = None
+    aOutRotate = None
+    aOutRotateX = None
+    aOutRotateY = None
+    aOutRotateZ = None
+
+    def __init__(self):
+        super(SineCacheReader, self).__init__()
+        self.cache = None
+
+    @classmethod
+    def creator(cls):
+        return cls()
+
+    @classmethod
+    def initialize(cls):
+        u_attr = om.MFnUnitAttribute()
+        t_attr = om.MFnTypedAttribute()
+
+        cls.aTime = u_attr.create("time", "tm", om.MFnUnitAttribute.kTime, 0.0)
+        cls.addAttribute(cls.aTime)
+
+        cls.aCacheFile = t_attr.create("cacheFile", "cf", om.MFnData.kString)
+        t_attr.usedAsFilename = True
+        cls.addAttribute(cls.aCacheFile)
+
+        cls.aOutRotate, cls.aOutRotateX, cls.aOutRotateY, cls.aOutRotateZ = create_out_rotate()
+        cls.addAttribute(cls.aOutRotate)
+
+        for attr in (cls.aTime, cls.aCacheFile):
+            for out_attr in (cls.aOutRotate, cls.aOutRotateX, cls.aOutRotateY, cls.aOutRotateZ):
+                cls.attributeAffects(attr, out_attr)
+
+    def read_cache(self, path):
+        """Get the cache of a file, it is only opened again when the path changes"""
+        if self.cache is None or self.cache.path != path:
+            self.cache = RotationCache(path) if path else None
+        return self.cache
+
+    def compute(self, plug, data):
+        attrs = (self.aOutRotate, self.aOutRotateX, self.aOutRotateY, self.aOutRotateZ)
+        if plug.attribute() not in attrs:
+            return None
+        cache = self.read_cache(data.inputValue(self.aCacheFile).asString())
+        if cache is not None:
+            frame = data.inputValue(self.aTime).asTime().asUnits(om.MTime.uiUnit())
+            write_out_rotate(data, attrs, cache.frame(frame))
+        data.setClean(plug)
+
+
+class SineApiEdit(om.MPxCommand):
+    kCommandName = COMMAND_NAME
+
+    def __init__(self):
+        super(SineApiEdit, self).__init__()
+        self.modifier = None
+        self.change = None
+
+    @classmethod
+    def creator(cls):
+        return cls()
+
+    def isUndoable(self):
+        return self.modifier is not None
+
+    def doIt(self, args):
+        edit = take_edit()
+        if edit is None:
+            raise RuntimeError("{} only runs the edits of sine_tool.scene.undo.run_edit()".format(COMMAND_NAME))
+        self.modifier = om.MDGModifier()
+        self.change = oma.MAnimCurveChange()
+        try:
+            edit(self.modifier, self.change)
+        except Exception:
+            self.undoIt()
+            self.modifier = None
+            raise
+
+    def redoIt(self):
+        self.modifier.doIt()
+        self.change.redoIt()
+
+    def undoIt(self):
+        # keys first, their curves may be created by the modifier
+        self.change.undoIt()
+        self.modifier.undoIt()
+
+
+def initializePlugin(plugin):
+    fn_plugin = om.MFnPlugin(plugin, "rxSine", "1.0", "Any")
+    fn_plugin.registerNode(SineSolver.kNodeName, SineSolver.kNodeId, SineSolver.creator, SineSolver.initialize)
+    fn_plugin.registerNode(SineCacheReader.kNodeName, SineCacheReader.kNodeId, SineCacheReader.creator,
+                           SineCacheReader.initialize)
+    fn_plugin.registerCommand(SineApiEdit.kCommandName, SineApiEdit.creator)
+
+
+def uninitializePlugin(plugin):
+    fn_plugin = om.MFnPlugin(plugin)
+    fn_plugin.deregisterCommand(SineApiEdit.kCommandName)
+    fn_plugin.deregisterNode(SineCacheReader.kNodeId)
+    fn_plugin.deregisterNode(SineSolver.kNodeId)
@@ -0,0 +1,193 @@
+"""
+Batched application of the build plans through OpenMaya modifiers
+
+helper.apply_plan(), the sequential reference build, runs one or more commands
+per step, each of them paying the undo, refresh and wrapping overhead. Here the
+steps which only create nodes, set plugs, add attributes or connect plugs are
+queued on a few MDagModifier / MDGModifier, each run by a single doIt() :
+
+    nodes : every planned node created and renamed
+    transforms : local transforms, joint orients, display plugs, joint inverseScale
+    (controls, spline IKs and annotations built by the step applier)
+    values : nodes moved under the controls, added attributes, set values
+    connections : every planned connection
+
+Locks, constraints, controller tags, expressions and sets are applied afterwards
+by the step applier, in plan order. The rotations of the frozen joints are set on
+their joint orient, as makeIdentity does in the sequential build.
+sine_tool.scene.cmds_helper.compare_appliers() builds a plan both ways and
+compares the parents, world matrices and connections of the planned nodes.
+"""
+import maya.api.OpenMaya as om
+
+# steps building shapes or solvers, left to the step applier
+CREATE_OPS = ("control", "ik_spline", "curve_controls", "annotation")
+BATCHED_OPS = ("node", "attr", "set_attr", "connect", "lock", "plugin") + CREATE_OPS
+
+
+def _object(name):
+    selection = om.MSelectionList()
+    selection.add(name)
+    return selection.getDependNode(0)
+
+
+def _plug(name):
+    selection = om.MSelectionList()
+    selection.add(name)
+    return selection.getPlug(0)
+
+
+def _world_matrix(name):
+    selection = om.MSelectionList()
+    selection.add(name)
+    return selection.getDagPath(0).inclusiveMatrix()
+
+
+def _attribute(name, flags):
+    """attribute MObject of pm.addAttr flags (at double, bool or enum, dv, min, max, smn, smx, en, keyable)"""
+    if flags["at"] == "enum":
+        fn = om.MFnEnumAttribute()
+        attr = fn.create(name, name, 0)
+        for index, field in enumerate(i for i in flags["en"].split(":") if i):
+            fn.addField(field, index)
+    else:
+        fn = om.MFnNumericAttribute()
+        data_type = om.MFnNumericData.kBoolean if flags["at"] == "bool" else om.MFnNumericData.kDouble
+        attr = fn.create(name, name, data_type, flags.get("dv", 0))
+        if "min" in flags:
+            fn.setMin(flags["min"])
+        if "max" in flags:
+            fn.setMax(flags["max"])
+        if "smn" in flags:
+            fn.setSoftMin(flags["smn"])
+        if "smx" in flags:
+            fn.setSoftMax(flags["smx"])
+    fn.keyable = flags.get("keyable", False)
+    return attr
+
+
+def _set_value(modifier, plug, value):
+    if isinstance(value, bool):
+        modifier.newPlugValueBool(plug, value)
+    elif isinstance(value, int):
+        modifier.newPlugValueInt(plug, value)
+    else:
+        modifier.newPlugValueDouble(plug, float(value))
+
+
+def _queue_transform(modifier, obj, fields, parent_world):
+    fn = om.MFnDependencyNode(obj)
+    local = om.MMatrix(fields["matrix"])
+    if parent_world is not None:
+        local *= parent_world.inverse()
+    transform = om.MTransformationMatrix(local)
+    rotation = transform.rotation()
+    rotate = "jointOrient" if fields.get("freeze") else "rotate"
+    for attr, values in (("translate", transform.translation(om.MSpace.kTransform)),
+                         (rotate, (rotation.x, rotation.y, rotation.z)),
+                         ("scale", transform.scale(om.MSpace.kTransform))):
+        for axis, value in zip("XYZ", values):
+            modifier.newPlugValueDouble(fn.findPlug(attr + axis, False), value)
+    if fields.get("draw_style") is not None:
+        modifier.newPlugValueInt(fn.findPlug("drawStyle", False), fields["draw_style"])
+    if fields.get("visibility") is not None:
+        modifier.newPlugValueBool(fn.findPlug("visibility", False), fields["visibility"])
+
+
+def apply_plan_batched(plan, apply_step):
+    """Build a setup plan in the scene with batched modifiers.
+
+    Arguments:
+        plan (BuildPlan): steps computed by sine_tool.engine.plan.plan_setup()
+        apply_step (function): (op, fields) -> created node names, applier of the steps
+            which are not batched, helper.apply_step()
+
+    Returns:
+        list of str: the created nodes
+    """
+    created = []
+    for op, fields in plan.steps:
+        if op == "plugin":
+            created += apply_step(op, fields)
+
+    nodes = plan.find("node")
+    controls = dict((fields["name"], fields) for fields in plan.find("control"))
+    worlds = dict((fields["name"], fields["matrix"]) for fields in nodes + list(controls.values()))
+    types = dict((fields["name"], fields["type"]) for fields in nodes)
+
+    # nodes, the ones parented under a control are created under the world and moved later
+    dag, dg = om.MDagModifier(), om.MDGModifier()
+    objects = {}
+    deferred = []
+    for fields in nodes:
+        name, parent = fields["name"], fields.get("parent")
+        if fields.get("matrix") is None:
+            obj = dg.createNode(fields["type"])
+            dg.renameNode(obj, name)
+        else:
+            if parent in controls:
+                deferred.append((name, parent))
+            if parent in objects:
+                obj = dag.createNode(fields["type"], objects[parent])
+            elif parent and parent not in controls:
+                obj = dag.createNode(fields["type"], _object(parent))
+            else:
+                obj = dag.createNode(fields["type"])
+            dag.renameNode(obj, name)
+        objects[name] = obj
+    dg.doIt()
+    dag.doIt()
+
+    # transforms
+    dag = om.MDagModifier()
+    for fields in nodes:
+        if fields.get("matrix") is None:
+            continue
+        parent = fields.get("parent")
+        if parent in worlds:
+            parent_world = om.MMatrix(worlds[parent])
+        elif parent:
+            parent_world = _world_matrix(parent)
+        else:
+            parent_world = None
+        obj = objects[fields["name"]]
+        _queue_transform(dag, obj, fields, parent_world)
+        if fields["type"] == "joint" and parent in types and types[parent] == "joint":
+            dag.connect(om.MFnDependencyNode(objects[parent]).findPlug("scale", False),
+                        om.MFnDependencyNode(obj).findPlug("inverseScale", False))
+    dag.doIt()
+
+    for op, fields in plan.steps:
+        if op in CREATE_OPS:
+            created += apply_step(op, fields)
+
+    # values
+    dag = om.MDagModifier()
+    for name, parent in deferred:
+        dag.reparentNode(objects[name], _object(parent))
+    for fields in plan.find("attr"):
+        dag.addAttribute(_object(fields["node"]), _attribute(fields["name"], fields["flags"]))
+    for fields in plan.find("set_attr"):
+        _set_value(dag, _plug(fields["plug"]), fields["value"])
+    dag.doIt()
+
+    # connections, forced as connectAttr -f
+    dg = om.MDGModifier()
+    for fields in plan.find("connect"):
+        destination = _plug(fields["destination"])
+        if destination.isDestination:
+            dg.disconnect(destination.source(), destination)
+        dg.connect(_plug(fields["source"]), destination)
+    dg.doIt()
+
+    for fields in plan.find("lock"):
+        plug = _plug(fields["plug"])
+        plug.isKeyable = fields["keyable"]
+        if fields.get("channel_box") is not None:
+            plug.isChannelBox = fields["channel_box"]
+        plug.isLocked = fields["lock"]
+
+    for op, fields in plan.steps:
+        if op not in BATCHED_OPS:
+            created += apply_step(op, fields)
+    return [om.MFnDependencyNode(obj).name() for obj in objects.values()] + created
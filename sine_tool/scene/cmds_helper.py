@@ -0,0 +1,509 @@
+"""
+pymel free build of the setups, maya.cmds and OpenMaya 2 only
+
+Counterparts of the helper functions used by the build, working on node names
+instead of PyNodes: nothing is wrapped, attributes are reached by plug names and
+the icon points come from sine_tool.engine.shapes. build_setup() plans and builds
+a setup without importing pymel, benchmark() times it against the pymel build on
+a synthetic scene and compare_appliers() checks the batched build against the
+sequential helper.apply_plan(). sine_tool.scene is kept apart from sine_tool.utils, whose
+package imports pymel and PySide2.
+"""
+import sys
+import time
+from functools import wraps
+
+import maya.api.OpenMaya as om
+import maya.api.OpenMayaAnim as oma
+from maya import cmds
+
+from ..engine import shapes
+from ..engine.plan import MASTER_GRP_NAME, PYMEL_BUILD, CMDS_BUILD, plan_setup
+from .batch import apply_plan_batched
+
+
+def frame_rate():
+    """Get the scene frame rate, an int for the whole frame rates as helper.getFrameRate()"""
+    rate = om.MTime(1.0, om.MTime.kSeconds).asUnits(om.MTime.uiUnit())
+    return int(round(rate)) if abs(rate - round(rate)) < 1e-6 else rate
+
+
+def scene_state(slaves):
+    """
+    read the few scene values the build plan depends on, see sine_tool.engine.plan.plan_setup()
+    """
+    names, parents, locked_scale = {}, {}, {}
+    for chain in slaves.values():
+        for slave in chain:
+            parent = cmds.listRelatives(slave, parent=True)
+            names[slave] = cmds.ls(slave)[0]
+            parents[slave] = parent[0] if parent else None
+            locked_scale[slave] = [cmds.getAttr(slave + '.scale' + axis, lock=True) for axis in "XYZ"]
+    return dict(names=names,
+                parents=parents,
+                locked_scale=locked_scale,
+                master_grp_exists=cmds.objExists(MASTER_GRP_NAME),
+                frame_rate=frame_rate())
+
+
+# icons
+# ///////////////////////////////////////////////////////////////
+def set_color(node, color):
+    for shape in cmds.listRelatives(node, shapes=True, fullPath=True) or []:
+        cmds.setAttr(shape + ".overrideEnabled", True)
+        if isinstance(color, int):
+            cmds.setAttr(shape + ".overrideColor", color)
+        else:
+            cmds.setAttr(shape + ".overrideRGBColors", 1)
+            cmds.setAttr(shape + ".overrideColorRGB", color[0], color[1], color[2])
+
+
+class ShapeCache(object):
+    """
+    CV arrays of the icons built during a build session, keyed by the icon and its arguments
+
+    The first control of a kind is built by its icon function and its curves are read
+    back, the next ones are created from the raw arrays by MFnNurbsCurve.create(),
+    without building, rotating, reparenting and deleting the sub curves again.
+    """
+
+    def __init__(self):
+        self.templates = {}
+
+    @staticmethod
+    def key(icon, **kwargs):
+        def value(i):
+            if hasattr(i, "__iter__"):
+                return tuple(round(float(j), 6) for j in i)
+            return round(float(i), 6) if i is not None else None
+
+        return (icon,) + tuple((k, value(v)) for k, v in sorted(kwargs.items()))
+
+    def __contains__(self, key):
+        return key in self.templates
+
+    def store(self, key, node):
+        """read the curves of a built icon"""
+        selection = om.MSelectionList()
+        selection.add(node)
+        path = selection.getDagPath(0)
+        curves = []
+        for index in range(path.numberOfShapesDirectlyBelow()):
+            shape = om.MDagPath(path).extendToShape(index)
+            fn = om.MFnNurbsCurve(shape)
+            curves.append((fn.cvPositions(om.MSpace.kObject), fn.knots(), fn.degree, fn.form))
+        self.templates[key] = curves
+
+    def create(self, key, name, parent, matrix):
+        """create an icon from the stored curves, matrix is its world matrix
+
+        Returns:
+            str: the transform of the icon
+        """
+        fn = om.MFnNurbsCurve()
+        transform = None
+        for index, (cvs, knots, degree, form) in enumerate(self.templates[key]):
+            if transform is None:
+                transform = fn.create(cvs, knots, degree, form, False, True)
+                om.MFnDependencyNode(transform).setName(name)
+                fn.setName(name + "Shape")
+            else:
+                fn.create(cvs, knots, degree, form, False, True, transform)
+                fn.setName("{}_{}crvShape".format(name, index - 1))
+        node = om.MFnDagNode(transform).partialPathName()
+        cmds.xform(node, m=matrix)
+        if parent:
+            node = cmds.parent(node, parent)[0]
+        return node
+
+
+_shape_cache = None
+
+
+def active_shape_cache():
+    """the ShapeCache of the running build session, None outside of it"""
+    return _shape_cache
+
+
+def shape_session(func):
+    """Decorator - the icons created during the call share a ShapeCache"""
+
+    @wraps(func)
+    def wrap(*args, **kwargs):
+        global _shape_cache
+        owner = _shape_cache is None
+        if owner:
+            _shape_cache = ShapeCache()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if owner:
+                _shape_cache = None
+
+    return wrap
+
+
+def create_ctl(parent, name, matrix, color, icon, w=1, h=1, d=1, po=None):
+    """helper.create_ctl() on names, the shapes of the sub curves are merged under one transform"""
+    cache = active_shape_cache()
+    key = ShapeCache.key(icon, w=w, h=h, d=d, po=po)
+    if cache is not None and key in cache:
+        node = cache.create(key, name, parent, matrix)
+        set_color(node, color)
+        return node
+
+    node = None
+    for index, curve in enumerate(shapes.icon_curves(icon, w, h, d, po)):
+        curve_name = name if node is None else "{}_{}crv".format(name, index - 1)
+        curve = cmds.curve(n=curve_name, **shapes.curve_args(*curve))
+        if node is None:
+            node = curve
+            continue
+        cmds.parent(cmds.listRelatives(curve, shapes=True, fullPath=True), node, r=True, s=True)
+        cmds.delete(curve)
+    if cache is not None:
+        cache.store(key, node)
+    cmds.xform(node, m=matrix)
+    if parent:
+        node = cmds.parent(node, parent)[0]
+    set_color(node, color)
+    return node
+
+
+# controller tags
+# ///////////////////////////////////////////////////////////////
+def _walk_tag(node):
+    tags = cmds.listConnections(node, t="controller", et=True)
+    return tags[0] if tags else None
+
+
+def add_controller_tag(ctl, parent=None):
+    """helper.add_controller_tag() under the tag of the parent controller"""
+    if cmds.about(apiVersion=True) < 201650:
+        return
+    cmds.controller(ctl)
+    tag = cmds.controller(ctl, q=True)[0]
+    parent_tag = _walk_tag(parent) if parent else None
+    if parent_tag and cmds.controller(parent_tag, q=True):
+        parent_tag = cmds.controller(parent_tag, q=True)[0]
+        cmds.setAttr(parent_tag + ".cycleWalkSibling", True)
+        cmds.connectAttr(parent_tag + ".prepopulate", tag + ".prepopulate", f=True)
+        indices = cmds.getAttr(parent_tag + ".children", multiIndices=True) or []
+        connected = [i for i in indices
+                     if cmds.listConnections("{}.children[{}]".format(parent_tag, i), s=True, d=False)]
+        index = ([i for i in indices if i not in connected] or [len(indices)])[0]
+        for source in cmds.listConnections(tag + ".parent", p=True, s=False, d=True) or []:
+            cmds.disconnectAttr(tag + ".parent", source)
+        cmds.connectAttr(tag + ".parent", "{}.children[{}]".format(parent_tag, index))
+    return tag
+
+
+# plan steps
+# ///////////////////////////////////////////////////////////////
+def _curve_positions(curve, count):
+    """positions at even lengths of a curve, helper.get_average_distance_on_curve()"""
+    selection = om.MSelectionList()
+    selection.add(curve)
+    fn = om.MFnNurbsCurve(selection.getDagPath(0).extendToShape())
+    step = fn.length() / (count - 1)
+    return [fn.getPointAtParam(fn.findParamFromLength(step * i), om.MSpace.kWorld) for i in range(count)]
+
+
+def apply_graph(graph):
+    """Create a node network description in the scene
+
+    Arguments:
+        graph (Graph): node network built by sine_tool.engine.graph
+
+    Returns:
+        list of str: the created nodes
+    """
+    if any(node_type == "eulerToQuat" for _, node_type in graph.nodes) and \
+            not cmds.pluginInfo("quatNodes", q=True, loaded=True):
+        cmds.loadPlugin("quatNodes", quiet=True)
+    created, curves = [], []
+    selection = om.MSelectionList()
+    for name, node_type in graph.nodes:
+        created.append(cmds.createNode(node_type, n=name, ss=True))
+        if name in graph.curves:
+            curves.append(name)
+            selection.add(created[-1])
+    # MFnAnimCurve.addKeys() only takes time input curves, the keys of the lookups are added
+    # one by one through the API, without a command per key
+    for index, curve in enumerate(curves):
+        fn = oma.MFnAnimCurve(selection.getDependNode(index))
+        tangent, keys = graph.curves[curve]
+        out_tangent = oma.MFnAnimCurve.kTangentStep if tangent == "step" else oma.MFnAnimCurve.kTangentLinear
+        for x, y in keys:
+            fn.addKey(float(x), float(y), oma.MFnAnimCurve.kTangentLinear, out_tangent)
+        fn.setPreInfinityType(oma.MFnAnimCurve.kCycle)
+        fn.setPostInfinityType(oma.MFnAnimCurve.kCycle)
+    for plug, value in graph.values:
+        cmds.setAttr(plug, value)
+    for source, destination in graph.connections:
+        cmds.connectAttr(source, destination, f=True)
+    return created
+
+
+def _apply_sets(name, members, mode, parent):
+    if mode == "new":
+        sets = cmds.sets(members, n=name)
+    else:
+        if cmds.objExists(name) and mode == "replace":
+            cmds.delete(name)
+        sets = name if cmds.objExists(name) else cmds.sets(em=True, n=name)
+        if members:
+            cmds.sets(members, include=sets)
+    if parent:
+        cmds.sets(sets, include=parent)
+    return sets
+
+
+def apply_step(op, fields):
+    """Build one step of a setup plan with maya.cmds, see helper.apply_step()
+
+    Returns:
+        list of str: the created nodes
+    """
+    if op == "node":
+        if fields.get("matrix") is None:
+            return [cmds.createNode(fields["type"], n=fields["name"])]
+        kwargs = dict(p=fields["parent"]) if fields.get("parent") else {}
+        node = cmds.createNode(fields["type"], n=fields["name"], ss=True, **kwargs)
+        cmds.xform(node, m=fields["matrix"], ws=True)
+        if fields.get("freeze"):
+            cmds.makeIdentity(node, a=1, t=0, r=1, s=0, n=0, pn=1)
+        if fields.get("draw_style") is not None:
+            cmds.setAttr(node + ".drawStyle", fields["draw_style"])
+        if fields.get("visibility") is not None:
+            cmds.setAttr(node + ".visibility", fields["visibility"])
+        return [node]
+    elif op == "control":
+        return [create_ctl(fields.get("parent"), fields["name"], fields["matrix"], fields["color"], fields["icon"],
+                           w=fields.get("w", 1), h=fields.get("h", 1), d=fields.get("d", 1), po=fields.get("po"))]
+    elif op == "attr":
+        cmds.addAttr(fields["node"], ln=fields["name"], **fields["flags"])
+    elif op == "set_attr":
+        cmds.setAttr(fields["plug"], fields["value"])
+    elif op == "lock":
+        kwargs = dict(lock=fields["lock"], keyable=fields["keyable"])
+        if fields.get("channel_box") is not None:
+            kwargs["channelBox"] = fields["channel_box"]
+        cmds.setAttr(fields["plug"], **kwargs)
+    elif op == "connect":
+        cmds.connectAttr(fields["source"], fields["destination"], f=True)
+    elif op == "constraint":
+        if fields["driver"]:
+            getattr(cmds, fields["type"])(fields["driver"], fields["driven"],
+                                          mo=fields["maintain_offset"], n=fields["name"])
+    elif op == "ik_spline":
+        handle, effector, curve = cmds.ikHandle(n=fields["handle"], sol="ikSplineSolver",
+                                                sj=fields["start"], ee=fields["end"], ccv=True, scv=False)
+        effector = cmds.rename(effector, fields["effector"])
+        curve = cmds.rename(curve, fields["curve"])
+        cmds.setAttr(curve + ".v", 0)
+        cmds.setAttr(handle + ".v", 0)
+        curve_parent = cmds.listRelatives(curve, parent=True)
+        if curve_parent:
+            handle = cmds.parent(handle, curve_parent[0])[0]
+        return [handle, effector, curve]
+    elif op == "curve_controls":
+        created, jnts = [], []
+        positions = _curve_positions(fields["curve"], len(fields["controls"]))
+        for (group, control, joint, size), position in zip(fields["controls"], positions):
+            matrix = [1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0,
+                      position.x, position.y, position.z, 1.0]
+            grp = cmds.createNode("transform", n=group, p=fields["parent"], ss=True)
+            cmds.xform(grp, m=matrix, ws=True)
+            ctl = create_ctl(grp, control, matrix, fields["color"], "null", w=size)
+            jnt = cmds.createNode("joint", n=joint, p=ctl, ss=True)
+            cmds.setAttr(jnt + ".visibility", False)
+            jnts.append(jnt)
+            created += [grp, ctl, jnt]
+        cmds.skinCluster(jnts + [fields["curve"]], tsb=True, dr=2.0, n=fields["skin_cluster"])
+        return created
+    elif op == "controller":
+        add_controller_tag(fields["node"], fields.get("parent"))
+    elif op == "annotation":
+        shape = cmds.annotate(fields["node"], tx=fields["text"], p=fields["position"])
+        annotation = cmds.rename(cmds.listRelatives(shape, parent=True)[0], fields["name"])
+        shape = cmds.listRelatives(annotation, shapes=True)[0]
+        cmds.setAttr(shape + ".displayArrow", 0)
+        cmds.setAttr(annotation + ".overrideEnabled", 1)
+        cmds.setAttr(annotation + ".overrideDisplayType", 1)
+        return [cmds.parent(annotation, fields["node"])[0]]
+    elif op == "plugin":
+        if not cmds.pluginInfo(fields["path"], q=True, loaded=True):
+            cmds.loadPlugin(fields["path"], quiet=True)
+    elif op == "expression":
+        cmds.expression(s=fields["text"], ae=1, uc='all', o="", n=fields["name"])
+    elif op == "graph":
+        # numpy is only needed by the network backend
+        from ..engine.graph import Graph
+        return apply_graph(Graph.from_dict(fields["data"]))
+    elif op == "sets":
+        _apply_sets(fields["name"], fields["members"], fields["mode"], fields.get("parent"))
+    else:
+        raise ValueError("unknown plan step {}".format(op))
+    return []
+
+
+@shape_session
+def build_setup(slaves, matrices, config):
+    """Plan and build a sine setup without pymel, see sine_tool.operation.SineSetupMain
+
+    Returns:
+        BuildPlan: the built plan
+    """
+    plan = plan_setup(slaves, matrices, config, scene_state(slaves))
+    apply_plan_batched(plan, apply_step)
+    return plan
+
+
+# benchmark
+# ///////////////////////////////////////////////////////////////
+def synthetic_chains(chains=30, joints=20, length=1.0):
+    """Create joint chains to build setups on
+
+    Returns:
+        tuple: slaves (chain index -> joint names), matrices (chain index -> world matrices)
+    """
+    slaves, matrices = {}, {}
+    for chain in range(chains):
+        parent = cmds.createNode("transform", n="bench_{}_root".format(chain), ss=True)
+        cmds.setAttr(parent + ".translateZ", chain * length)
+        names = []
+        for index in range(joints):
+            parent = cmds.createNode("joint", n="bench_{}_{}_jnt".format(chain, index), p=parent, ss=True)
+            cmds.setAttr(parent + ".translateX", length if index else 0.0)
+            cmds.setAttr(parent + ".rotateZ", 5.0)
+            names.append(parent)
+        slaves[chain] = names
+        matrices[chain] = [cmds.xform(i, q=True, m=True, ws=True) for i in names]
+    return slaves, matrices
+
+
+def benchmark(chains=30, joints=20, backends=(PYMEL_BUILD, CMDS_BUILD), config=None, force=False):
+    """Time the build of a setup on synthetic chains with each build backend, each in a new scene.
+
+    Both builds share the icons of a shape session, see shape_session().
+
+    Arguments:
+        force (bool): discard the unsaved changes of the current scene, the benchmark
+            refuses to run on a modified scene otherwise.
+
+    Returns:
+        dict: backend -> seconds, pymel_import -> seconds when pymel was imported by the benchmark
+    """
+    if cmds.file(q=True, modified=True) and not force:
+        raise RuntimeError("the current scene has unsaved changes, save it or run the benchmark with force=True")
+    timings = {}
+    if "pymel.core" not in sys.modules:
+        start = time.time()
+        import pymel.core  # noqa
+        timings["pymel_import"] = time.time() - start
+    from ..operation import SineSetupMain
+
+    config = dict(dict(name="bench", fk_size=1.0, ik_size=1.0, ik_count=3, color=[1.0, 0.5, 0.0]), **(config or {}))
+    undo = cmds.undoInfo(q=True, state=True)
+    cmds.undoInfo(state=False)
+    try:
+        for backend in backends:
+            cmds.file(new=True, force=True)
+            slaves, matrices = synthetic_chains(chains, joints)
+            start = time.time()
+            if backend == CMDS_BUILD:
+                build_setup(slaves, matrices, config)
+            else:
+                SineSetupMain(slaves, matrices, dict(config, build=backend))
+            timings[backend] = time.time() - start
+    finally:
+        cmds.undoInfo(state=undo)
+    return timings
+
+
+def scene_snapshot(plan):
+    """Read back what a plan built: parents and world matrices of the planned nodes and
+    the connections between them
+
+    Returns:
+        dict: nodes (name -> (parent, matrix) or None if missing), connections (sorted (source, destination))
+    """
+    names = set(name for name, _ in plan.nodes())
+    # the slaves and constraints are named by the plan too, unlike the nodes made by the commands
+    for fields in plan.find("connect"):
+        names.add(fields["destination"].split(".")[0])
+    for fields in plan.find("constraint"):
+        names.update((fields["name"], fields["driven"]))
+    nodes, connections = {}, set()
+    for name, node_type in plan.nodes():
+        if not cmds.objExists(name):
+            nodes[name] = None
+            continue
+        parent = None
+        matrix = None
+        if node_type in ("transform", "joint"):
+            parent = (cmds.listRelatives(name, parent=True) or [None])[0]
+            matrix = cmds.xform(name, q=True, ws=True, m=True)
+        nodes[name] = (parent, matrix)
+        plugs = cmds.listConnections(name, s=False, d=True, c=True, p=True, scn=True) or []
+        for source, destination in zip(plugs[::2], plugs[1::2]):
+            if destination.split(".")[0] in names:
+                connections.add((source, destination))
+    return dict(nodes=nodes, connections=sorted(connections))
+
+
+def _same_node(a, b, tolerance):
+    if a is None or b is None:
+        return a is b
+    if a[0] != b[0] or (a[1] is None) != (b[1] is None):
+        return False
+    return a[1] is None or max(abs(i - j) for i, j in zip(a[1], b[1])) <= tolerance
+
+
+def compare_appliers(chains=4, joints=6, config=None, force=False, tolerance=1e-6):
+    """Build the same plan with helper.apply_plan(), the sequential reference build, and
+    with apply_plan_batched(), each in a new scene, and compare what they built.
+
+    Arguments:
+        force (bool): discard the unsaved changes of the current scene, see benchmark().
+        tolerance (float): max difference of the world matrices.
+
+    Returns:
+        dict: sequential / batched -> seconds, differences -> list of str, empty when both
+            builds have the same parents, world matrices and connections
+    """
+    if cmds.file(q=True, modified=True) and not force:
+        raise RuntimeError("the current scene has unsaved changes, save it or compare with force=True")
+    from ..utils import helper
+
+    config = dict(dict(name="parity", fk_size=1.0, ik_size=1.0, ik_count=3, color=[1.0, 0.5, 0.0]),
+                  **(config or {}))
+    result, snapshots = {}, {}
+    undo = cmds.undoInfo(q=True, state=True)
+    cmds.undoInfo(state=False)
+    try:
+        for applier in ("sequential", "batched"):
+            cmds.file(new=True, force=True)
+            slaves, matrices = synthetic_chains(chains, joints)
+            plan = plan_setup(slaves, matrices, config, scene_state(slaves))
+            start = time.time()
+            if applier == "sequential":
+                helper.apply_plan(plan)
+            else:
+                shape_session(apply_plan_batched)(plan, helper.apply_step)
+            result[applier] = time.time() - start
+            snapshots[applier] = scene_snapshot(plan)
+    finally:
+        cmds.undoInfo(state=undo)
+
+    sequential, batched = snapshots["sequential"], snapshots["batched"]
+    differences = []
+    for name in sorted(sequential["nodes"]):
+        if not _same_node(sequential["nodes"][name], batched["nodes"].get(name), tolerance):
+            differences.append("{}: {} != {}".format(name, sequential["nodes"][name], batched["nodes"].get(name)))
+    for connection in sorted(set(sequential["connections"]) ^ set(batched["connections"])):
+        side = "sequential" if connection in sequential["connections"] else "batched"
+        differences.append("{} -> {} only in the {} build".format(connection[0], connection[1], side))
+    result["differences"] = differences
+    return result
@@ -0,0 +1,46 @@
+"""
+Undoable edits through the API
+
+The nodes created by an MDGModifier and the keys written by MFnAnimCurve are not
+recorded in the undo queue on their own. run_edit() hands an edit to the sineApiEdit
+command of the sine plugin (sine_tool/plugins/sine_solver.py), the command runs it
+with an MDGModifier and an MAnimCurveChange it owns and reverts / replays both of
+them, the edit is one entry of the undo queue, inside the undo chunk of the caller.
+"""
+from maya import cmds
+
+from ..engine.plan import SOLVER_PLUGIN
+
+COMMAND_NAME = "sineApiEdit"
+
+_pending = []
+
+
+def load_plugin():
+    if not cmds.pluginInfo(SOLVER_PLUGIN, q=True, loaded=True):
+        cmds.loadPlugin(SOLVER_PLUGIN, quiet=True)
+
+
+def take_edit():
+    """Get the edit passed to the sineApiEdit command, None when it was not run by run_edit()"""
+    return _pending.pop() if _pending else None
+
+
+def run_edit(edit):
+    """Run an edit of the scene as one undoable sineApiEdit command.
+
+    Arguments:
+        edit (callable): edit(modifier, change), every change of the scene goes through the
+            MDGModifier or the MAnimCurveChange, both are reverted by an undo.
+
+    Returns:
+        the result of the edit
+    """
+    load_plugin()
+    result = []
+    _pending.append(lambda modifier, change: result.append(edit(modifier, change)))
+    try:
+        getattr(cmds, COMMAND_NAME)()
+    finally:
+        del _pending[:]
+    return result[0] if result else None
@@ -21,6 +21,8 @@ from ..utils import *
 from ..utils.helper import disable_undo
 from ..utils.pipeline_helper import PIPLINE_AVAILABLE, USER_PATH, PROJECT_NAME, USER_NAME
 from ..utils.py_compatible import ensure_text, string_types
+from ..engine.noise import is_calibrated
+from ..engine.plan import BACKENDS, EXPRESSION_BACKEND, BUILD_BACKENDS, PYMEL_BUILD, NOISE_ATTRS, BAKE_MODES
 from ..operation import SineSetupMain
 
 MODULE_DIR = os.path.dirname(os.path.normpath(__file__)).replace("\\", "/")
@@ -112,6 +114,11 @@ class SineUI(MainWindow):
         text = ["Clear Sets", "セットをクリア"]
         self.right_btn = PyPushButton(text[self._L])
 
+        self.bake_mode_cbx = PyCombobox()
+        self.bake_mode_cbx.addItems(BAKE_MODES)
+        text = ["Bake Setup", "セットアップをベイク"]
+        self.bake_btn = PyPushButton(text[self._L])
+
     def create_layout(self):
 
         # left
@@ -142,11 +149,16 @@ class SineUI(MainWindow):
         master_list_layout = QtWidgets.QVBoxLayout()
         master_list_layout.addWidget(self.master_lw)
 
+        bake_layout = QtWidgets.QHBoxLayout()
+        bake_layout.addWidget(self.bake_mode_cbx, 1)
+        bake_layout.addWidget(self.bake_btn, 2)
+
         right_btn_layout = QtWidgets.QHBoxLayout()
         right_btn_layout.addWidget(self.right_btn)
 
         right_layout.addLayout(top_right_btn_layout)
         right_layout.addLayout(master_list_layout)
+        right_layout.addLayout(bake_layout)
         right_layout.addLayout(right_btn_layout)
 
         # main
@@ -196,6 +208,7 @@ class SineUI(MainWindow):
 
         self.right_top_btn.clicked.connect(self.delete_selected_setup)
         self.right_btn.clicked.connect(self.clear_related_sets)
+        self.bake_btn.clicked.connect(self.bake_selected_setup)
 
         self.source_lw.itemDoubleClicked.connect(self.select_source_item)
         self.master_lw.itemDoubleClicked.connect(self.select_master_item)
@@ -420,6 +433,16 @@ class SineUI(MainWindow):
         if pm.objExists("Sine_Grp") and not pm.PyNode("Sine_Grp").getChildren():
             pm.delete("Sine_Grp")
 
+    def bake_selected_setup(self):
+        """ bake the selected setups over the playback range, every setup when nothing is selected """
+        # numpy is only needed by the bake
+        from ..bake import bake
+
+        setups = [i.text() for i in self.master_lw.selectedItems()] or None
+        baked = bake(setups, mode=self.bake_mode_cbx.currentText())
+        if baked:
+            pm.select(baked)
+
     @staticmethod
     def clear_related_sets():
         sets = pm.ls("Sine*Sets", type="objectSet") + pm.ls("Sine*Sets_old*", type="objectSet")
@@ -536,9 +559,9 @@ class SineSettingsDialog(SubWindow):
         self.titleBar.set_title("Sine Ctrl Settings")
         self.setWindowTitle("Sine Ctrl Settings")
         if DPI_SCALE == 1.5:
-            self.setFixedSize(380 * DPI_SCALE, 350 * DPI_SCALE)
+            self.setFixedSize(380 * DPI_SCALE, 440 * DPI_SCALE)
         else:
-            self.setFixedSize(420 * DPI_SCALE, 390 * DPI_SCALE)
+            self.setFixedSize(420 * DPI_SCALE, 480 * DPI_SCALE)
 
         self.make_tooltips_toplayer()
 
@@ -551,7 +574,10 @@ class SineSettingsDialog(SubWindow):
             ik_size=1.0,
             ik_count=1,
             use_index=self.use_index,
-            color=self.raw_color_value
+            color=self.raw_color_value,
+            backend=EXPRESSION_BACKEND,
+            build=PYMEL_BUILD,
+            static={}
         )
 
     def create_widgets(self):
@@ -575,6 +601,26 @@ class SineSettingsDialog(SubWindow):
         text = ["Cancel", "キャンセル"]
         self.cancel_btn = PyPushButton(text[self._L])
 
+        self.backend_cbx = PyCombobox()
+        self.backend_cbx.addItems(BACKENDS)
+        # the other backends rebuild MEL noise() from the gradient table of sine_tool.engine.noise
+        if is_calibrated():
+            text = ["noise table calibrated against Maya noise()",
+                    "ノイズテーブルは Maya の noise() に合わせて調整済みです"]
+        else:
+            text = ["noise table not calibrated yet, it is calibrated against Maya noise() "
+                    "the first time this backend is used with noise (engine.noise.calibrate_from_maya())",
+                    "ノイズテーブルは未調整です、ノイズありで初めて使用する際に Maya の noise() に合わせて"
+                    "調整されます (engine.noise.calibrate_from_maya())"]
+        for index, backend in enumerate(BACKENDS):
+            if backend != EXPRESSION_BACKEND:
+                self.backend_cbx.setItemData(index, ensure_text(text[self._L]), QtCore.Qt.ToolTipRole)
+        self.build_cbx = PyCombobox()
+        self.build_cbx.addItems(BUILD_BACKENDS)
+        # without noise its attributes are locked at zero, the backends drop the noise terms
+        self.noise_cbx = PyCombobox()
+        self.noise_cbx.addItems(["on", "off"])
+
     def create_layout(self):
         main_layout = QtWidgets.QVBoxLayout()
         main_layout.addWidget(self.label)
@@ -604,6 +650,15 @@ class SineSettingsDialog(SubWindow):
         text = ["IK Count :　", "IK Ctrl の 数　:　"]
         form_layout.addRow(text[self._L], self.ik_count_slider)
         form_layout.labelForField(self.ik_count_slider).setFont(font)
+        text = ["Backend :　", "駆動方式　:　"]
+        form_layout.addRow(text[self._L], self.backend_cbx)
+        form_layout.labelForField(self.backend_cbx).setFont(font)
+        text = ["Build :　", "構築方式　:　"]
+        form_layout.addRow(text[self._L], self.build_cbx)
+        form_layout.labelForField(self.build_cbx).setFont(font)
+        text = ["Noise :　", "ノイズ　:　"]
+        form_layout.addRow(text[self._L], self.noise_cbx)
+        form_layout.labelForField(self.noise_cbx).setFont(font)
 
         # # COLOR BUTTONS
         self.color_visual_btn = QtWidgets.QPushButton()
@@ -685,7 +740,10 @@ class SineSettingsDialog(SubWindow):
             ik_size=self.ik_size_slider.value(),
             ik_count=self.ik_count_slider.value(),
             use_index=self.use_index,
-            color=[i for i in self.raw_color_value]
+            color=[i for i in self.raw_color_value],
+            backend=self.backend_cbx.currentText(),
+            build=self.build_cbx.currentText(),
+            static=dict.fromkeys(NOISE_ATTRS, 0.0) if self.noise_cbx.currentText() == "off" else {}
         )
         self.accept()
 
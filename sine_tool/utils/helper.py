@@ -6,6 +6,10 @@ from maya import cmds
 from pymel.core import datatypes
 from pymel import versions
 
+from ..engine import shapes
+from ..scene.cmds_helper import ShapeCache, active_shape_cache, apply_graph, shape_session, \
+    set_color as set_shape_color
+
 def getTransformFromPos(pos):
     """Create a transformation Matrix from a given position.
 
@@ -520,21 +524,10 @@ def getPointArrayWithOffset(point_pos, pos_offset=None, rot_offset=None):
         list of vector: the new point positions
 
     """
-    points = []
-    for v in point_pos:
-        if rot_offset:
-            mv = om.MVector(v.x, v.y, v.z)
-            mv = mv.rotateBy(om.MEulerRotation(rot_offset.x,
-                                               rot_offset.y,
-                                               rot_offset.z,
-                                               om.MEulerRotation.kXYZ))
-            v = datatypes.Vector(mv.x, mv.y, mv.z)
-        if pos_offset:
-            v = v + pos_offset
-
-        points.append(v)
-
-    return points
+    points = shapes.transform_points([tuple(v) for v in point_pos],
+                                     rotation=tuple(rot_offset) if rot_offset else None,
+                                     offset=tuple(pos_offset) if pos_offset else None)
+    return [datatypes.Vector(v) for v in points]
 
 
 def create_ctl(parent=None,
@@ -564,6 +557,14 @@ def create_ctl(parent=None,
     if "degree" not in kwargs.keys():
         kwargs["degree"] = 3
 
+    # icons already built in this build session are created from their curves
+    cache = active_shape_cache()
+    key = ShapeCache.key(icon, **kwargs)
+    if cache is not None and key in cache:
+        node = cache.create(key, name, parent.name() if parent else None, [float(v) for row in m for v in row])
+        set_shape_color(node, color)
+        return pm.PyNode(node)
+
     if icon == "cube":
         ctl = cube(parent,
                    name,
@@ -595,6 +596,8 @@ def create_ctl(parent=None,
     else:
         return pm.warning("invalid type of icon")
 
+    if cache is not None:
+        cache.store(key, ctl.name())
     return ctl
 
 
@@ -625,26 +628,7 @@ def cube(parent=None,
     Returns:
         dagNode: The newly created icon.
     """
-    lenX = width * 0.5
-    lenY = height * 0.5
-    lenZ = depth * 0.5
-
-    # p is positive, N is negative
-    ppp = datatypes.Vector(lenX, lenY, lenZ)
-    ppN = datatypes.Vector(lenX, lenY, lenZ * -1)
-    pNp = datatypes.Vector(lenX, lenY * -1, lenZ)
-    Npp = datatypes.Vector(lenX * -1, lenY, lenZ)
-    pNN = datatypes.Vector(lenX, lenY * -1, lenZ * -1)
-    NNp = datatypes.Vector(lenX * -1, lenY * -1, lenZ)
-    NpN = datatypes.Vector(lenX * -1, lenY, lenZ * -1)
-    NNN = datatypes.Vector(lenX * -1, lenY * -1, lenZ * -1)
-
-    v_array = [ppp, ppN, NpN, NNN, NNp, Npp, NpN, Npp, ppp, pNp, NNp, pNp, pNN,
-               ppN, pNN, NNN]
-
-    points = getPointArrayWithOffset(v_array,
-                                     pos_offset,
-                                     rot_offset)
+    points = shapes.icon_curves("cube", width, height, depth, pos_offset, rot_offset)[0][0]
 
     node = addCurve(parent, name, points, False, 1, m)
 
@@ -678,40 +662,10 @@ def sphere(parent=None,
         dagNode: The newly created icon.
 
     """
-    dlen = width * .5
-
-    v0 = datatypes.Vector(0, 0, -dlen * 1.108)
-    v1 = datatypes.Vector(dlen * .78, 0, -dlen * .78)
-    v2 = datatypes.Vector(dlen * 1.108, 0, 0)
-    v3 = datatypes.Vector(dlen * .78, 0, dlen * .78)
-    v4 = datatypes.Vector(0, 0, dlen * 1.108)
-    v5 = datatypes.Vector(-dlen * .78, 0, dlen * .78)
-    v6 = datatypes.Vector(-dlen * 1.108, 0, 0)
-    v7 = datatypes.Vector(-dlen * .78, 0, -dlen * .78)
-
-    ro = datatypes.Vector([1.5708, 0, 0])
-
-    points = getPointArrayWithOffset(
-        [v0, v1, v2, v3, v4, v5, v6, v7], pos_offset, rot_offset)
-    node = addCurve(parent, name, points, True, degree, m)
-
-    if rot_offset:
-        rot_offset += ro
-    else:
-        rot_offset = ro
-    points = getPointArrayWithOffset(
-        [v0, v1, v2, v3, v4, v5, v6, v7], pos_offset, rot_offset)
-    crv_0 = addCurve(parent, node + "_0crv", points, True, degree, m)
-
-    ro = datatypes.Vector([1.5708, 0, 1.5708])
-    if rot_offset:
-        rot_offset += ro
-    else:
-        rot_offset = ro
-    points = getPointArrayWithOffset(
-        [v0, v1, v2, v3, v4, v5, v6, v7], pos_offset, rot_offset + ro + ro)
-
-    crv_1 = addCurve(parent, node + "_1crv", points, True, degree, m)
+    curves = shapes.icon_curves("sphere", width, po=pos_offset, ro=rot_offset, degree=degree)
+    node = addCurve(parent, name, curves[0][0], True, degree, m)
+    crv_0 = addCurve(parent, node + "_0crv", curves[1][0], True, degree, m)
+    crv_1 = addCurve(parent, node + "_1crv", curves[2][0], True, degree, m)
 
     for crv in [crv_0, crv_1]:
         for shp in crv.listRelatives(shapes=True):
@@ -747,23 +701,10 @@ def null(parent=None,
         dagNode: The newly created icon.
 
     """
-    dlen = width * .5
-
-    v0 = datatypes.Vector(dlen, 0, 0)
-    v1 = datatypes.Vector(-dlen, 0, 0)
-    v2 = datatypes.Vector(0, dlen, 0)
-    v3 = datatypes.Vector(0, -dlen, 0)
-    v4 = datatypes.Vector(0, 0, dlen)
-    v5 = datatypes.Vector(0, 0, -dlen)
-
-    points = getPointArrayWithOffset([v0, v1], pos_offset, rot_offset)
-    node = addCurve(parent, name, points, False, 1, m)
-
-    points = getPointArrayWithOffset([v2, v3], pos_offset, rot_offset)
-    crv_0 = addCurve(parent, name, points, False, 1, m)
-
-    points = getPointArrayWithOffset([v4, v5], pos_offset, rot_offset)
-    crv_1 = addCurve(parent, name, points, False, 1, m)
+    curves = shapes.icon_curves("null", width, po=pos_offset, ro=rot_offset)
+    node = addCurve(parent, name, curves[0][0], False, 1, m)
+    crv_0 = addCurve(parent, name, curves[1][0], False, 1, m)
+    crv_1 = addCurve(parent, name, curves[2][0], False, 1, m)
 
     for crv in [crv_0, crv_1]:
         for shp in crv.listRelatives(shapes=True):
@@ -773,3 +714,138 @@ def null(parent=None,
     set_color(node, color)
 
     return node
+
+
+def _apply_sets(name, members, mode, parent):
+    if mode == "new":
+        sets = pm.sets(members, n=name)
+    else:
+        if pm.objExists(name) and mode == "replace":
+            pm.delete(name)
+        sets = pm.PyNode(name) if pm.objExists(name) else pm.sets(em=1, n=name)
+        if members:
+            sets.union(members)
+    if parent:
+        pm.PyNode(parent).add(sets)
+    return sets
+
+
+def apply_step(op, fields):
+    """Build one step of a setup plan in the scene, see sine_tool.engine.plan
+
+    Returns:
+        list of str: the created nodes
+    """
+    if op == "node":
+        parent = fields.get("parent")
+        if fields.get("matrix") is None:
+            # dependency node
+            node = pm.createNode(fields["type"], n=fields["name"])
+        else:
+            kwargs = dict(p=parent) if parent else {}
+            node = pm.createNode(fields["type"], n=fields["name"], ss=True, **kwargs)
+            pm.xform(node, m=fields["matrix"], ws=True)
+            if fields.get("freeze"):
+                pm.makeIdentity(node, a=1, t=0, r=1, s=0, n=0, pn=1)
+            if fields.get("draw_style") is not None:
+                node.drawStyle.set(fields["draw_style"])
+            if fields.get("visibility") is not None:
+                node.setAttr("visibility", fields["visibility"])
+        return [node.name()]
+    elif op == "control":
+        po = fields.get("po")
+        ctl = create_ctl(parent=pm.PyNode(fields["parent"]) if fields.get("parent") else None,
+                         name=fields["name"],
+                         m=datatypes.Matrix(fields["matrix"]),
+                         color=fields["color"],
+                         icon=fields["icon"],
+                         w=fields.get("w", 1),
+                         h=fields.get("h", 1),
+                         d=fields.get("d", 1),
+                         po=datatypes.Vector(po) if po else None)
+        return [ctl.name()]
+    elif op == "attr":
+        pm.addAttr(fields["node"], ln=fields["name"], **fields["flags"])
+    elif op == "set_attr":
+        pm.setAttr(fields["plug"], fields["value"])
+    elif op == "lock":
+        kwargs = dict(lock=fields["lock"], keyable=fields["keyable"])
+        if fields.get("channel_box") is not None:
+            kwargs["channelBox"] = fields["channel_box"]
+        pm.setAttr(fields["plug"], **kwargs)
+    elif op == "connect":
+        pm.connectAttr(fields["source"], fields["destination"], f=True)
+    elif op == "constraint":
+        if fields["driver"]:
+            getattr(pm, fields["type"])(fields["driver"], fields["driven"],
+                                        mo=fields["maintain_offset"], n=fields["name"])
+    elif op == "ik_spline":
+        handle, effector, curve = pm.ikHandle(n=fields["handle"],
+                                              sol="ikSplineSolver",
+                                              sj=fields["start"], ee=fields["end"], ccv=True, scv=False)
+        effector.rename(fields["effector"])
+        curve.rename(fields["curve"])
+        curve.v.set(0)
+        handle.v.set(0)
+        pm.parent(handle, curve.getParent())
+        return [handle.name(), effector.name(), curve.name()]
+    elif op == "curve_controls":
+        curve = pm.PyNode(fields["curve"])
+        positions = get_average_distance_on_curve(curve, len(fields["controls"]))
+        created, jnts = [], []
+        for (group, control, joint, size), position in zip(fields["controls"], positions):
+            matrix = get_defaultMatrix(position)
+            grp = create_group(name=group, matrix=matrix, parent=fields["parent"])
+            ctl = create_ctl(parent=grp, name=control, m=datatypes.Matrix(matrix),
+                             color=fields["color"], icon="null", w=size)
+            jnts.append(addJoint(parent=ctl, name=joint, m=datatypes.Matrix(matrix), vis=False))
+            created += [grp.name(), ctl.name(), jnts[-1].name()]
+        pm.skinCluster(jnts, curve, tsb=True, dr=2.0, n=fields["skin_cluster"])
+        return created
+    elif op == "controller":
+        if fields.get("parent") is None:
+            pm.controller(fields["node"])
+        else:
+            add_controller_tag(pm.PyNode(fields["node"]), getWalkTag(pm.PyNode(fields["parent"])))
+    elif op == "annotation":
+        annotation = pm.annotate(fields["node"], tx=fields["text"], p=fields["position"]).getParent()
+        annotation.rename(fields["name"])
+        annotation.getShape().displayArrow.set(0)
+        annotation.overrideEnabled.set(1)
+        annotation.overrideDisplayType.set(1)
+        pm.parent(annotation, fields["node"])
+        return [annotation.name()]
+    elif op == "plugin":
+        if not pm.pluginInfo(fields["path"], q=1, loaded=1):
+            pm.loadPlugin(fields["path"], quiet=True)
+    elif op == "expression":
+        pm.expression(s=fields["text"], ae=1, uc='all', o="", n=fields["name"])
+    elif op == "graph":
+        # numpy is only needed by the network backend
+        from ..engine.graph import Graph
+        return apply_graph(Graph.from_dict(fields["data"]))
+    elif op == "sets":
+        _apply_sets(fields["name"], fields["members"], fields["mode"], fields.get("parent"))
+    else:
+        raise ValueError("unknown plan step {}".format(op))
+    return []
+
+
+@shape_session
+def apply_plan(plan):
+    """Build a setup plan in the scene one step after the other
+
+    The setups are built by sine_tool.scene.batch.apply_plan_batched(), this is the
+    sequential reference build it is checked against by
+    sine_tool.scene.cmds_helper.compare_appliers().
+
+    Arguments:
+        plan (BuildPlan): steps computed by sine_tool.engine.plan.plan_setup()
+
+    Returns:
+        list of str: the created nodes
+    """
+    created = []
+    for op, fields in plan.steps:
+        created += apply_step(op, fields)
+    return created